@@ -0,0 +1,15 @@
+from .tenant import CurrentTenant
+
+
+class CurrentTenantMiddleware:
+    """
+    Anexa request.tenant (ver accounts/tenant.py). As memberships só são
+    consultadas no primeiro uso, uma única vez por requisição.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant = CurrentTenant(request.user, getattr(request, 'session', None))
+        return self.get_response(request)
@@ -0,0 +1,87 @@
+"""
+Conta atual ("tenant") de uma requisição.
+
+As memberships ativas do usuário são carregadas uma única vez por requisição
+(com a conta via select_related) e compartilhadas por decorators, mixins,
+context processors e views, que antes consultavam AccountMembership
+repetidamente para a mesma página.
+
+O CurrentTenantMiddleware anexa a instância em request.tenant; use
+get_current_tenant(request) para obtê-la (também funciona sem o middleware e
+com requests do DRF, cujo usuário pode vir de JWT).
+"""
+from django.utils.functional import cached_property
+
+
+MANAGER_ROLES = ('owner', 'admin')
+SESSION_ACCOUNT_KEY = 'current_account_id'
+
+
+class CurrentTenant:
+    """Memberships ativas do usuário e a conta atual da requisição."""
+
+    def __init__(self, user, session=None):
+        self.user = user
+        self.session = session
+
+    @cached_property
+    def memberships(self):
+        """Memberships ativas do usuário (mais recentes primeiro), em uma consulta"""
+        if not getattr(self.user, 'is_authenticated', False):
+            return []
+        from .models import AccountMembership
+        return list(
+            AccountMembership.objects.filter(user=self.user, status='active').select_related('account')
+        )
+
+    @cached_property
+    def _memberships_by_account(self):
+        return {str(membership.account_id): membership for membership in self.memberships}
+
+    def get_membership(self, account):
+        """Membership ativa na conta (instância ou ID) ou None"""
+        if account is None:
+            return None
+        account_id = getattr(account, 'pk', account)
+        return self._memberships_by_account.get(str(account_id))
+
+    def is_member(self, account):
+        return self.get_membership(account) is not None
+
+    def has_role(self, account, roles=MANAGER_ROLES):
+        membership = self.get_membership(account)
+        return membership is not None and membership.role in roles
+
+    @cached_property
+    def membership(self):
+        """Membership da conta atual: a da sessão ou, na falta dela, a mais recente"""
+        account_id = self.session.get(SESSION_ACCOUNT_KEY) if self.session is not None else None
+        membership = self.get_membership(account_id)
+        if membership is None and self.memberships:
+            membership = self.memberships[0]
+        return membership
+
+    @property
+    def account(self):
+        return self.membership.account if self.membership else None
+
+    @property
+    def can_manage_account(self):
+        return self.membership is not None and self.membership.role in MANAGER_ROLES
+
+    def get_account(self, account_id=None):
+        """Conta informada (se o usuário for membro ativo) ou a conta atual"""
+        if account_id:
+            membership = self.get_membership(account_id)
+            return membership.account if membership else None
+        return self.account
+
+
+def get_current_tenant(request):
+    """Retorna o CurrentTenant da requisição, criando-o se necessário"""
+    user = getattr(request, 'user', None)
+    tenant = getattr(request, 'tenant', None)
+    if tenant is None or getattr(tenant.user, 'pk', None) != getattr(user, 'pk', None):
+        tenant = CurrentTenant(user, getattr(request, 'session', None))
+        request.tenant = tenant
+    return tenant
@@ -1,3 +1,63 @@
-from django.test import TestCase
+import uuid
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase
+
+from app_project.context_processors import user_context
+from permissions.decorators import account_member_required
+from .middleware import CurrentTenantMiddleware
+from .models import Account, AccountMembership
+from .tenant import get_current_tenant
+
+
+class CurrentTenantTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.user = User.objects.create_user(email='member@test.com', password='test123', username='member')
+		self.owner = User.objects.create_user(email='owner@test.com', password='test123', username='owner')
+		self.first = Account.objects.create(name='Primeira', slug='primeira', owner=self.owner)
+		self.second = Account.objects.create(name='Segunda', slug='segunda', owner=self.owner)
+		self.other = Account.objects.create(name='Outra', slug='outra', owner=self.owner)
+		AccountMembership.objects.create(account=self.first, user=self.user, role='member', status='active')
+		AccountMembership.objects.create(account=self.second, user=self.user, role='admin', status='active')
+		AccountMembership.objects.create(account=self.other, user=self.user, role='admin', status='pending')
+
+	def get_request(self, path='/user-panel/', **session):
+		request = RequestFactory().get(path)
+		request.user = self.user
+		request.session = SessionStore()
+		request.session.update(session)
+		CurrentTenantMiddleware(lambda r: HttpResponse())(request)
+		return request
+
+	def test_memberships_loaded_once_per_request(self):
+		request = self.get_request(current_account_id=str(self.first.pk))
+		with self.assertNumQueries(1):
+			tenant = get_current_tenant(request)
+			self.assertEqual(tenant.account, self.first)
+			self.assertFalse(tenant.can_manage_account)
+			self.assertTrue(tenant.has_role(self.second))
+			self.assertFalse(tenant.is_member(self.other))
+			context = user_context(request)
+		self.assertEqual(context['current_account'], self.first)
+
+	def test_defaults_to_latest_membership(self):
+		tenant = get_current_tenant(self.get_request())
+		self.assertEqual(tenant.account, self.second)
+		self.assertTrue(tenant.can_manage_account)
+
+	def test_account_member_required(self):
+		view = account_member_required(lambda request, **kwargs: HttpResponse('ok'))
+		request = self.get_request()
+		self.assertEqual(view(request, account_id=self.first.pk).status_code, 200)
+		self.assertEqual(request.current_account, self.first)
+		# Membership pendente não dá acesso; conta inexistente continua 404
+		with self.assertRaises(PermissionDenied):
+			view(self.get_request(), account_id=self.other.pk)
+		with self.assertRaises(Http404):
+			view(self.get_request(), account_id=uuid.uuid4())
+		with self.assertRaises(Http404):
+			view(self.get_request(), account_id='not-a-uuid')
@@ -1,7 +1,6 @@
 from rest_framework import permissions
 from rest_framework.exceptions import PermissionDenied
 from permissions.decorators import user_has_permission, user_has_role
-from permissions.models import Permission
 from accounts.models import Account
 
 
@@ -91,14 +90,7 @@ class HasPermission(permissions.BasePermission):
         account = self.get_account_from_request(request, view)
         
         # Verificar permissão
-        try:
-            permission = Permission.objects.get(
-                codename=self.permission_codename, 
-                is_active=True
-            )
-            return user_has_permission(request.user, permission, account)
-        except Permission.DoesNotExist:
-            return False
+        return user_has_permission(request.user, self.permission_codename, account)
     
     def get_account_from_request(self, request, view):
         """
@@ -242,14 +234,7 @@ class ContentPermission(permissions.BasePermission):
         account = self.get_account_from_request(request, view)
         
         # Verificar permissão
-        try:
-            permission = Permission.objects.get(
-                codename=permission_codename, 
-                is_active=True
-            )
-            return user_has_permission(request.user, permission, account)
-        except Permission.DoesNotExist:
-            return False
+        return user_has_permission(request.user, permission_codename, account)
     
     def has_object_permission(self, request, view, obj):
         """
@@ -276,18 +261,11 @@ class ContentPermission(permissions.BasePermission):
                 return True
             
             # Verificar permissão de gerenciar
-            try:
-                permission = Permission.objects.get(
-                    codename='manage_content', 
-                    is_active=True
-                )
-                return user_has_permission(
-                    request.user, 
-                    permission, 
-                    getattr(obj, 'account', None)
-                )
-            except Permission.DoesNotExist:
-                return False
+            return user_has_permission(
+                request.user, 
+                'manage_content', 
+                getattr(obj, 'account', None)
+            )
         
         return True
     
@@ -338,14 +316,7 @@ class DomainPermission(permissions.BasePermission):
         account = self.get_account_from_request(request, view)
         
         # Verificar permissão
-        try:
-            permission = Permission.objects.get(
-                codename=permission_codename, 
-                is_active=True
-            )
-            return user_has_permission(request.user, permission, account)
-        except Permission.DoesNotExist:
-            return False
+        return user_has_permission(request.user, permission_codename, account)
     
     def has_object_permission(self, request, view, obj):
         """
@@ -71,6 +71,9 @@ urlpatterns = [
 
     # Aggregated site detail (JWT + domain param)
     path('site/full/', views.SiteDetailAPIView.as_view(), name='site_full_detail'),
+    path('site/blog/', views.SiteBlogPostListAPIView.as_view(), name='site_blog_posts'),
+    path('site/blog/<uuid:post_id>/', views.SiteBlogPostDetailAPIView.as_view(), name='site_blog_post_detail'),
+    path('accounts/<uuid:account_id>/sites/export/', views.AccountSitePayloadExportAPIView.as_view(), name='account_sites_export'),
     # Blog helpers
     # Sugestões de tags do blog (rota distinta para não conflitar com router 'tags')
     path('blog-tags/', views.BlogTagsSuggestionAPIView.as_view(), name='blog_tags_suggestions'),
@@ -9,7 +9,7 @@ from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.core.mail import send_mail
@@ -22,14 +22,16 @@ from rest_framework.views import APIView
 from django.db import models
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
 
 import json
 import stripe
 import logging
 from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
 
 # Import permission utilities
 from permissions.decorators import user_has_permission, user_has_role
@@ -40,9 +42,11 @@ from .permissions import (
 
 # Import models
 from accounts.models import Account, AccountMembership
+from accounts.tenant import get_current_tenant
 from users.models import User
 from permissions.models import Permission, Role, UserRole, UserPermission
 from payments.models import Plan, Subscription, Payment, Invoice
+from payments.services import RevenueRollupService
 from content.models import Category, Tag, Content, ContentAttachment
 from domains.models import Domain, DomainConfiguration, DomainVerificationLog
 
@@ -62,8 +66,11 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView, TokenRefreshView, TokenVerifyView
 )
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.core.cache import cache
+from app_project.cache import hot_cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from site_management.models import Site, SiteBio, SiteCategory, Service, SocialNetwork, CTA, BlogPost, Banner, SiteAPIKey
+from site_management.services import SitePayloadService, SiteAPIKeyService
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -700,16 +707,17 @@ class DashboardAnalyticsAPIView(APIView):
                 status='active'
             ).first()
             
-            monthly_revenue = Payment.objects.filter(
-                subscription__account=account,
-                created_at__gte=timezone.now() - timedelta(days=30),
-                status='completed'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            # Consolidados diários (RevenueRollup): custo constante,
+            # independente do histórico de pagamentos
+            revenue = RevenueRollupService.get_summary(account=account, days=30)
             
             return Response({
                 'total_users': total_users,
                 'subscription': SubscriptionSerializer(active_subscription).data if active_subscription else None,
-                'monthly_revenue': monthly_revenue,
+                'monthly_revenue': revenue['revenue'],
+                'mrr': revenue['mrr'],
+                'churned_mrr': revenue['churned_mrr'],
+                'churned_subscriptions': revenue['churned_subscriptions'],
                 'account': AccountSerializer(account).data
             })
             
@@ -1028,36 +1036,23 @@ class JWTTokenVerifyView(TokenVerifyView):
 # -------------------------------------------------------------
 # Public Site Aggregated Endpoint with caching
 # -------------------------------------------------------------
-class SiteDetailAPIView(APIView):
-    """Retorna todas as informações públicas do site de forma agregada.
-
-    Cache:
-        - Usa chave baseada em site pk e timestamp de última atualização agregada.
-        - TTL padrão 300s (5 min) – pode ser ajustado via ?ttl= param (máx 1800).
+class SitePublicAPIView(APIView):
+    """Base dos endpoints públicos do site autenticados por X-API-Key.
+
+    Cuida da autenticação pela chave do site, das validações de domínio e
+    status e dos cabeçalhos HTTP de cache:
+        - ETag forte derivado das versões de conteúdo usadas na resposta e
+          Last-Modified com o instante da última alteração do site.
+        - If-None-Match / If-Modified-Since respondem 304 sem ler os dados.
+        - ?ttl= (padrão 300s, máx 1800) define o max-age do Cache-Control.
     """
     # Autenticação via header X-API-Key obrigatória (API Key do site)
     permission_classes = [AllowAny]
 
     CACHE_TTL_DEFAULT = 300
     CACHE_TTL_MAX = 1800
-
-    def get_cache_key(self, site: Site):
-        # Considerar updated_at do site e dos relacionamentos principais
-        timestamps = [site.updated_at]
-        related_models = [
-            site.bio.updated_at if hasattr(site, 'bio') and site.bio else None,
-            site.categories.order_by('-updated_at').first().updated_at if site.categories.exists() else None,
-            site.services.order_by('-updated_at').first().updated_at if site.services.exists() else None,
-            site.social_networks.order_by('-updated_at').first().updated_at if site.social_networks.exists() else None,
-            site.ctas.order_by('-updated_at').first().updated_at if site.ctas.exists() else None,
-            site.blog_posts.order_by('-updated_at').first().updated_at if site.blog_posts.exists() else None,
-            site.banners.order_by('-updated_at').first().updated_at if site.banners.exists() else None,
-        ]
-        for ts in related_models:
-            if ts:
-                timestamps.append(ts)
-        last_ts = max(timestamps) if timestamps else site.updated_at
-        return f"site_full:{site.pk}:{int(last_ts.timestamp())}"
+    STALE_WHILE_REVALIDATE = 86400
+    STALE_IF_ERROR = 86400
 
     def _authenticate(self, request):
         api_key_value = request.headers.get('X-API-Key') or request.META.get('HTTP_X_API_KEY')
@@ -1067,129 +1062,283 @@ class SiteDetailAPIView(APIView):
         parts = api_key_value.split('.')
         if len(parts) < 2:
             return None, Response({'detail': 'Formato de chave inválido'}, status=401)
-        prefix = parts[0]
-        # Buscar por prefix
-        candidates = SiteAPIKey.objects.filter(key_prefix=prefix, is_active=True).select_related('site')
-        for candidate in candidates:
-            if candidate.verify(api_key_value):
-                candidate.mark_used()
-                return candidate.site, None
-        return None, Response({'detail': 'Chave inválida ou inativa'}, status=401)
-
-    def get(self, request, *args, **kwargs):
-        site, error = self._authenticate(request)
+        # Verificação em cache (memória do processo + cache compartilhado)
+        entry = SiteAPIKeyService.authenticate(api_key_value)
+        if entry is None:
+            return None, Response({'detail': 'Chave inválida ou inativa'}, status=401)
+        SiteAPIKeyService.touch(entry['key_id'])
+        return entry, None
+
+    def get_site(self, request):
+        """Autentica a chave e valida domínio/status; retorna (entrada da chave, erro)
+
+        A entrada vem de SiteAPIKeyService.authenticate(): site_id, is_active e
+        os campos públicos do site em 'site', sem consultar o banco.
+        """
+        entry, error = self._authenticate(request)
         if error:
-            return error
+            return None, error
         # Filtro opcional por domínio para validar correspondência (hard match se enviado)
         domain = request.query_params.get('domain')
-        if domain and domain not in site.domain:
-            return Response({'detail': 'Domain não corresponde à chave'}, status=403)
-        if site.status != 'active':
-            return Response({'detail': 'Site inativo'}, status=403)
+        if domain and domain not in entry['site']['domain']:
+            return None, Response({'detail': 'Domain não corresponde à chave'}, status=403)
+        if not entry['is_active']:
+            return None, Response({'detail': 'Site inativo'}, status=403)
+        return entry, None
 
+    def get_ttl(self, request):
         ttl_param = request.query_params.get('ttl')
         try:
             ttl = int(ttl_param) if ttl_param else self.CACHE_TTL_DEFAULT
         except ValueError:
             ttl = self.CACHE_TTL_DEFAULT
-        ttl = max(30, min(ttl, self.CACHE_TTL_MAX))
-
-        cache_key = self.get_cache_key(site)
-        cached = cache.get(cache_key)
-        if cached:
-            cached['cache'] = {'hit': True, 'ttl': ttl, 'key': cache_key}
-            return Response(cached)
-
-        # Montagem manual mínima (apenas o necessário conforme requisito)
-        def serialize_cat(c: SiteCategory):
-            return {
-                'id': c.id,
-                'name': c.name,
-                'icon': c.icon,
-                'image': c.image.url if c.image else None,
-                'order': c.order,
-                'is_active': c.is_active,
-            }
-        def serialize_service(s: Service):
-            return {
-                'id': s.id,
-                'category_id': s.category_id,
-                'title': s.title,
-                'description': s.description,
-                'image': s.image.url if s.image else None,
-                'value': str(s.value) if s.value is not None else None,
-                'discount': str(s.discount),
-                'final_value': str(s.final_value) if s.final_value is not None else None,
-                'order': s.order,
-                'is_active': s.is_active,
-            }
-        def serialize_social(sn: SocialNetwork):
-            return {
-                'id': sn.id,
-                'network_type': sn.network_type,
-                'url': sn.url,
-                'icon_style': sn.icon_style,
-            }
-        def serialize_cta(c: CTA):
-            return {
-                'id': c.id,
-                'title': c.title,
-                'description': c.description,
-                'action_type': c.action_type,
-                'button_text': c.button_text,
-                'image': c.image.url if c.image else None,
-                'order': c.order,
-            }
-        def serialize_post(p: BlogPost):
-            return {
-                'id': p.id,
-                'title': p.title,
-                'image': p.image.url if p.image else None,
-                'video_url': p.video_url,
-                'content': p.content,
-                'link': p.link,
-                'category_id': p.category_id,
-                'tags': p.tags,
-                'is_published': p.is_published,
-                'published_at': p.published_at.isoformat() if p.published_at else None,
-            }
-        def serialize_banner(b: Banner):
-            return {
-                'id': b.id,
-                'image': b.image.url if b.image else None,
-                'link': b.link,
-                'description': b.description,
-                'order': b.order,
-            }
+        return max(30, min(ttl, self.CACHE_TTL_MAX))
+
+    def patch_http_cache_headers(self, response, etag, changed, ttl):
+        response['ETag'] = quote_etag(etag)
+        response['Last-Modified'] = http_date(changed)
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=ttl,
+            stale_while_revalidate=self.STALE_WHILE_REVALIDATE,
+            stale_if_error=self.STALE_IF_ERROR,
+        )
+        # A resposta depende da chave: caches compartilhados não podem
+        # reaproveitá-la entre clientes diferentes.
+        patch_vary_headers(response, ['X-API-Key'])
+        return response
+
+    def get_not_modified_response(self, request, site_id, sections, etag_extra, ttl):
+        """Retorna 304 se a requisição condicional ainda é válida, senão None"""
+        if 'HTTP_IF_NONE_MATCH' not in request.META and 'HTTP_IF_MODIFIED_SINCE' not in request.META:
+            return None
+        versions, changed = SitePayloadService.get_state(site_id, sections)
+        etag = self.get_etag(site_id, versions, etag_extra)
+        headers = self.patch_http_cache_headers(HttpResponse(), etag, changed, ttl)
+        conditional = get_conditional_response(
+            request,
+            etag=headers['ETag'],
+            last_modified=changed,
+            response=headers,
+        )
+        return None if conditional is headers else conditional
 
-        bio = site.bio if hasattr(site, 'bio') else None
-        payload = {
-            'id': site.id,
-            'domain': site.domain,
-            'status': site.status,
-            'created_at': site.created_at.isoformat(),
-            'updated_at': site.updated_at.isoformat(),
-            'bio': {
-                'title': bio.title,
-                'description': bio.description,
-                'logo': bio.logo.url if bio and bio.logo else None,
-                'favicon': bio.favicon.url if bio and bio.favicon else None,
-                'email': bio.email,
-                'whatsapp': bio.whatsapp,
-                'phone': bio.phone,
-                'address': bio.address,
-                'google_maps': bio.google_maps,
-            } if bio else None,
-            'categories': [serialize_cat(c) for c in site.categories.all()],
-            'services': [serialize_service(s) for s in site.services.all()],
-            'social_networks': [serialize_social(sn) for sn in site.social_networks.filter(is_active=True)],
-            'ctas': [serialize_cta(c) for c in site.ctas.filter(is_active=True)],
-            'blog_posts': [serialize_post(p) for p in site.blog_posts.filter(is_published=True)],
-            'banners': [serialize_banner(b) for b in site.banners.filter(is_active=True)],
+    def get_etag(self, site_id, versions, etag_extra=()):
+        return f"site_full:{site_id}:{SitePayloadService.get_digest(versions, *etag_extra)}"
+
+    @staticmethod
+    def parse_list_param(value):
+        return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class SiteDetailAPIView(SitePublicAPIView):
+    """Retorna todas as informações públicas do site de forma agregada.
+
+    Parâmetros:
+        - ?sections=bio,services limita as seções retornadas (padrão: todas).
+        - ?fields=domain,services.title,blog_posts.title limita os campos.
+
+    Cache:
+        - Cada seção é guardada por SitePayloadService com sua própria versão
+          (incrementada por signals a cada alteração), então editar um post
+          não invalida as demais seções; um acerto custa uma única leitura
+          do cache.
+        - Alterações disparam a remontagem das seções em background.
+        - X-Cache indica HIT/MISS das seções no cache da aplicação.
+
+    Para sites com muitos posts, prefira /api/site/blog/ (paginado, só resumo).
+    """
+
+    def get_sections(self, request):
+        requested = self.parse_list_param(request.query_params.get('sections'))
+        if not requested:
+            return SitePayloadService.SECTIONS, None
+        invalid = [s for s in requested if s not in SitePayloadService.SECTIONS]
+        if invalid:
+            return None, Response(
+                {'detail': f"Seções inválidas: {', '.join(invalid)}",
+                 'available_sections': list(SitePayloadService.SECTIONS)},
+                status=400
+            )
+        return tuple(s for s in SitePayloadService.SECTIONS if s in requested), None
+
+    def get(self, request, *args, **kwargs):
+        entry, error = self.get_site(request)
+        if error:
+            return error
+        site_id = entry['site_id']
+        sections, error = self.get_sections(request)
+        if error:
+            return error
+        fields = self.parse_list_param(request.query_params.get('fields'))
+        ttl = self.get_ttl(request)
+        etag_extra = (','.join(sections), ','.join(sorted(fields)), ttl)
+
+        # Requisição condicional: bastam as versões para responder 304
+        not_modified = self.get_not_modified_response(request, site_id, sections, etag_extra, ttl)
+        if not_modified is not None:
+            return not_modified
+
+        versions, changed, data, hit = SitePayloadService.get_sections(site_id, sections)
+        etag = self.get_etag(site_id, versions, etag_extra)
+        payload = dict(entry['site'])
+        payload.update(data)
+        payload = SitePayloadService.select_fields(payload, fields)
+        payload['cache'] = {'ttl': ttl, 'key': etag, 'version': versions}
+        response = Response(payload)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return self.patch_http_cache_headers(response, etag, changed, ttl)
+
+
+class SiteBlogPostCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    # id desempata posts com a mesma data (published_at nulo é filtrado na view)
+    ordering = ('-published_at', '-created_at', '-id')
+
+    def get_cursor_tokens(self):
+        """Tokens dos cursores vizinhos, sem host/esquema, para guardar no cache."""
+        tokens = {}
+        for name, link in (('next', self.get_next_link()), ('previous', self.get_previous_link())):
+            query = parse_qs(urlsplit(link).query) if link else {}
+            tokens[name] = query.get(self.cursor_query_param, [None])[0]
+        return tokens
+
+    def get_links(self, request, tokens):
+        """Monta os links next/previous a partir dos tokens para a requisição atual."""
+        url = request.build_absolute_uri()
+        return {
+            name: replace_query_param(url, self.cursor_query_param, token) if token else None
+            for name, token in tokens.items()
         }
-        payload['cache'] = {'hit': False, 'ttl': ttl, 'key': cache_key}
-        cache.set(cache_key, payload, ttl)
-        return Response(payload)
+
+
+class SiteBlogPostListAPIView(SitePublicAPIView):
+    """Lista paginada (cursor) dos posts publicados do site, apenas com resumo.
+
+    Cada página é guardada no cache sob a versão da seção blog_posts; só os
+    resultados e os tokens de cursor são guardados, os links next/previous
+    são montados com o host e o esquema de cada requisição.
+    """
+    pagination_class = SiteBlogPostCursorPagination
+
+    def get(self, request, *args, **kwargs):
+        entry, error = self.get_site(request)
+        if error:
+            return error
+        site_id = entry['site_id']
+        ttl = self.get_ttl(request)
+        paginator = self.pagination_class()
+        cursor = request.query_params.get(paginator.cursor_query_param, '')
+        page_size = paginator.get_page_size(request)
+        etag_extra = ('blog_list', cursor, page_size, ttl)
+
+        not_modified = self.get_not_modified_response(request, site_id, ('blog_posts',), etag_extra, ttl)
+        if not_modified is not None:
+            return not_modified
+
+        versions, changed = SitePayloadService.get_state(site_id, ('blog_posts',))
+        etag = self.get_etag(site_id, versions, etag_extra)
+        cache_key = f"site_payload:blog_page:{etag}"
+        data = hot_cache.get(cache_key)
+        hit = data is not None
+        if not hit:
+            queryset = BlogPost.objects.filter(site_id=site_id, is_published=True, published_at__isnull=False)
+            posts = paginator.paginate_queryset(queryset, request, view=self)
+            data = {
+                'cursors': paginator.get_cursor_tokens(),
+                'results': [SitePayloadService.serialize_blog_post_summary(p) for p in posts],
+            }
+            hot_cache.set(cache_key, data, SitePayloadService.PAYLOAD_TIMEOUT)
+
+        links = paginator.get_links(request, data['cursors'])
+        response = Response({**links, 'results': data['results']})
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return self.patch_http_cache_headers(response, etag, changed, ttl)
+
+
+class SiteBlogPostDetailAPIView(SitePublicAPIView):
+    """Retorna um post publicado do site com o corpo completo."""
+
+    def get(self, request, post_id, *args, **kwargs):
+        entry, error = self.get_site(request)
+        if error:
+            return error
+        site_id = entry['site_id']
+        ttl = self.get_ttl(request)
+        etag_extra = ('blog_post', post_id, ttl)
+
+        not_modified = self.get_not_modified_response(request, site_id, ('blog_posts',), etag_extra, ttl)
+        if not_modified is not None:
+            return not_modified
+
+        versions, changed = SitePayloadService.get_state(site_id, ('blog_posts',))
+        etag = self.get_etag(site_id, versions, etag_extra)
+        cache_key = f"site_payload:blog_post:{etag}"
+        data = hot_cache.get(cache_key)
+        hit = data is not None
+        if not hit:
+            post = BlogPost.objects.filter(site_id=site_id, is_published=True, pk=post_id).first()
+            if post is None:
+                return Response({'detail': 'Post não encontrado'}, status=404)
+            data = SitePayloadService.serialize_blog_post(post)
+            hot_cache.set(cache_key, data, SitePayloadService.PAYLOAD_TIMEOUT)
+
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return self.patch_http_cache_headers(response, etag, changed, ttl)
+
+
+class AccountSitePayloadExportAPIView(APIView):
+    """Exporta em NDJSON o payload público de todos os sites de uma conta.
+
+    Pensado para builds estáticos de vários sites (ex.: Astro em um único CI):
+    uma requisição autenticada substitui uma chamada a /api/site/full/ por
+    site. Cada linha tem o mesmo formato de /api/site/full/ (sem o bloco
+    'cache'); ?sections= e ?status= limitam seções e sites.
+
+    Restrito a owner/admin da conta (ou superusuário), como as views de
+    gerenciamento de sites.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, account_id):
+        tenant = get_current_tenant(request)
+        if request.user.is_superuser:
+            account = Account.objects.filter(id=account_id).first()
+        else:
+            account = tenant.get_account(account_id)
+        if account is None:
+            return Response({
+                'error': 'Conta não encontrada ou sem acesso'
+            }, status=status.HTTP_404_NOT_FOUND)
+        if not request.user.is_superuser and not tenant.has_role(account):
+            return Response({
+                'error': 'Apenas owner ou admin da conta podem exportar os sites'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        sections = [s.strip() for s in request.query_params.get('sections', '').split(',') if s.strip()]
+        invalid = [s for s in sections if s not in SitePayloadService.SECTIONS]
+        if invalid:
+            return Response({
+                'error': f"Seções inválidas: {', '.join(invalid)}",
+                'available_sections': list(SitePayloadService.SECTIONS)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        sections = tuple(s for s in SitePayloadService.SECTIONS if not sections or s in sections)
+
+        sites = Site.objects.filter(account=account)
+        site_status = request.query_params.get('status')
+        if site_status:
+            sites = sites.filter(status=site_status)
+
+        response = StreamingHttpResponse(
+            SitePayloadService.iter_ndjson(SitePayloadService.iter_payloads(sites, sections)),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="sites-{account.pk}.ndjson"'
+        return response
 
 
 class BlogInlineCategoryCreateAPIView(APIView):
@@ -0,0 +1,73 @@
+"""
+Acesso ao cache de dados "quentes" (snapshots de permissões, payloads e
+chaves de API dos sites).
+
+Esses dados usam o alias 'hot' quando ele existe em CACHES (ver o perfil de
+cache em settings.py), permitindo uma instância/política de expiração
+separada do cache padrão e das sessões. Sem o alias, usa o cache 'default'.
+
+Falhas de conexão com o Redis não derrubam a requisição: leituras viram
+cache miss (os dados são recalculados) e escritas são ignoradas. Como o
+alias guarda as chaves de versão usadas na invalidação, incr/delete que
+falham são registrados como erro (invalidação perdida).
+"""
+import functools
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from redis.exceptions import TimeoutError as RedisTimeoutError
+except ImportError:  # redis é opcional (perfis database/locmem)
+    RedisConnectionError = RedisTimeoutError = ConnectionError
+
+logger = logging.getLogger(__name__)
+
+HOT_CACHE_ALIAS = 'hot'
+
+CACHE_ERRORS = (RedisConnectionError, RedisTimeoutError, ConnectionError, TimeoutError)
+
+
+class HotCacheProxy:
+    """Proxy que resolve o alias a cada uso (compatível com override_settings)."""
+
+    # Operações que invalidam dados: a falha é registrada como erro
+    INVALIDATING = ('incr', 'decr', 'delete', 'delete_many', 'clear')
+    # Retorno de cada operação quando o cache está indisponível
+    FALLBACKS = {
+        'get_many': dict,
+        'add': lambda: False,
+        'set': lambda: None,
+        'set_many': list,
+        'incr': lambda: None,
+        'decr': lambda: None,
+        'delete': lambda: False,
+        'delete_many': lambda: None,
+        'clear': lambda: None,
+    }
+
+    def __getattr__(self, name):
+        alias = HOT_CACHE_ALIAS if HOT_CACHE_ALIAS in settings.CACHES else 'default'
+        attr = getattr(caches[alias], name)
+        if name != 'get' and name not in self.FALLBACKS:
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            except CACHE_ERRORS as exc:
+                if name in self.INVALIDATING:
+                    logger.error(f'Hot cache unavailable, invalidation lost ({name} {args[:1]}): {exc}')
+                else:
+                    logger.warning(f'Hot cache unavailable ({name}): {exc}')
+                if name == 'get':
+                    return kwargs.get('default', args[1] if len(args) > 1 else None)
+                return self.FALLBACKS[name]()
+
+        return call
+
+
+hot_cache = HotCacheProxy()
@@ -1,18 +1,15 @@
-from settings.models import GlobalSetting
-from accounts.models import AccountMembership
+from settings.cache import get_global_setting
+from accounts.tenant import get_current_tenant
 
 def appearance_settings(request):
     """
     Context processor para carregar configurações de aparência globalmente
     """
     try:
-        # Buscar configurações de aparência
-        primary_color = GlobalSetting.objects.filter(key='primary_color').first()
-        secondary_color = GlobalSetting.objects.filter(key='secondary_color').first()
-        
+        # Configurações de aparência (registro em memória, sem consultas ao banco)
         return {
-            'global_primary_color': primary_color.value if primary_color else '#3B82F6',
-            'global_secondary_color': secondary_color.value if secondary_color else '#6B7280',
+            'global_primary_color': get_global_setting('primary_color', '#3B82F6'),
+            'global_secondary_color': get_global_setting('secondary_color', '#6B7280'),
         }
     except Exception:
         # Valores padrão em caso de erro
@@ -33,15 +30,10 @@ def user_context(request):
         current_account = None
         
         try:
-            # Buscar membership ativo do usuário
-            account_membership = AccountMembership.objects.filter(
-                user=request.user,
-                status='active'
-            ).select_related('account').first()
-            
-            if account_membership:
-                current_account = account_membership.account
-                can_manage_account = account_membership.role in ['owner', 'admin']
+            # Membership da conta atual (carregada uma vez por requisição)
+            tenant = get_current_tenant(request)
+            current_account = tenant.account
+            can_manage_account = tenant.can_manage_account
                 
         except Exception:
             pass
@@ -83,6 +83,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.CurrentTenantMiddleware',
     'app_project.middleware.AdminRedirectMiddleware',  # Redireciona staff para admin-panel
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -255,6 +256,91 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = config('CELERY_TIMEZONE', default='UTC')
 
+# Site payload (/api/site/full/) - remontagem em background via Celery
+SITE_PAYLOAD_PREBUILD = config('SITE_PAYLOAD_PREBUILD', default=not DEBUG, cast=bool)
+SITE_PAYLOAD_PREBUILD_DELAY = config('SITE_PAYLOAD_PREBUILD_DELAY', default=2, cast=int)
+
+# Uploads - thumbnails gerados pela task Celery (em DEBUG, na própria requisição)
+UPLOADS_THUMBNAILS_ASYNC = config('UPLOADS_THUMBNAILS_ASYNC', default=not DEBUG, cast=bool)
+# Uploads - metadados de imagem (dimensões, EXIF, cor dominante, BlurHash) pela task Celery
+UPLOADS_METADATA_ASYNC = config('UPLOADS_METADATA_ASYNC', default=not DEBUG, cast=bool)
+
+# Uploads - deduplicação do conteúdo: 'account' (por conta) ou 'global'
+UPLOADS_DEDUP_SCOPE = config('UPLOADS_DEDUP_SCOPE', default='account')
+
+# Uploads - entrega dos arquivos após a verificação de acesso:
+# 'django' (streaming com Range), 'nginx' (X-Accel-Redirect) ou 'sendfile' (X-Sendfile)
+UPLOADS_SERVE_MODE = config('UPLOADS_SERVE_MODE', default='django')
+# Location internal do nginx que aponta para MEDIA_ROOT
+UPLOADS_ACCEL_REDIRECT_PREFIX = config('UPLOADS_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
+# Uploads - variantes de imagem sob demanda (srcset dos sites)
+UPLOADS_IMAGE_MAX_DIMENSION = config('UPLOADS_IMAGE_MAX_DIMENSION', default=3000, cast=int)
+UPLOADS_IMAGE_VARIANTS_MAX = config('UPLOADS_IMAGE_VARIANTS_MAX', default=20000, cast=int)
+
+# Uploads - upload em partes (retomável): diretório temporário das partes,
+# tamanho máximo de cada parte e tempo (s) até uma sessão parada ser removida
+UPLOADS_CHUNK_DIR = config('UPLOADS_CHUNK_DIR', default=str(BASE_DIR / 'tmp' / 'upload_sessions'))
+UPLOADS_CHUNK_SIZE = config('UPLOADS_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOADS_SESSION_TTL = config('UPLOADS_SESSION_TTL', default=24 * 60 * 60, cast=int)
+
+# Chaves de API dos sites - cache da verificação e gravação em lote do last_used_at
+SITE_API_KEY_CACHE_SIZE = config('SITE_API_KEY_CACHE_SIZE', default=1024, cast=int)
+SITE_API_KEY_LOCAL_TTL = config('SITE_API_KEY_LOCAL_TTL', default=30, cast=int)
+SITE_API_KEY_CACHE_TIMEOUT = config('SITE_API_KEY_CACHE_TIMEOUT', default=300, cast=int)
+SITE_API_KEY_USAGE_INTERVAL = config('SITE_API_KEY_USAGE_INTERVAL', default=60, cast=int)
+CELERY_BEAT_SCHEDULE = {
+    'flush-site-api-key-usage': {
+        'task': 'site_management.tasks.flush_site_api_key_usage',
+        'schedule': SITE_API_KEY_USAGE_INTERVAL,
+    },
+    'cleanup-upload-sessions': {
+        'task': 'uploads.tasks.cleanup_upload_sessions',
+        'schedule': 60 * 60,
+    },
+    'reconcile-upload-quotas': {
+        'task': 'uploads.tasks.reconcile_upload_quotas',
+        'schedule': 24 * 60 * 60,
+    },
+    'render-invoices': {
+        'task': 'payments.tasks.render_invoices',
+        'schedule': 15 * 60,
+    },
+    'send-outbox-emails': {
+        'task': 'payments.tasks.send_outbox_emails',
+        'schedule': 60,
+    },
+    'process-webhook-events': {
+        'task': 'payments.tasks.process_webhook_events',
+        'schedule': 60,
+    },
+}
+
+# Configurações globais - intervalo (s) para conferir a versão do registro em memória
+GLOBAL_SETTINGS_CHECK_INTERVAL = config('GLOBAL_SETTINGS_CHECK_INTERVAL', default=5, cast=int)
+
+# Renovações de assinatura - tamanho do lote reivindicado e chamadas simultâneas ao gateway
+RENEWAL_BATCH_SIZE = config('RENEWAL_BATCH_SIZE', default=200, cast=int)
+RENEWAL_GATEWAY_CONCURRENCY = config('RENEWAL_GATEWAY_CONCURRENCY', default=8, cast=int)
+# Segundos até uma cobrança em 'processing' sem resposta do gateway ser retomada
+RENEWAL_RESUME_AFTER = config('RENEWAL_RESUME_AFTER', default=30 * 60, cast=int)
+
+# Faturas - renderização em lote (processos e faturas por lote)
+INVOICE_RENDER_WORKERS = config('INVOICE_RENDER_WORKERS', default=2, cast=int)
+INVOICE_RENDER_BATCH_SIZE = config('INVOICE_RENDER_BATCH_SIZE', default=500, cast=int)
+
+# Notificações de cobrança - fila de emails (EmailOutbox) enviada em lotes;
+# novas tentativas com backoff exponencial a partir de RETRY_DELAY segundos
+NOTIFICATIONS_ASYNC = config('NOTIFICATIONS_ASYNC', default=not DEBUG, cast=bool)
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+NOTIFICATION_OUTBOX_RETRY_DELAY = config('NOTIFICATION_OUTBOX_RETRY_DELAY', default=60, cast=int)
+
+# Webhooks do Stripe - eventos gravados em WebhookEvent e processados em lotes
+STRIPE_WEBHOOK_ASYNC = config('STRIPE_WEBHOOK_ASYNC', default=not DEBUG, cast=bool)
+STRIPE_WEBHOOK_BATCH_SIZE = config('STRIPE_WEBHOOK_BATCH_SIZE', default=100, cast=int)
+STRIPE_WEBHOOK_MAX_ATTEMPTS = config('STRIPE_WEBHOOK_MAX_ATTEMPTS', default=8, cast=int)
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='localhost')
@@ -416,17 +502,76 @@ LOGGING = {
     },
 }
 
-# Cache configuration - Usando database para desenvolvimento local
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'cache_table',
+# Cache configuration
+# CACHE_BACKEND: 'redis' (produção), 'database' (padrão, desenvolvimento local)
+# ou 'locmem' (usado pelos testes, ver settings_test.py).
+# - 'default': cache geral e sessões (cached_db com Redis)
+# - 'hot': snapshots de permissões, payloads e chaves de API dos sites
+#   (ver app_project/cache.py); pode apontar para outra instância Redis.
+CACHE_BACKEND = config('CACHE_BACKEND', default='database')
+CACHE_KEY_PREFIX = config('CACHE_KEY_PREFIX', default=config('ENVIRONMENT', default='dev'))
+REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_HOT_URL = config('REDIS_HOT_URL', default=REDIS_URL)
+
+if CACHE_BACKEND == 'redis':
+    REDIS_CACHE_OPTIONS = {
+        'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        'CONNECTION_POOL_KWARGS': {
+            'max_connections': config('REDIS_MAX_CONNECTIONS', default=50, cast=int),
+            'retry_on_timeout': True,
+        },
+        'SOCKET_CONNECT_TIMEOUT': config('REDIS_SOCKET_CONNECT_TIMEOUT', default=2, cast=float),
+        'SOCKET_TIMEOUT': config('REDIS_SOCKET_TIMEOUT', default=2, cast=float),
+        # Falhas do Redis viram cache miss em vez de erro 500 (só no 'default')
+        'IGNORE_EXCEPTIONS': True,
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': CACHE_KEY_PREFIX,
+            'OPTIONS': REDIS_CACHE_OPTIONS,
+        },
+        'hot': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_HOT_URL,
+            'KEY_PREFIX': f'{CACHE_KEY_PREFIX}:hot',
+            # Sem IGNORE_EXCEPTIONS: HotCacheProxy (app_project/cache.py) trata
+            # as falhas de conexão e registra as invalidações perdidas
+            'OPTIONS': {**REDIS_CACHE_OPTIONS, 'IGNORE_EXCEPTIONS': False},
+        },
+    }
+    DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'default',
+            'KEY_PREFIX': CACHE_KEY_PREFIX,
+        },
+        'hot': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'hot',
+            'KEY_PREFIX': CACHE_KEY_PREFIX,
+        },
+    }
+else:
+    # Usando database para desenvolvimento local (requer createcachetable)
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_table',
+            'KEY_PREFIX': CACHE_KEY_PREFIX,
+        }
     }
-}
 
-# Session configuration - Usando database para desenvolvimento local
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
-# SESSION_CACHE_ALIAS = 'default'  # Comentado para usar database
+# Session configuration - sessões no Redis com persistência no banco;
+# nos demais perfis, apenas no banco
+if CACHE_BACKEND == 'redis':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'default'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
 # Security settings for production
 if not DEBUG:
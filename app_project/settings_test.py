@@ -0,0 +1,11 @@
+"""
+Configurações dos testes
+
+Usado pelo pytest (pytest.ini) e por manage.py test --settings=app_project.settings_test.
+Os caches ficam em memória (locmem), sem depender de Redis ou da tabela de cache.
+"""
+import os
+
+os.environ['CACHE_BACKEND'] = 'locmem'
+
+from .settings import *  # noqa: E402,F401,F403
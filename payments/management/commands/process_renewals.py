@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from payments.services import BillingService
+from payments.services import BillingService, RenewalService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,6 +20,16 @@ class Command(BaseCommand):
             action='store_true',
             help='Show detailed output',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Subscriptions claimed per batch (default: RENEWAL_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Concurrent gateway calls (default: RENEWAL_GATEWAY_CONCURRENCY)',
+        )
     
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -39,14 +49,8 @@ class Command(BaseCommand):
         try:
             if dry_run:
                 # Simular o processo sem fazer alterações
-                from datetime import timedelta
-                from payments.models import Subscription
-                
-                tomorrow = timezone.now() + timedelta(days=1)
-                expiring_subscriptions = Subscription.objects.filter(
-                    current_period_end__date=tomorrow.date(),
-                    auto_renew=True,
-                    status__in=['active', 'trial']
+                expiring_subscriptions = BillingService.get_renewal_queryset().select_related(
+                    'account', 'plan'
                 )
                 
                 count = expiring_subscriptions.count()
@@ -61,14 +65,35 @@ class Command(BaseCommand):
                             f'(Plan: {subscription.plan.name})'
                         )
             else:
-                # Processar renovações reais
-                renewed_count = BillingService.process_renewals()
+                # Processar renovações reais em lotes
+                def progress(stats):
+                    if verbose:
+                        self.stdout.write(
+                            f"  batch {stats['batches']}: {stats['renewed']} renewed "
+                            f"({stats['rate']:.1f}/s)"
+                        )
+                
+                stats = RenewalService.run(
+                    batch_size=options['batch_size'],
+                    concurrency=options['concurrency'],
+                    progress=progress
+                )
                 
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f'Successfully processed {renewed_count} subscription renewals'
+                        f"Successfully processed {stats['renewed']} subscription renewals "
+                        f"in {stats['elapsed']:.1f}s ({stats['rate']:.1f}/s)"
                     )
                 )
+                self.stdout.write(
+                    f"Charged: {stats['charged']}, not submitted: {stats['not_submitted']}, "
+                    f"already charged: {stats['skipped']}, failed: {stats['failed']}, "
+                    f"resumed from earlier runs: {stats['resumed']}"
+                )
+                if stats['errors']:
+                    self.stdout.write(
+                        self.style.WARNING(f"{stats['errors']} subscriptions could not be renewed (see logs)")
+                    )
                 
         except Exception as e:
             logger.error(f'Error in renewal process: {str(e)}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from payments.services import RevenueRollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue/MRR/churn rollups from payments and subscriptions'
+    
+    def handle(self, *args, **options):
+        count = RevenueRollupService.rebuild()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {count} revenue rollup rows')
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from payments.services import InvoiceRenderService
+
+
+class Command(BaseCommand):
+    help = 'Render new or changed invoices to storage (HTML, and PDF when weasyprint is installed)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Rendering processes (default: INVOICE_RENDER_WORKERS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Invoices per batch (default: INVOICE_RENDER_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render every invoice, even when unchanged',
+        )
+    
+    def handle(self, *args, **options):
+        queryset = None
+        if options['force']:
+            from payments.models import Invoice
+            queryset = Invoice.objects.all()
+        
+        stats = InvoiceRenderService.render_pending(
+            queryset=queryset,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            force=options['force']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {stats['rendered']} invoices ({stats['unchanged']} unchanged) "
+                f"in {stats['elapsed']:.1f}s"
+            )
+        )
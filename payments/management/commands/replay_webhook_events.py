@@ -0,0 +1,76 @@
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from payments.services import StripeWebhookService
+
+
+class Command(BaseCommand):
+    help = 'Replay Stripe webhook events created in a date range (stored or from recorded payload files)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            required=True,
+            help='First day of the range (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--until',
+            help='Last day of the range, inclusive (YYYY-MM-DD, default: --since)',
+        )
+        parser.add_argument(
+            '--type',
+            dest='event_type',
+            help='Only replay events of this type (e.g. payment_intent.succeeded)',
+        )
+        parser.add_argument(
+            '--file',
+            action='append',
+            default=[],
+            help='JSON file with recorded events (a list, a Stripe list object or a single event); may be repeated',
+        )
+        parser.add_argument(
+            '--no-process',
+            action='store_true',
+            help='Only requeue the events; leave processing to the workers',
+        )
+    
+    def parse_day(self, value):
+        try:
+            return timezone.make_aware(datetime.combine(date.fromisoformat(value), time.min))
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
+    
+    def load_events(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        
+        if isinstance(data, dict):
+            data = data['data'] if data.get('object') == 'list' else [data]
+        return data
+    
+    def handle(self, *args, **options):
+        since = self.parse_day(options['since'])
+        until = self.parse_day(options['until'] or options['since']) + timedelta(days=1)
+        
+        events = []
+        for path in options['file']:
+            events.extend(self.load_events(path))
+        
+        queued = StripeWebhookService.replay(
+            since, until, event_type=options['event_type'], events=events
+        )
+        self.stdout.write(f'Requeued {queued} events')
+        
+        if not options['no_process']:
+            stats = StripeWebhookService.process_pending()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Processed {stats['processed']} events ({stats['ignored']} ignored, "
+                    f"{stats['pending']} to retry, {stats['failed']} failed)"
+                )
+            )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from payments.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending notification emails from the outbox'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Emails per SMTP connection (default: NOTIFICATION_OUTBOX_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many batches (default: drain the outbox)',
+        )
+    
+    def handle(self, *args, **options):
+        stats = NotificationService.drain_outbox(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {stats['sent']} emails ({stats['retried']} to retry, {stats['failed']} failed)"
+            )
+        )
@@ -66,9 +66,7 @@ class Command(BaseCommand):
                 if verbose:
                     for subscription in subscriptions_to_remind:
                         # Obter email do usuário principal
-                        primary_user = subscription.account.users.filter(
-                            memberships__role='owner'
-                        ).first()
+                        primary_user = subscription.account.owner
                         
                         email = primary_user.email if primary_user else 'No owner found'
                         
@@ -77,33 +75,12 @@ class Command(BaseCommand):
                             f'(Plan: {subscription.plan.name}, Email: {email})'
                         )
             else:
-                # Enviar lembretes reais
-                if days == 7:
-                    sent_count = BillingService.send_renewal_reminders()
-                else:
-                    # Implementar lógica personalizada para outros dias
-                    from datetime import timedelta
-                    from payments.models import Subscription
-                    from payments.services import NotificationService
-                    
-                    reminder_date = timezone.now() + timedelta(days=days)
-                    subscriptions_to_remind = Subscription.objects.filter(
-                        current_period_end__date=reminder_date.date(),
-                        auto_renew=True,
-                        status__in=['active', 'trial']
-                    )
-                    
-                    sent_count = 0
-                    for subscription in subscriptions_to_remind:
-                        try:
-                            NotificationService.send_renewal_reminder_email(subscription, days)
-                            sent_count += 1
-                        except Exception as e:
-                            logger.error(f'Error sending reminder for subscription {subscription.id}: {str(e)}')
+                # Enfileirar lembretes (enviados em lote pela fila de emails)
+                sent_count = BillingService.send_renewal_reminders(days)
                 
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f'Successfully sent {sent_count} renewal reminders'
+                        f'Successfully queued {sent_count} renewal reminders'
                     )
                 )
                 
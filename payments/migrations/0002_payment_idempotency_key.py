@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='Chave de Idempotência'),
+        ),
+    ]
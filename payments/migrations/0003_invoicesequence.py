@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('period', models.CharField(max_length=6, primary_key=True, serialize=False, verbose_name='Período')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Último Número')),
+            ],
+            options={
+                'verbose_name': 'Sequência de Faturas',
+                'verbose_name_plural': 'Sequências de Faturas',
+            },
+        ),
+    ]
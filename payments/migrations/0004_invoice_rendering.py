@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_invoicesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='html_file',
+            field=models.FileField(blank=True, max_length=255, upload_to='invoices/', verbose_name='Arquivo HTML'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='render_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash da Renderização'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='rendered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Renderizada em'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:57
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_invoice_rendering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('dedup_key', models.CharField(max_length=200, unique=True, verbose_name='Chave de Deduplicação')),
+                ('subject', models.CharField(max_length=255, verbose_name='Assunto')),
+                ('html_message', models.TextField(verbose_name='Mensagem HTML')),
+                ('from_email', models.CharField(max_length=255, verbose_name='Remetente')),
+                ('recipients', models.JSONField(default=list, verbose_name='Destinatários')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Falhou')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Email na Fila',
+                'verbose_name_plural': 'Emails na Fila',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='payments_em_status_2bbec4_idx')],
+            },
+        ),
+    ]
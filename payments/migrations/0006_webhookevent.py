@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:00
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID do Evento')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Tipo')),
+                ('ordering_key', models.CharField(max_length=255, verbose_name='Chave de Ordenação')),
+                ('payload', models.JSONField(verbose_name='Payload')),
+                ('event_created_at', models.DateTimeField(verbose_name='Criado no Stripe')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('processing', 'Processando'), ('processed', 'Processado'), ('ignored', 'Ignorado'), ('failed', 'Falhou')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processado em')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Recebido em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'ordering': ['event_created_at', 'received_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='payments_we_status_a02aee_idx'), models.Index(fields=['ordering_key', 'status'], name='payments_we_orderin_0d7beb_idx'), models.Index(fields=['event_created_at'], name='payments_we_event_c_b1afa6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('payments', '0006_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Dia')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Receita')),
+                ('refunds', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Reembolsos')),
+                ('paid_count', models.IntegerField(default=0, verbose_name='Pagamentos Recebidos')),
+                ('failed_count', models.IntegerField(default=0, verbose_name='Pagamentos com Falha')),
+                ('mrr', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='MRR')),
+                ('new_mrr', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='MRR Novo')),
+                ('churned_mrr', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='MRR Perdido')),
+                ('new_subscriptions', models.IntegerField(default=0, verbose_name='Novas Assinaturas')),
+                ('churned_subscriptions', models.IntegerField(default=0, verbose_name='Assinaturas Perdidas')),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='accounts.account', verbose_name='Conta')),
+                ('plan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='revenue_rollups', to='payments.plan', verbose_name='Plano')),
+            ],
+            options={
+                'verbose_name': 'Consolidado de Receita',
+                'verbose_name_plural': 'Consolidados de Receita',
+                'ordering': ['-day'],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('account__isnull', False), ('plan__isnull', True)), models.Q(('account__isnull', True), ('plan__isnull', False)), _connector='OR'), name='payments_rollup_single_scope'), models.UniqueConstraint(condition=models.Q(('account__isnull', False)), fields=('account', 'day'), name='payments_rollup_account_day'), models.UniqueConstraint(condition=models.Q(('plan__isnull', False)), fields=('plan', 'day'), name='payments_rollup_plan_day')],
+            },
+        ),
+    ]
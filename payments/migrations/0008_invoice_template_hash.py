@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_revenuerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='template_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash do Template'),
+        ),
+    ]
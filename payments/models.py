@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.core.validators import MinValueValidator
@@ -179,6 +179,32 @@ class Subscription(models.Model):
     def __str__(self):
         return f"{self.account.name} - {self.plan.name}"
     
+    REVENUE_FIELDS = ('status', 'plan_id', 'price_snapshot')
+    
+    def save(self, *args, **kwargs):
+        """Registra em RevenueRollup as transições de status, plano ou preço
+        
+        O estado anterior vem da própria linha, lida com lock dentro da
+        transação do save: cópias desatualizadas em memória (outra instância,
+        refresh_from_db) não geram transições em dobro.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'status', 'plan', 'plan_id', 'price_snapshot'} & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+        if self._state.adding and self.status not in RevenueRollup.MRR_STATUSES:
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
+            previous_state = None
+            if not self._state.adding:
+                previous_state = Subscription.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list(*self.REVENUE_FIELDS).first()
+            super().save(*args, **kwargs)
+            RevenueRollup.record_subscription(self, previous_state)
+    
     @property
     def is_active(self):
         return self.status == 'active'
@@ -300,6 +326,15 @@ class Payment(models.Model):
     invoice_url = models.URLField('URL da Fatura', blank=True)
     receipt_url = models.URLField('URL do Recibo', blank=True)
     
+    # Chave de idempotência (renovações: uma cobrança por assinatura e período)
+    idempotency_key = models.CharField(
+        'Chave de Idempotência',
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True
+    )
+    
     # Tentativas de cobrança
     attempt_count = models.PositiveIntegerField('Tentativas', default=0)
     max_attempts = models.PositiveIntegerField('Máximo de Tentativas', default=3)
@@ -324,6 +359,29 @@ class Payment(models.Model):
     def __str__(self):
         return f"Pagamento {self.amount} - {self.subscription.account.name}"
     
+    def save(self, *args, **kwargs):
+        """Registra em RevenueRollup as transições de status do pagamento
+        
+        O status anterior vem da própria linha, lida com lock dentro da
+        transação do save (ver Subscription.save).
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
+            super().save(*args, **kwargs)
+            return
+        if self._state.adding and self.status not in ('paid', 'failed', 'refunded'):
+            super().save(*args, **kwargs)
+            return
+        
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Payment.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values_list('status', 'attempt_count').first()
+            super().save(*args, **kwargs)
+            RevenueRollup.record_payment(self, *(previous or (None, 0)))
+    
     @property
     def is_paid(self):
         return self.status == 'paid'
@@ -415,6 +473,13 @@ class Invoice(models.Model):
     
     # Arquivos
     pdf_file = models.FileField('Arquivo PDF', upload_to='invoices/', blank=True)
+    html_file = models.FileField('Arquivo HTML', upload_to='invoices/', max_length=255, blank=True)
+    
+    # Renderização (ver InvoiceRenderService): impressão digital dos dados
+    # usados no último arquivo gerado e do template com que foi gerado
+    render_hash = models.CharField('Hash da Renderização', max_length=64, blank=True)
+    template_hash = models.CharField('Hash do Template', max_length=64, blank=True)
+    rendered_at = models.DateTimeField('Renderizada em', null=True, blank=True)
     
     created_at = models.DateTimeField('Criado em', auto_now_add=True)
     updated_at = models.DateTimeField('Atualizado em', auto_now=True)
@@ -436,11 +501,353 @@ class Invoice(models.Model):
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             # Gerar número da fatura automaticamente
-            from django.utils import timezone
-            now = timezone.now()
-            count = Invoice.objects.filter(
-                created_at__year=now.year,
-                created_at__month=now.month
-            ).count() + 1
-            self.invoice_number = f"{now.year}{now.month:02d}{count:04d}"
+            self.invoice_number = InvoiceSequence.allocate()[0]
         super().save(*args, **kwargs)
+
+
+class InvoiceSequence(models.Model):
+    """Contador de numeração das faturas por período (AAAAMM)
+    
+    Cada alocação é um UPDATE atômico no contador do período (O(1), sem
+    contar faturas) e pode reservar um bloco de números para faturamento em
+    lote. O lock da linha dura só até o fim da transação de quem alocou.
+    """
+    
+    period = models.CharField('Período', max_length=6, primary_key=True)
+    last_number = models.PositiveIntegerField('Último Número', default=0)
+    
+    class Meta:
+        verbose_name = 'Sequência de Faturas'
+        verbose_name_plural = 'Sequências de Faturas'
+    
+    def __str__(self):
+        return f"{self.period}: {self.last_number}"
+    
+    @staticmethod
+    def format_number(period, number):
+        return f"{period}{number:04d}"
+    
+    @classmethod
+    def _initial_number(cls, period):
+        """Maior número já emitido no período (faturas anteriores ao contador)"""
+        numbers = Invoice.objects.filter(
+            invoice_number__startswith=period
+        ).values_list('invoice_number', flat=True)
+        return max((int(number[len(period):]) for number in numbers if number[len(period):].isdigit()), default=0)
+    
+    @classmethod
+    def allocate(cls, count=1, period=None):
+        """Reserva count números consecutivos e retorna a lista formatada"""
+        if period is None:
+            now = timezone.now()
+            period = f"{now.year}{now.month:02d}"
+        
+        with transaction.atomic():
+            if not cls.objects.filter(period=period).update(last_number=models.F('last_number') + count):
+                cls.objects.get_or_create(
+                    period=period, defaults={'last_number': cls._initial_number(period)}
+                )
+                cls.objects.filter(period=period).update(last_number=models.F('last_number') + count)
+            last_number = cls.objects.filter(period=period).values_list('last_number', flat=True).get()
+        
+        return [
+            cls.format_number(period, number)
+            for number in range(last_number - count + 1, last_number + 1)
+        ]
+
+
+class EmailOutbox(models.Model):
+    """Fila transacional de emails de cobrança
+    
+    As notificações são gravadas na mesma transação que as originou e enviadas
+    depois por NotificationService.drain_outbox (task Celery), que reaproveita
+    uma única conexão SMTP por lote. dedup_key impede que a mesma notificação
+    seja enfileirada duas vezes (ex.: lembrete reprocessado pelo cron).
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('sending', 'Enviando'),
+        ('sent', 'Enviado'),
+        ('failed', 'Falhou'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    
+    dedup_key = models.CharField('Chave de Deduplicação', max_length=200, unique=True)
+    
+    # Mensagem
+    subject = models.CharField('Assunto', max_length=255)
+    html_message = models.TextField('Mensagem HTML')
+    from_email = models.CharField('Remetente', max_length=255)
+    recipients = models.JSONField('Destinatários', default=list)
+    
+    status = models.CharField(
+        'Status',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    
+    # Tentativas: next_attempt_at também serve de lease enquanto 'sending',
+    # para que mensagens de um worker interrompido voltem à fila
+    attempts = models.PositiveIntegerField('Tentativas', default=0)
+    next_attempt_at = models.DateTimeField('Próxima Tentativa', default=timezone.now)
+    last_error = models.TextField('Último Erro', blank=True)
+    sent_at = models.DateTimeField('Enviado em', null=True, blank=True)
+    
+    created_at = models.DateTimeField('Criado em', auto_now_add=True)
+    updated_at = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Email na Fila'
+        verbose_name_plural = 'Emails na Fila'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} ({self.get_status_display()})"
+
+
+class WebhookEvent(models.Model):
+    """Evento recebido do Stripe, gravado antes de ser processado
+    
+    O webhook apenas verifica a assinatura, grava o payload bruto e responde
+    200; o processamento fica com StripeWebhookService.process_pending. A
+    restrição única em event_id torna idempotentes os reenvios do Stripe, e
+    ordering_key (normalmente a assinatura) garante que eventos de uma mesma
+    assinatura sejam aplicados na ordem em que foram criados.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('processing', 'Processando'),
+        ('processed', 'Processado'),
+        ('ignored', 'Ignorado'),
+        ('failed', 'Falhou'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    
+    event_id = models.CharField('ID do Evento', max_length=255, unique=True)
+    event_type = models.CharField('Tipo', max_length=100)
+    ordering_key = models.CharField('Chave de Ordenação', max_length=255)
+    payload = models.JSONField('Payload')
+    
+    # Momento de criação do evento no Stripe (campo "created")
+    event_created_at = models.DateTimeField('Criado no Stripe')
+    
+    status = models.CharField(
+        'Status',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending'
+    )
+    
+    # Tentativas: next_attempt_at também serve de lease enquanto 'processing'
+    attempts = models.PositiveIntegerField('Tentativas', default=0)
+    next_attempt_at = models.DateTimeField('Próxima Tentativa', default=timezone.now)
+    last_error = models.TextField('Último Erro', blank=True)
+    processed_at = models.DateTimeField('Processado em', null=True, blank=True)
+    
+    received_at = models.DateTimeField('Recebido em', auto_now_add=True)
+    updated_at = models.DateTimeField('Atualizado em', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Evento de Webhook'
+        verbose_name_plural = 'Eventos de Webhook'
+        ordering = ['event_created_at', 'received_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['ordering_key', 'status']),
+            models.Index(fields=['event_created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+
+class RevenueRollup(models.Model):
+    """Totais diários de receita, MRR e churn por conta ou por plano
+    
+    Cada linha pertence a uma conta ou a um plano (nunca aos dois) e é
+    atualizada incrementalmente, com UPDATEs F(), pelas transições de status
+    feitas em Payment.save e Subscription.save (ver record_payment e
+    record_subscription).
+    mrr é o MRR ao fim do dia: a primeira linha de um dia herda o valor da
+    última linha anterior, então o MRR atual é lido de uma única linha. As
+    transições feitas com queryset.update() não passam por aqui; o comando
+    rebuild_revenue_rollups reconstrói a tabela a partir do histórico.
+    """
+    
+    # Status em que a assinatura conta para o MRR
+    MRR_STATUSES = ('active', 'past_due')
+    
+    # Meses por ciclo de cobrança (vitalício não gera receita recorrente)
+    BILLING_CYCLE_MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+    
+    day = models.DateField('Dia')
+    
+    account = models.ForeignKey(
+        'accounts.Account',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='revenue_rollups',
+        verbose_name='Conta'
+    )
+    
+    plan = models.ForeignKey(
+        Plan,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='revenue_rollups',
+        verbose_name='Plano'
+    )
+    
+    # Pagamentos
+    revenue = models.DecimalField('Receita', max_digits=12, decimal_places=2, default=0)
+    refunds = models.DecimalField('Reembolsos', max_digits=12, decimal_places=2, default=0)
+    paid_count = models.IntegerField('Pagamentos Recebidos', default=0)
+    failed_count = models.IntegerField('Pagamentos com Falha', default=0)
+    
+    # Assinaturas
+    mrr = models.DecimalField('MRR', max_digits=12, decimal_places=2, default=0)
+    new_mrr = models.DecimalField('MRR Novo', max_digits=12, decimal_places=2, default=0)
+    churned_mrr = models.DecimalField('MRR Perdido', max_digits=12, decimal_places=2, default=0)
+    new_subscriptions = models.IntegerField('Novas Assinaturas', default=0)
+    churned_subscriptions = models.IntegerField('Assinaturas Perdidas', default=0)
+    
+    class Meta:
+        verbose_name = 'Consolidado de Receita'
+        verbose_name_plural = 'Consolidados de Receita'
+        ordering = ['-day']
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(account__isnull=False, plan__isnull=True) |
+                    models.Q(account__isnull=True, plan__isnull=False)
+                ),
+                name='payments_rollup_single_scope'
+            ),
+            models.UniqueConstraint(
+                fields=['account', 'day'], condition=models.Q(account__isnull=False),
+                name='payments_rollup_account_day'
+            ),
+            models.UniqueConstraint(
+                fields=['plan', 'day'], condition=models.Q(plan__isnull=False),
+                name='payments_rollup_plan_day'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} - {self.account or self.plan}"
+    
+    @classmethod
+    def monthly_amount(cls, price, billing_cycle):
+        """Valor mensal (MRR) de uma assinatura"""
+        months = cls.BILLING_CYCLE_MONTHS.get(billing_cycle)
+        if not months or price is None:
+            return Decimal('0.00')
+        return (Decimal(price) / months).quantize(Decimal('0.01'))
+    
+    @classmethod
+    def apply(cls, day, account_id=None, plan_id=None, **deltas):
+        """Soma os deltas nas linhas do dia da conta e do plano informados"""
+        deltas = {field: value for field, value in deltas.items() if value}
+        if not deltas:
+            return
+        
+        scopes = []
+        if account_id is not None:
+            scopes.append({'account_id': account_id, 'plan_id': None})
+        if plan_id is not None:
+            scopes.append({'account_id': None, 'plan_id': plan_id})
+        
+        changes = {field: models.F(field) + value for field, value in deltas.items()}
+        with transaction.atomic():
+            for scope in scopes:
+                if cls.objects.filter(day=day, **scope).update(**changes):
+                    continue
+                mrr = cls.objects.filter(day__lt=day, **scope).order_by('-day').values_list(
+                    'mrr', flat=True
+                ).first()
+                cls.objects.get_or_create(day=day, **scope, defaults={'mrr': mrr or 0})
+                cls.objects.filter(day=day, **scope).update(**changes)
+    
+    @classmethod
+    def record_payment(cls, payment, previous_status, previous_attempts=0):
+        """Registra a transição de status de um pagamento
+        
+        Novas falhas de um pagamento já em 'failed' (mark_as_failed
+        incrementa attempt_count) também contam em failed_count.
+        """
+        repeated_failure = (
+            payment.status == 'failed' and previous_status == 'failed' and
+            payment.attempt_count > previous_attempts
+        )
+        if payment.status == previous_status and not repeated_failure:
+            return
+        
+        if payment.status == 'paid':
+            day = payment.paid_at or timezone.now()
+            deltas = {'revenue': payment.amount, 'paid_count': 1}
+        elif payment.status == 'failed':
+            day = payment.failed_at or timezone.now()
+            deltas = {'failed_count': 1}
+        elif payment.status == 'refunded':
+            day = timezone.now()
+            deltas = {'refunds': payment.amount}
+        else:
+            return
+        
+        account_id, plan_id = Subscription.objects.filter(
+            pk=payment.subscription_id
+        ).values_list('account_id', 'plan_id').get()
+        cls.apply(timezone.localdate(day), account_id, plan_id, **deltas)
+    
+    @classmethod
+    def record_subscription(cls, subscription, previous_state):
+        """Registra a transição de status, plano ou preço de uma assinatura
+        
+        Args:
+            previous_state: (status, plan_id, price_snapshot) gravados no
+                banco antes do save, ou None para uma assinatura nova
+        """
+        old_status, old_plan_id, old_price = previous_state or (None, None, None)
+        
+        was_counted = old_status in cls.MRR_STATUSES
+        is_counted = subscription.status in cls.MRR_STATUSES
+        if not was_counted and not is_counted:
+            return
+        
+        day = timezone.localdate()
+        plan = subscription.plan
+        new_mrr = cls.monthly_amount(subscription.price_snapshot, plan.billing_cycle) if is_counted else 0
+        old_mrr = Decimal('0.00')
+        if was_counted:
+            old_cycle = plan.billing_cycle
+            if old_plan_id != subscription.plan_id:
+                old_cycle = Plan.objects.filter(pk=old_plan_id).values_list('billing_cycle', flat=True).first()
+            old_mrr = cls.monthly_amount(old_price, old_cycle)
+        
+        if not was_counted:
+            cls.apply(
+                day, subscription.account_id, subscription.plan_id,
+                mrr=new_mrr, new_mrr=new_mrr, new_subscriptions=1
+            )
+        elif not is_counted:
+            cls.apply(
+                day, subscription.account_id, old_plan_id,
+                mrr=-old_mrr, churned_mrr=old_mrr, churned_subscriptions=1
+            )
+        elif old_plan_id == subscription.plan_id:
+            cls.apply(day, subscription.account_id, subscription.plan_id, mrr=new_mrr - old_mrr)
+        else:
+            # Troca de plano: move o MRR entre os planos, sem contar como churn
+            cls.apply(day, account_id=subscription.account_id, mrr=new_mrr - old_mrr)
+            cls.apply(day, plan_id=old_plan_id, mrr=-old_mrr)
+            cls.apply(day, plan_id=subscription.plan_id, mrr=new_mrr)
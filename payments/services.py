@@ -1,13 +1,24 @@
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.template.loader import get_template, render_to_string
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from decimal import Decimal
+import functools
+import hashlib
+import json
 import stripe
 import logging
-from datetime import timedelta
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from .models import Plan, Subscription, Payment, Invoice
+from .models import Plan, Subscription, Payment, Invoice, InvoiceSequence, EmailOutbox, WebhookEvent, RevenueRollup
 from accounts.models import Account
 
 # Configure Stripe
@@ -70,33 +81,54 @@ class SubscriptionService:
             return start_date + timedelta(days=30)
     
     @staticmethod
-    def renew_subscription(subscription):
-        """Renova uma assinatura"""
-        if not subscription.auto_renew:
-            logger.info(f'Subscription {subscription.id} not set for auto-renewal')
-            return False
+    def get_renewal_key(subscription, period_start):
+        """Chave de idempotência da cobrança de renovação de um período"""
+        return f'renewal:{subscription.id}:{period_start.isoformat()}'
+    
+    @staticmethod
+    def advance_period(subscription):
+        """Avança a assinatura para o próximo período e cria o pagamento
+        
+        O pagamento usa uma chave de idempotência por assinatura e período,
+        então reexecuções nunca criam uma segunda cobrança.
         
-        # Calcular novo período
+        Returns:
+            Payment ou None (planos gratuitos)
+        """
         new_period_start = subscription.current_period_end
         new_period_end = SubscriptionService._calculate_next_period_end(
             new_period_start, subscription.plan.billing_cycle
         )
         
-        # Atualizar assinatura
         subscription.current_period_start = new_period_start
         subscription.current_period_end = new_period_end
         subscription.status = 'active'
-        subscription.save()
+        subscription.save(update_fields=[
+            'current_period_start', 'current_period_end', 'status', 'updated_at'
+        ])
         
-        # Criar pagamento se não for gratuito
-        if not subscription.plan.is_free:
-            payment = PaymentService.create_payment(
-                subscription=subscription,
-                amount=subscription.plan.price,
-                description=f'Renewal for {subscription.plan.name}'
-            )
-            
-            # Tentar processar pagamento automaticamente
+        if subscription.plan.is_free:
+            return None
+        
+        return PaymentService.create_payment(
+            subscription=subscription,
+            amount=subscription.plan.price,
+            description=f'Renewal for {subscription.plan.name}',
+            idempotency_key=SubscriptionService.get_renewal_key(subscription, new_period_start)
+        )
+    
+    @staticmethod
+    def renew_subscription(subscription):
+        """Renova uma assinatura"""
+        if not subscription.auto_renew:
+            logger.info(f'Subscription {subscription.id} not set for auto-renewal')
+            return False
+        
+        with transaction.atomic():
+            payment = SubscriptionService.advance_period(subscription)
+        
+        # Tentar processar pagamento automaticamente
+        if payment is not None:
             PaymentService.process_automatic_payment(payment)
         
         logger.info(f'Renewed subscription {subscription.id}')
@@ -163,16 +195,28 @@ class PaymentService:
     """Serviço para gerenciar pagamentos"""
     
     @staticmethod
-    def create_payment(subscription, amount, description='', payment_method='stripe'):
-        """Cria um novo pagamento"""
-        payment = Payment.objects.create(
-            subscription=subscription,
-            amount=amount,
-            currency='BRL',
-            payment_method=payment_method,
-            description=description,
-            due_date=subscription.current_period_end
-        )
+    def create_payment(subscription, amount, description='', payment_method='stripe', idempotency_key=None):
+        """Cria um novo pagamento
+        
+        Com idempotency_key, retorna o pagamento já existente para a mesma chave.
+        """
+        fields = {
+            'subscription': subscription,
+            'amount': amount,
+            'currency': 'BRL',
+            'payment_method': payment_method,
+            'description': description,
+            'due_date': subscription.current_period_end,
+        }
+        if idempotency_key:
+            payment, created = Payment.objects.get_or_create(
+                idempotency_key=idempotency_key, defaults=fields
+            )
+            if not created:
+                logger.info(f'Reusing payment {payment.id} for key {idempotency_key}')
+                return payment
+        else:
+            payment = Payment.objects.create(**fields)
         
         logger.info(f'Created payment {payment.id} for subscription {subscription.id}')
         return payment
@@ -181,6 +225,10 @@ class PaymentService:
     def create_stripe_payment_intent(payment):
         """Cria um Payment Intent no Stripe"""
         try:
+            options = {}
+            if payment.idempotency_key:
+                # O Stripe devolve o mesmo intent se a chamada for repetida
+                options['idempotency_key'] = payment.idempotency_key
             intent = stripe.PaymentIntent.create(
                 amount=int(payment.amount * 100),  # Stripe usa centavos
                 currency=payment.currency.lower(),
@@ -188,7 +236,8 @@ class PaymentService:
                     'payment_id': str(payment.id),
                     'subscription_id': str(payment.subscription.id),
                     'account_id': str(payment.subscription.account.id)
-                }
+                },
+                **options
             )
             
             payment.gateway_transaction_id = intent.id
@@ -202,7 +251,11 @@ class PaymentService:
     
     @staticmethod
     def process_automatic_payment(payment):
-        """Processa pagamento automático (para renovações)"""
+        """Processa pagamento automático (para renovações)
+        
+        Deve retornar o ID da transação criada no gateway; sem ele
+        (None/vazio) a cobrança é considerada não enviada.
+        """
         # Implementar lógica de pagamento automático
         # Por exemplo, usando cartão salvo do cliente
         pass
@@ -229,97 +282,761 @@ class PaymentService:
         logger.info(f'Handled failed payment {payment.id}')
 
 
-class NotificationService:
-    """Serviço para envio de notificações"""
+class RenewalService:
+    """Motor de renovações em lote.
+    
+    As assinaturas são reivindicadas em lotes com SELECT ... FOR UPDATE SKIP
+    LOCKED: várias execuções (ou workers) em paralelo nunca pegam a mesma
+    assinatura. Cada lote avança os períodos e cria os pagamentos numa
+    transação curta; como a assinatura renovada sai do filtro, o commit do
+    lote funciona como checkpoint e uma execução interrompida pode ser
+    simplesmente repetida: cada execução começa cobrando os pagamentos de
+    renovação que ficaram sem cobrança (get_resumable_payments). Os
+    pagamentos têm chave de idempotência por período e são reivindicados
+    antes da cobrança, então a repetição não gera cobrança duplicada.
+    
+    As faturas das novas cobranças são geradas no mesmo lote, com um bloco
+    de números reservado de uma vez em InvoiceSequence.
+    
+    As chamadas ao gateway acontecem fora da transação, distribuídas num
+    pool de threads limitado a RENEWAL_GATEWAY_CONCURRENCY.
+    
+    Cada assinatura é renovada num savepoint próprio: um erro é registrado
+    e a assinatura fica para a próxima execução, sem desfazer o lote nem
+    interromper as demais.
+    """
     
     @staticmethod
-    def send_subscription_canceled_email(subscription):
-        """Envia email de cancelamento de assinatura"""
-        try:
-            subject = 'Assinatura Cancelada'
-            message = render_to_string('emails/subscription_canceled.html', {
-                'subscription': subscription,
-                'account': subscription.account
-            })
+    def claim_batch(queryset, batch_size):
+        """Reivindica e renova um lote; retorna (renovadas, pagamentos, com erro)"""
+        with transaction.atomic():
+            subscriptions = list(
+                queryset.select_for_update(skip_locked=True, of=('self',))
+                .select_related('plan')
+                .order_by('current_period_end', 'id')[:batch_size]
+            )
+            renewed = []
+            errors = []
+            payments = []
+            for subscription in subscriptions:
+                try:
+                    with transaction.atomic():
+                        payment = SubscriptionService.advance_period(subscription)
+                except Exception as e:
+                    logger.error(f'Error renewing subscription {subscription.id}: {str(e)}')
+                    errors.append(subscription)
+                    continue
+                renewed.append(subscription)
+                if payment is not None:
+                    payments.append(payment)
             
-            # Obter email do usuário principal da conta
-            primary_user = subscription.account.users.filter(
-                memberships__role='owner'
-            ).first()
+            # Faturas das cobranças novas, numeradas com um bloco só
+            invoiced = set(
+                Invoice.objects.filter(payment__in=payments).values_list('payment_id', flat=True)
+            )
+            pending = [
+                (payment.subscription, payment)
+                for payment in payments
+                if payment.pk not in invoiced
+            ]
+            try:
+                with transaction.atomic():
+                    BillingService.generate_invoices(pending)
+            except Exception as e:
+                # Gera uma a uma para isolar a cobrança com problema
+                logger.error(f'Error generating renewal invoices in batch: {str(e)}')
+                for item in pending:
+                    try:
+                        with transaction.atomic():
+                            BillingService.generate_invoices([item])
+                    except Exception as e:
+                        logger.error(f'Error generating invoice for payment {item[1].id}: {str(e)}')
+        return renewed, payments, errors
+    
+    @staticmethod
+    def get_resumable_payments():
+        """Cobranças de renovação ainda não enviadas ao gateway
+        
+        Inclui as de execuções interrompidas entre o commit do lote e a
+        cobrança (o período já avançou, então a assinatura não volta a ser
+        reivindicada) e as que ficaram em 'processing' sem resposta do
+        gateway por mais de RENEWAL_RESUME_AFTER segundos.
+        """
+        stale = timezone.now() - timedelta(seconds=getattr(settings, 'RENEWAL_RESUME_AFTER', 30 * 60))
+        return Payment.objects.filter(
+            idempotency_key__startswith='renewal:',
+            gateway_transaction_id='',
+            attempt_count__lt=F('max_attempts')
+        ).filter(
+            Q(status='pending') | Q(status='processing', updated_at__lt=stale)
+        )
+    
+    @staticmethod
+    def charge(payment):
+        """Cobra um pagamento de renovação no gateway
+        
+        O pagamento é reivindicado com um UPDATE condicional (pending ->
+        processing): execuções simultâneas nunca cobram o mesmo pagamento.
+        O ID da transação retornado pelo gateway é gravado na hora, o que tira
+        o pagamento da fila de retomada; ele segue em 'processing' até a
+        confirmação pelo webhook. Sem ID a cobrança não foi enviada: o
+        pagamento volta para a fila consumindo uma tentativa.
+        
+        Returns:
+            str: 'charged', 'not_submitted', 'skipped' ou 'failed'
+        """
+        claimed = RenewalService.get_resumable_payments().filter(pk=payment.pk).update(
+            status='processing', updated_at=timezone.now()
+        )
+        if not claimed:
+            # Já cobrado (ou em cobrança) por outra execução
+            return 'skipped'
+        payment.status = 'processing'
+        
+        try:
+            transaction_id = PaymentService.process_automatic_payment(payment)
+        except Exception as e:
+            logger.error(f'Error charging renewal payment {payment.id}: {str(e)}')
+            result = 'failed'
+        else:
+            if transaction_id:
+                Payment.objects.filter(pk=payment.pk).update(
+                    gateway_transaction_id=transaction_id, updated_at=timezone.now()
+                )
+                payment.gateway_transaction_id = transaction_id
+                return 'charged'
+            logger.warning(f'Renewal payment {payment.id} was not submitted to the gateway')
+            result = 'not_submitted'
+        
+        # Volta para a fila da próxima execução, até max_attempts
+        Payment.objects.filter(pk=payment.pk, status='processing', gateway_transaction_id='').update(
+            status='pending', attempt_count=F('attempt_count') + 1, updated_at=timezone.now()
+        )
+        return result
+    
+    @staticmethod
+    def _charge_in_worker(payment):
+        try:
+            return RenewalService.charge(payment)
+        finally:
+            # Cada thread do pool tem a própria conexão com o banco
+            close_old_connections()
+    
+    @staticmethod
+    def run(day=None, batch_size=None, concurrency=None, progress=None):
+        """Executa as renovações do dia
+        
+        Args:
+            day: Dia de vencimento (padrão: amanhã)
+            batch_size: Assinaturas por lote (padrão: RENEWAL_BATCH_SIZE)
+            concurrency: Chamadas simultâneas ao gateway (padrão: RENEWAL_GATEWAY_CONCURRENCY)
+            progress: Função chamada com as estatísticas após cada lote
+        
+        Returns:
+            dict: Estatísticas (renovadas, com erro, cobradas, não enviadas,
+            falhas, vazão por segundo)
+        """
+        batch_size = batch_size or settings.RENEWAL_BATCH_SIZE
+        concurrency = concurrency or settings.RENEWAL_GATEWAY_CONCURRENCY
+        queryset = BillingService.get_renewal_queryset(day)
+        
+        stats = {
+            'batches': 0, 'renewed': 0, 'errors': 0, 'resumed': 0,
+            'charged': 0, 'not_submitted': 0, 'skipped': 0, 'failed': 0,
+        }
+        # Assinaturas com erro nesta execução não são reivindicadas de novo
+        errored = set()
+        started = time.monotonic()
+        
+        executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+        
+        def charge_all(payments):
+            if executor is not None:
+                results = executor.map(RenewalService._charge_in_worker, payments)
+            else:
+                results = map(RenewalService.charge, payments)
+            for result in results:
+                stats[result] += 1
+        
+        try:
+            # Cobranças deixadas para trás por execuções interrompidas
+            resumable = list(RenewalService.get_resumable_payments().order_by('created_at').values_list('pk', flat=True))
+            for start in range(0, len(resumable), batch_size):
+                payments = list(
+                    Payment.objects.filter(pk__in=resumable[start:start + batch_size])
+                    .select_related('subscription__account')
+                )
+                charge_all(payments)
+                stats['resumed'] += len(payments)
             
-            if primary_user:
-                send_mail(
-                    subject=subject,
-                    message='',
-                    html_message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[primary_user.email],
-                    fail_silently=False
+            while True:
+                subscriptions, payments, errors = RenewalService.claim_batch(
+                    queryset.exclude(pk__in=errored), batch_size
                 )
+                if not subscriptions and not errors:
+                    break
                 
-            logger.info(f'Sent cancellation email for subscription {subscription.id}')
-        except Exception as e:
-            logger.error(f'Error sending cancellation email: {str(e)}')
+                charge_all(payments)
+                errored.update(subscription.pk for subscription in errors)
+                
+                stats['batches'] += 1
+                stats['renewed'] += len(subscriptions)
+                stats['errors'] += len(errors)
+                stats['elapsed'] = time.monotonic() - started
+                stats['rate'] = stats['renewed'] / stats['elapsed'] if stats['elapsed'] else 0
+                if progress:
+                    progress(stats)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        stats['elapsed'] = time.monotonic() - started
+        stats['rate'] = stats['renewed'] / stats['elapsed'] if stats['elapsed'] else 0
+        logger.info(
+            f"Processed {stats['renewed']} subscription renewals in {stats['elapsed']:.1f}s "
+            f"({stats['rate']:.1f}/s, {stats['errors']} errors, {stats['failed']} failed charges)"
+        )
+        return stats
+
+
+class StripeWebhookService:
+    """Processamento dos webhooks do Stripe a partir da fila WebhookEvent
+    
+    A view só grava o evento (ingest) e responde 200; process_pending() aplica
+    os eventos depois, em lotes. Em cada rodada apenas o evento mais antigo
+    ainda não concluído de cada ordering_key é elegível, de modo que eventos
+    da mesma assinatura nunca são aplicados fora de ordem, mesmo com vários
+    workers; assinaturas diferentes são processadas em paralelo.
+    """
+    
+    HANDLERS = {
+        'payment_intent.succeeded': '_handle_payment_succeeded',
+        'payment_intent.payment_failed': '_handle_payment_failed',
+        'invoice.payment_succeeded': '_handle_invoice_payment_succeeded',
+        'invoice.payment_failed': '_handle_invoice_payment_failed',
+        'customer.subscription.updated': '_handle_subscription_updated',
+        'customer.subscription.deleted': '_handle_subscription_deleted',
+    }
+    
+    # Quantos IDs de eventos aplicados ficam registrados em Payment.metadata
+    APPLIED_EVENTS_LIMIT = 20
     
     @staticmethod
-    def send_payment_failed_email(payment):
-        """Envia email de falha no pagamento"""
+    def get_ordering_key(event):
+        """Chave de ordenação do evento: a assinatura a que ele se refere"""
+        obj = event.get('data', {}).get('object') or {}
+        metadata = obj.get('metadata') or {}
+        if metadata.get('subscription_id'):
+            return str(metadata['subscription_id'])
+        if obj.get('object') == 'subscription' and obj.get('id'):
+            return obj['id']
+        return obj.get('subscription') or obj.get('id') or event['id']
+    
+    @staticmethod
+    def get_event_created_at(event):
+        created = event.get('created')
+        if created is None:
+            return timezone.now()
+        return datetime.fromtimestamp(int(created), tz=dt_timezone.utc)
+    
+    @staticmethod
+    def ingest(event):
+        """Grava o evento bruto, uma única vez por event_id
+        
+        Returns:
+            tuple: (WebhookEvent, criado)
+        """
+        return WebhookEvent.objects.get_or_create(
+            event_id=event['id'],
+            defaults={
+                'event_type': event.get('type', ''),
+                'ordering_key': StripeWebhookService.get_ordering_key(event)[:255],
+                'payload': event,
+                'event_created_at': StripeWebhookService.get_event_created_at(event),
+            }
+        )
+    
+    @staticmethod
+    def schedule_processing():
+        """Agenda o processamento da fila após o commit
+        
+        Com STRIPE_WEBHOOK_ASYNC desativado (padrão em DEBUG) a fila é
+        processada ao fim da própria requisição. Sem broker disponível os
+        eventos ficam para a execução periódica de process_webhook_events.
+        """
+        def enqueue():
+            if getattr(settings, 'STRIPE_WEBHOOK_ASYNC', False):
+                from .tasks import process_webhook_events
+                try:
+                    process_webhook_events.delay()
+                except Exception as exc:
+                    logger.warning(f'Could not schedule webhook processing: {exc}')
+                return
+            StripeWebhookService.process_pending()
+        
+        transaction.on_commit(enqueue)
+    
+    @staticmethod
+    def get_retry_delay(attempts):
+        """Backoff exponencial limitado a 1 hora"""
+        base = getattr(settings, 'STRIPE_WEBHOOK_RETRY_DELAY', 30)
+        return timedelta(seconds=min(60 * 60, base * 2 ** max(0, attempts - 1)))
+    
+    @staticmethod
+    def _claim_batch(batch_size):
+        """Reivindica o evento mais antigo pendente de cada ordering_key"""
+        now = timezone.now()
+        lease = getattr(settings, 'STRIPE_WEBHOOK_LEASE', 300)
+        earlier = WebhookEvent.objects.filter(
+            ordering_key=OuterRef('ordering_key'),
+            status__in=['pending', 'processing']
+        ).filter(
+            Q(event_created_at__lt=OuterRef('event_created_at')) |
+            Q(event_created_at=OuterRef('event_created_at'), received_at__lt=OuterRef('received_at'))
+        )
+        
+        with transaction.atomic():
+            ids = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True).filter(
+                    status__in=['pending', 'processing'],
+                    next_attempt_at__lte=now
+                ).exclude(
+                    Exists(earlier)
+                ).order_by('event_created_at', 'received_at').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return []
+            WebhookEvent.objects.filter(id__in=ids).update(
+                status='processing',
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=lease),
+                updated_at=now
+            )
+        return list(WebhookEvent.objects.filter(id__in=ids).order_by('event_created_at', 'received_at'))
+    
+    @staticmethod
+    def process_event(webhook_event):
+        """Aplica um evento; retorna o novo status"""
+        max_attempts = getattr(settings, 'STRIPE_WEBHOOK_MAX_ATTEMPTS', 8)
+        handler = StripeWebhookService.HANDLERS.get(webhook_event.event_type)
+        now = timezone.now()
+        
         try:
-            subject = 'Falha no Pagamento'
-            message = render_to_string('emails/payment_failed.html', {
-                'payment': payment,
-                'subscription': payment.subscription,
-                'account': payment.subscription.account
-            })
+            with transaction.atomic():
+                if handler is not None:
+                    getattr(StripeWebhookService, handler)(
+                        webhook_event.payload['data']['object'], webhook_event.event_id
+                    )
+        except Exception as exc:
+            webhook_event.last_error = str(exc)[:1000]
+            if webhook_event.attempts >= max_attempts:
+                webhook_event.status = 'failed'
+                logger.error(f'Giving up on Stripe event {webhook_event.event_id}: {exc}')
+            else:
+                webhook_event.status = 'pending'
+                webhook_event.next_attempt_at = now + StripeWebhookService.get_retry_delay(webhook_event.attempts)
+                logger.warning(f'Stripe event {webhook_event.event_id} failed, retrying: {exc}')
+        else:
+            if handler is None:
+                logger.info(f'Unhandled Stripe event type: {webhook_event.event_type}')
+            webhook_event.status = 'processed' if handler is not None else 'ignored'
+            webhook_event.processed_at = now
+            webhook_event.last_error = ''
+        
+        webhook_event.save(update_fields=[
+            'status', 'next_attempt_at', 'last_error', 'processed_at', 'updated_at'
+        ])
+        return webhook_event.status
+    
+    @staticmethod
+    def process_pending(batch_size=None, max_batches=None):
+        """Processa os eventos pendentes até esvaziar a fila
+        
+        Returns:
+            dict: Quantidade de eventos por status resultante
+        """
+        batch_size = batch_size or getattr(settings, 'STRIPE_WEBHOOK_BATCH_SIZE', 100)
+        stats = {'processed': 0, 'ignored': 0, 'pending': 0, 'failed': 0}
+        
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = StripeWebhookService._claim_batch(batch_size)
+            if not batch:
+                break
+            batches += 1
+            for webhook_event in batch:
+                stats[StripeWebhookService.process_event(webhook_event)] += 1
+        
+        return stats
+    
+    @staticmethod
+    def replay(since, until, event_type=None, events=None):
+        """Recoloca na fila os eventos criados no intervalo [since, until)
+        
+        Args:
+            since, until: Datetimes do intervalo (pelo campo created do Stripe)
+            event_type: Filtra por tipo de evento (opcional)
+            events: Payloads gravados (ex.: exportados do Stripe) a ingerir
+                antes do replay; eventos já conhecidos são reaproveitados
+        
+        Returns:
+            int: Eventos recolocados na fila
+        """
+        for event in events or []:
+            created_at = StripeWebhookService.get_event_created_at(event)
+            if since <= created_at < until:
+                StripeWebhookService.ingest(event)
+        
+        queryset = WebhookEvent.objects.filter(
+            event_created_at__gte=since,
+            event_created_at__lt=until
+        )
+        if event_type:
+            queryset = queryset.filter(event_type=event_type)
+        
+        return queryset.update(
+            status='pending',
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            last_error='',
+            updated_at=timezone.now()
+        )
+    
+    @staticmethod
+    def _mark_event_applied(payment, event_id):
+        """Registra o evento no pagamento; retorna False se já foi aplicado"""
+        applied = payment.metadata.get('stripe_events', [])
+        if event_id in applied:
+            return False
+        payment.metadata['stripe_events'] = (applied + [event_id])[-StripeWebhookService.APPLIED_EVENTS_LIMIT:]
+        return True
+    
+    @staticmethod
+    def _handle_payment_succeeded(payment_intent, event_id):
+        """Processa pagamento bem-sucedido"""
+        payment = Payment.objects.select_for_update().filter(
+            gateway_transaction_id=payment_intent['id']
+        ).first()
+        if payment is None:
+            logger.error(f'Payment not found for transaction {payment_intent["id"]}')
+            return
+        if not StripeWebhookService._mark_event_applied(payment, event_id):
+            return
+        
+        payment.mark_as_paid()
+        payment.gateway_response = payment_intent
+        payment.save()
+        
+        # Atualizar assinatura se necessário
+        if payment.subscription.status in ['past_due', 'trial']:
+            payment.subscription.status = 'active'
+            payment.subscription.save()
+        
+        logger.info(f'Payment {payment.id} marked as paid')
+    
+    @staticmethod
+    def _handle_payment_failed(payment_intent, event_id):
+        """Processa falha no pagamento"""
+        payment = Payment.objects.select_for_update().filter(
+            gateway_transaction_id=payment_intent['id']
+        ).first()
+        if payment is None:
+            logger.error(f'Payment not found for transaction {payment_intent["id"]}')
+            return
+        if not StripeWebhookService._mark_event_applied(payment, event_id):
+            return
+        
+        failure_reason = (payment_intent.get('last_payment_error') or {}).get('message', 'Unknown error')
+        payment.mark_as_failed(failure_reason)
+        payment.gateway_response = payment_intent
+        payment.save()
+        
+        logger.info(f'Payment {payment.id} marked as failed: {failure_reason}')
+    
+    @staticmethod
+    def _handle_invoice_payment_succeeded(invoice, event_id):
+        """Processa pagamento de fatura bem-sucedido"""
+        # Implementar lógica específica para faturas
+        pass
+    
+    @staticmethod
+    def _handle_invoice_payment_failed(invoice, event_id):
+        """Processa falha no pagamento de fatura"""
+        # Implementar lógica específica para faturas
+        pass
+    
+    @staticmethod
+    def _handle_subscription_updated(subscription, event_id):
+        """Processa atualização de assinatura"""
+        # Implementar lógica de sincronização de assinatura
+        pass
+    
+    @staticmethod
+    def _handle_subscription_deleted(subscription, event_id):
+        """Processa cancelamento de assinatura"""
+        # Implementar lógica de cancelamento
+        pass
+
+
+class NotificationService:
+    """Serviço para envio de notificações
+    
+    Os emails não são enviados dentro da operação que os gera: cada
+    notificação é gravada em EmailOutbox na mesma transação (se ela for
+    desfeita, o email também é) e drain_outbox() faz o envio depois, em lotes
+    e com uma única conexão SMTP. Um servidor de email lento ou fora do ar
+    atrasa apenas a fila, nunca a renovação, o cancelamento ou o webhook.
+    """
+    
+    @staticmethod
+    def _get_recipients(account):
+        """Emails do proprietário da conta"""
+        owner = account.owner
+        return [owner.email] if owner is not None and owner.email else []
+    
+    @staticmethod
+    def build_message(dedup_key, subject, template_name, context, recipient_list):
+        """Renderiza a notificação como uma mensagem da fila (não salva)"""
+        return EmailOutbox(
+            dedup_key=dedup_key,
+            subject=subject,
+            html_message=render_to_string(template_name, context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list)
+        )
+    
+    @staticmethod
+    def enqueue(messages):
+        """Grava as mensagens na fila, ignorando as já enfileiradas
+        
+        Deve ser chamado dentro da transação que originou as notificações;
+        o envio é disparado somente após o commit. A gravação usa um
+        savepoint próprio: um erro de banco capturado por quem chamou não
+        invalida a transação externa. Retorna quantas mensagens entraram
+        na fila (as com dedup_key já existente não contam).
+        """
+        messages = list({
+            message.dedup_key: message for message in messages if message.recipients
+        }.values())
+        if not messages:
+            return 0
+        
+        with transaction.atomic():
+            existing = EmailOutbox.objects.filter(
+                dedup_key__in=[message.dedup_key for message in messages]
+            ).count()
+            EmailOutbox.objects.bulk_create(messages, ignore_conflicts=True)
+        NotificationService.schedule_drain()
+        return len(messages) - existing
+    
+    @staticmethod
+    def schedule_drain():
+        """Agenda o envio da fila após o commit
+        
+        Com NOTIFICATIONS_ASYNC desativado (padrão em DEBUG) a fila é enviada
+        ao fim da própria operação. Sem broker disponível as mensagens
+        continuam na fila para a execução periódica de send_outbox_emails.
+        """
+        def enqueue():
+            if getattr(settings, 'NOTIFICATIONS_ASYNC', False):
+                from .tasks import send_outbox_emails
+                try:
+                    send_outbox_emails.delay()
+                except Exception as exc:
+                    logger.warning(f'Could not schedule outbox delivery: {exc}')
+                return
+            NotificationService.drain_outbox()
+        
+        transaction.on_commit(enqueue)
+    
+    @staticmethod
+    def _claim_outbox_batch(batch_size):
+        """Reivindica um lote de mensagens prontas para envio
+        
+        O lote fica em 'sending' com next_attempt_at como lease: se o worker
+        for interrompido, as mensagens voltam a ser elegíveis quando ele
+        expirar. skip_locked permite vários workers em paralelo.
+        """
+        now = timezone.now()
+        lease = getattr(settings, 'NOTIFICATION_OUTBOX_LEASE', 300)
+        with transaction.atomic():
+            ids = list(
+                EmailOutbox.objects.select_for_update(skip_locked=True).filter(
+                    status__in=['pending', 'sending'],
+                    next_attempt_at__lte=now
+                ).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return []
+            EmailOutbox.objects.filter(id__in=ids).update(
+                status='sending',
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=lease),
+                updated_at=now
+            )
+        return list(EmailOutbox.objects.filter(id__in=ids).order_by('created_at'))
+    
+    @staticmethod
+    def get_retry_delay(attempts):
+        """Backoff exponencial: base, 2x, 4x... limitado a NOTIFICATION_OUTBOX_MAX_DELAY"""
+        base = getattr(settings, 'NOTIFICATION_OUTBOX_RETRY_DELAY', 60)
+        maximum = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_DELAY', 6 * 60 * 60)
+        return timedelta(seconds=min(maximum, base * 2 ** max(0, attempts - 1)))
+    
+    @staticmethod
+    def _send_batch(batch):
+        """Envia um lote reaproveitando uma conexão; retorna (enviadas, erros)"""
+        sent = []
+        errors = {}
+        mail_connection = get_connection(fail_silently=False)
+        try:
+            mail_connection.open()
+        except Exception as exc:
+            return sent, {message.pk: exc for message in batch}
+        
+        try:
+            for message in batch:
+                email = EmailMultiAlternatives(
+                    subject=message.subject,
+                    body='',
+                    from_email=message.from_email,
+                    to=message.recipients,
+                    connection=mail_connection
+                )
+                email.attach_alternative(message.html_message, 'text/html')
+                try:
+                    # A conexão já aberta não é fechada por send_messages
+                    mail_connection.send_messages([email])
+                    sent.append(message.pk)
+                except Exception as exc:
+                    errors[message.pk] = exc
+        finally:
+            try:
+                mail_connection.close()
+            except Exception:
+                pass
+        
+        return sent, errors
+    
+    @staticmethod
+    def drain_outbox(batch_size=None, max_batches=None):
+        """Envia as mensagens pendentes da fila
+        
+        Returns:
+            dict: sent, retried e failed (tentativas esgotadas)
+        """
+        batch_size = batch_size or getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 100)
+        max_attempts = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 6)
+        stats = {'sent': 0, 'retried': 0, 'failed': 0}
+        
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = NotificationService._claim_outbox_batch(batch_size)
+            if not batch:
+                break
+            batches += 1
             
-            # Obter email do usuário principal da conta
-            primary_user = payment.subscription.account.users.filter(
-                memberships__role='owner'
-            ).first()
+            sent, errors = NotificationService._send_batch(batch)
+            now = timezone.now()
             
-            if primary_user:
-                send_mail(
-                    subject=subject,
-                    message='',
-                    html_message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[primary_user.email],
-                    fail_silently=False
+            if sent:
+                EmailOutbox.objects.filter(id__in=sent).update(
+                    status='sent', sent_at=now, last_error='', updated_at=now
                 )
-                
-            logger.info(f'Sent payment failed email for payment {payment.id}')
+                stats['sent'] += len(sent)
+            
+            failed = []
+            for message in batch:
+                if message.pk not in errors:
+                    continue
+                message.last_error = str(errors[message.pk])[:1000]
+                message.updated_at = now
+                if message.attempts >= max_attempts:
+                    message.status = 'failed'
+                    stats['failed'] += 1
+                    logger.error(f'Giving up on outbox email {message.pk}: {message.last_error}')
+                else:
+                    message.status = 'pending'
+                    message.next_attempt_at = now + NotificationService.get_retry_delay(message.attempts)
+                    stats['retried'] += 1
+                failed.append(message)
+            if failed:
+                EmailOutbox.objects.bulk_update(
+                    failed, ['status', 'next_attempt_at', 'last_error', 'updated_at']
+                )
+            
+            if len(batch) < batch_size:
+                break
+        
+        if any(stats.values()):
+            logger.info(
+                f"Outbox: sent {stats['sent']}, retrying {stats['retried']}, failed {stats['failed']}"
+            )
+        return stats
+    
+    @staticmethod
+    def send_subscription_canceled_email(subscription):
+        """Enfileira o email de cancelamento de assinatura"""
+        try:
+            canceled_at = subscription.canceled_at or timezone.now()
+            NotificationService.enqueue([NotificationService.build_message(
+                f'subscription_canceled:{subscription.id}:{canceled_at.isoformat()}',
+                'Assinatura Cancelada',
+                'emails/subscription_canceled.html',
+                {
+                    'subscription': subscription,
+                    'account': subscription.account
+                },
+                NotificationService._get_recipients(subscription.account)
+            )])
+            logger.info(f'Queued cancellation email for subscription {subscription.id}')
         except Exception as e:
-            logger.error(f'Error sending payment failed email: {str(e)}')
+            logger.error(f'Error queueing cancellation email: {str(e)}')
     
     @staticmethod
-    def send_renewal_reminder_email(subscription, days_until_renewal):
-        """Envia lembrete de renovação"""
+    def send_payment_failed_email(payment):
+        """Enfileira o email de falha no pagamento"""
         try:
-            subject = f'Sua assinatura será renovada em {days_until_renewal} dias'
-            message = render_to_string('emails/renewal_reminder.html', {
+            NotificationService.enqueue([NotificationService.build_message(
+                f'payment_failed:{payment.id}:{payment.attempt_count}',
+                'Falha no Pagamento',
+                'emails/payment_failed.html',
+                {
+                    'payment': payment,
+                    'subscription': payment.subscription,
+                    'account': payment.subscription.account
+                },
+                NotificationService._get_recipients(payment.subscription.account)
+            )])
+            logger.info(f'Queued payment failed email for payment {payment.id}')
+        except Exception as e:
+            logger.error(f'Error queueing payment failed email: {str(e)}')
+    
+    @staticmethod
+    def build_renewal_reminder(subscription, days_until_renewal):
+        """Mensagem de lembrete de renovação (uma por período da assinatura)"""
+        return NotificationService.build_message(
+            f'renewal_reminder:{subscription.id}:{subscription.current_period_end.date()}:{days_until_renewal}',
+            f'Sua assinatura será renovada em {days_until_renewal} dias',
+            'emails/renewal_reminder.html',
+            {
                 'subscription': subscription,
                 'account': subscription.account,
                 'days_until_renewal': days_until_renewal
-            })
-            
-            # Obter email do usuário principal da conta
-            primary_user = subscription.account.users.filter(
-                memberships__role='owner'
-            ).first()
-            
-            if primary_user:
-                send_mail(
-                    subject=subject,
-                    message='',
-                    html_message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[primary_user.email],
-                    fail_silently=False
-                )
-                
-            logger.info(f'Sent renewal reminder for subscription {subscription.id}')
+            },
+            NotificationService._get_recipients(subscription.account)
+        )
+    
+    @staticmethod
+    def send_renewal_reminder_email(subscription, days_until_renewal):
+        """Enfileira o lembrete de renovação"""
+        try:
+            NotificationService.enqueue([
+                NotificationService.build_renewal_reminder(subscription, days_until_renewal)
+            ])
+            logger.info(f'Queued renewal reminder for subscription {subscription.id}')
         except Exception as e:
-            logger.error(f'Error sending renewal reminder: {str(e)}')
+            logger.error(f'Error queueing renewal reminder: {str(e)}')
 
 
 class BillingService:
@@ -353,45 +1070,380 @@ class BillingService:
         return invoice
     
     @staticmethod
-    def process_renewals():
-        """Processa renovações automáticas (para ser executado via cron/celery)"""
-        # Buscar assinaturas que vencem em 1 dia
-        tomorrow = timezone.now() + timedelta(days=1)
-        expiring_subscriptions = Subscription.objects.filter(
-            current_period_end__date=tomorrow.date(),
+    def generate_invoices(items):
+        """Gera faturas em lote, com um único bloco de números
+        
+        Args:
+            items: Lista de (assinatura, pagamento ou None)
+        
+        Returns:
+            list: Faturas criadas
+        """
+        if not items:
+            return []
+        
+        numbers = InvoiceSequence.allocate(len(items))
+        today = timezone.now().date()
+        invoices = []
+        for number, (subscription, payment) in zip(numbers, items):
+            subtotal = payment.amount if payment is not None else subscription.price_snapshot
+            invoices.append(Invoice(
+                subscription=subscription,
+                payment=payment,
+                invoice_number=number,
+                subtotal=subtotal,
+                tax_amount=Decimal('0.00'),
+                discount_amount=Decimal('0.00'),
+                total=subtotal,
+                issue_date=today,
+                due_date=subscription.current_period_end.date(),
+                description=f'Subscription to {subscription.plan.name}'
+            ))
+        
+        invoices = Invoice.objects.bulk_create(invoices)
+        logger.info(f'Generated {len(invoices)} invoices ({numbers[0]}..{numbers[-1]})')
+        return invoices
+    
+    @staticmethod
+    def get_renewal_queryset(day=None):
+        """Assinaturas com renovação automática que vencem no dia (padrão: amanhã)"""
+        day = day or (timezone.now() + timedelta(days=1)).date()
+        return Subscription.objects.filter(
+            current_period_end__date=day,
             auto_renew=True,
             status__in=['active', 'trial']
         )
-        
-        renewed_count = 0
-        for subscription in expiring_subscriptions:
-            try:
-                if SubscriptionService.renew_subscription(subscription):
-                    renewed_count += 1
-            except Exception as e:
-                logger.error(f'Error renewing subscription {subscription.id}: {str(e)}')
-        
-        logger.info(f'Processed {renewed_count} subscription renewals')
-        return renewed_count
     
     @staticmethod
-    def send_renewal_reminders():
-        """Envia lembretes de renovação (para ser executado via cron/celery)"""
-        # Enviar lembretes 7 dias antes
-        reminder_date = timezone.now() + timedelta(days=7)
+    def process_renewals():
+        """Processa renovações automáticas (para ser executado via cron/celery)"""
+        stats = RenewalService.run()
+        return stats['renewed']
+    
+    @staticmethod
+    def send_renewal_reminders(days=7):
+        """Enfileira lembretes de renovação (para ser executado via cron/celery)
+        
+        Os lembretes são gravados na fila de emails numa única transação e
+        enviados depois em lote; reexecutar no mesmo dia não duplica envios.
+        """
+        reminder_date = timezone.now() + timedelta(days=days)
         subscriptions_to_remind = Subscription.objects.filter(
             current_period_end__date=reminder_date.date(),
             auto_renew=True,
             status__in=['active', 'trial']
-        )
+        ).select_related('account__owner', 'plan')
         
-        sent_count = 0
-        for subscription in subscriptions_to_remind:
+        messages = []
+        for subscription in subscriptions_to_remind.iterator(chunk_size=500):
             try:
-                NotificationService.send_renewal_reminder_email(subscription, 7)
-                sent_count += 1
+                messages.append(NotificationService.build_renewal_reminder(subscription, days))
             except Exception as e:
-                logger.error(f'Error sending renewal reminder for subscription {subscription.id}: {str(e)}')
+                logger.error(f'Error building renewal reminder for subscription {subscription.id}: {str(e)}')
+        
+        with transaction.atomic():
+            queued_count = NotificationService.enqueue(messages)
+        
+        logger.info(f'Queued {queued_count} renewal reminders')
+        return queued_count
+
+INVOICE_TEMPLATE_NAME = 'invoices/invoice.html'
+
+
+@functools.lru_cache(maxsize=None)
+def _get_invoice_template():
+    """Template da fatura, compilado uma vez por processo"""
+    return get_template(INVOICE_TEMPLATE_NAME)
+
+
+def _init_render_worker():
+    from django.apps import apps
+    if not apps.ready:
+        # Processos iniciados por spawn/forkserver
+        import django
+        django.setup()
+    _get_invoice_template()
+
+
+def _render_invoice(context):
+    """Renderiza uma fatura a partir do contexto já serializado (sem acesso ao banco)
+
+    Returns:
+        tuple: (html em bytes, pdf em bytes ou None)
+    """
+    html = _get_invoice_template().render(context)
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        return html.encode(), None
+    return html.encode(), HTML(string=html).write_pdf()
+
+
+class InvoiceRenderService:
+    """Renderização das faturas em lote (HTML e, com weasyprint instalado, PDF).
+
+    O contexto de cada fatura é montado no processo principal e a
+    renderização roda num pool de processos (INVOICE_RENDER_WORKERS), cada
+    um compilando o template uma única vez. Os arquivos são gravados em
+    invoices/<hash[:2]>/<sha256>.<ext>; faturas cujo contexto não mudou
+    desde a última renderização (render_hash) não são renderizadas de novo.
+    Uma alteração no template coloca todas as faturas na fila outra vez
+    (template_hash).
+    """
+    
+    @staticmethod
+    def get_pending_queryset():
+        """Faturas nunca renderizadas, alteradas depois da última renderização
+        ou renderizadas com outra versão do template"""
+        return Invoice.objects.filter(
+            Q(rendered_at__isnull=True) | Q(updated_at__gt=F('rendered_at'))
+            | ~Q(template_hash=InvoiceRenderService.get_template_hash())
+        )
+    
+    @staticmethod
+    def build_context(invoice):
+        subscription = invoice.subscription
+        return {
+            'invoice_number': invoice.invoice_number,
+            'account_name': subscription.account.name,
+            'plan_name': subscription.plan.name,
+            'status': invoice.get_status_display(),
+            'currency': invoice.currency,
+            'subtotal': f'{invoice.subtotal:.2f}',
+            'tax_amount': f'{invoice.tax_amount:.2f}',
+            'discount_amount': f'{invoice.discount_amount:.2f}',
+            'total': f'{invoice.total:.2f}',
+            'issue_date': invoice.issue_date.strftime('%d/%m/%Y'),
+            'due_date': invoice.due_date.strftime('%d/%m/%Y'),
+            'paid_date': invoice.paid_date.strftime('%d/%m/%Y') if invoice.paid_date else '',
+            'description': invoice.description,
+            'notes': invoice.notes,
+        }
+    
+    @staticmethod
+    def get_template_hash():
+        """Impressão digital do código-fonte do template da fatura"""
+        source = getattr(_get_invoice_template().template, 'source', '')
+        return hashlib.sha256(source.encode()).hexdigest()
+    
+    @staticmethod
+    def get_render_hash(context, template_hash):
+        """Impressão digital do contexto e do template usados na renderização"""
+        payload = json.dumps(context, sort_keys=True) + template_hash
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    @staticmethod
+    def _store(content, extension):
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = f'invoices/{content_hash[:2]}/{content_hash}.{extension}'
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(content))
+        return path
+    
+    @staticmethod
+    def render_pending(queryset=None, workers=None, batch_size=None, force=False):
+        """Renderiza as faturas pendentes em lotes
+        
+        Args:
+            queryset: Faturas a considerar (padrão: get_pending_queryset())
+            workers: Processos de renderização (padrão: INVOICE_RENDER_WORKERS)
+            batch_size: Faturas por lote (padrão: INVOICE_RENDER_BATCH_SIZE)
+            force: Renderiza mesmo quando o contexto não mudou
+        
+        Returns:
+            dict: Estatísticas (renderizadas, inalteradas, tempo)
+        """
+        if queryset is None:
+            queryset = InvoiceRenderService.get_pending_queryset()
+        workers = workers or settings.INVOICE_RENDER_WORKERS
+        batch_size = batch_size or settings.INVOICE_RENDER_BATCH_SIZE
+        queryset = queryset.select_related('subscription__account', 'subscription__plan').order_by('pk')
+        
+        stats = {'rendered': 0, 'unchanged': 0}
+        started = time.monotonic()
+        template_hash = InvoiceRenderService.get_template_hash()
+        
+        executor = None
+        if workers > 1:
+            if not connection.in_atomic_block:
+                # Os processos filhos não devem herdar as conexões abertas
+                connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker)
+        
+        try:
+            last_pk = None
+            while True:
+                batch = queryset.filter(pk__gt=last_pk) if last_pk else queryset
+                batch = list(batch[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                
+                now = timezone.now()
+                to_render = []
+                unchanged = []
+                for invoice in batch:
+                    context = InvoiceRenderService.build_context(invoice)
+                    render_hash = InvoiceRenderService.get_render_hash(context, template_hash)
+                    if not force and render_hash == invoice.render_hash and invoice.html_file:
+                        unchanged.append(invoice.pk)
+                    else:
+                        to_render.append((invoice, context, render_hash))
+                
+                contexts = [context for _, context, _ in to_render]
+                if executor is not None:
+                    results = executor.map(_render_invoice, contexts, chunksize=max(1, len(contexts) // (workers * 4)))
+                else:
+                    results = map(_render_invoice, contexts)
+                
+                rendered = []
+                for (invoice, _, render_hash), (html, pdf) in zip(to_render, results):
+                    invoice.html_file = InvoiceRenderService._store(html, 'html')
+                    if pdf is not None:
+                        invoice.pdf_file = InvoiceRenderService._store(pdf, 'pdf')
+                    invoice.render_hash = render_hash
+                    invoice.template_hash = template_hash
+                    invoice.rendered_at = now
+                    rendered.append(invoice)
+                
+                # bulk_update() não altera updated_at, então as faturas saem da fila
+                Invoice.objects.bulk_update(
+                    rendered, ['html_file', 'pdf_file', 'render_hash', 'template_hash', 'rendered_at']
+                )
+                stats['rendered'] += len(rendered)
+                
+                if unchanged:
+                    Invoice.objects.filter(pk__in=unchanged).update(rendered_at=now, template_hash=template_hash)
+                    stats['unchanged'] += len(unchanged)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        stats['elapsed'] = time.monotonic() - started
+        logger.info(
+            f"Rendered {stats['rendered']} invoices ({stats['unchanged']} unchanged) "
+            f"in {stats['elapsed']:.1f}s"
+        )
+        return stats
+
+
+class RevenueRollupService:
+    """Leitura e reconstrução dos consolidados diários de receita
+    
+    Os dashboards leem no máximo um mês de linhas de RevenueRollup (mais a
+    última linha, para o MRR atual), independentemente do tamanho do
+    histórico de pagamentos.
+    """
+    
+    SUMMARY_FIELDS = (
+        'revenue', 'refunds', 'paid_count', 'failed_count',
+        'new_mrr', 'churned_mrr', 'new_subscriptions', 'churned_subscriptions',
+    )
+    
+    @staticmethod
+    def get_summary(account=None, plan=None, days=30):
+        """Totais dos últimos dias e MRR atual de uma conta ou de um plano"""
+        scope = {'account': account} if account is not None else {'plan': plan}
+        since = timezone.localdate() - timedelta(days=days - 1)
+        
+        totals = RevenueRollup.objects.filter(day__gte=since, **scope).aggregate(
+            **{field: Sum(field) for field in RevenueRollupService.SUMMARY_FIELDS}
+        )
+        summary = {field: value or 0 for field, value in totals.items()}
+        summary['mrr'] = RevenueRollup.objects.filter(**scope).order_by('-day').values_list(
+            'mrr', flat=True
+        ).first() or 0
+        return summary
+    
+    @staticmethod
+    def rebuild():
+        """Recalcula toda a tabela a partir de pagamentos e assinaturas
+        
+        O histórico de assinaturas é aproximado pelo estado atual: uma
+        assinatura conta para o MRR a partir do início (ou do fim do trial)
+        com o plano e o preço atuais; canceladas e expiradas que chegaram a
+        ter pagamento confirmado saem do MRR na data de término.
+        
+        Returns:
+            int: Linhas gravadas
+        """
+        rows = defaultdict(lambda: defaultdict(int))
+        
+        def add(day, account_id, plan_id, **deltas):
+            for scope in (('account', account_id), ('plan', plan_id)):
+                row = rows[scope + (day,)]
+                for field, value in deltas.items():
+                    row[field] += value
+        
+        paid = Payment.objects.filter(
+            paid_at__isnull=False,
+            status__in=['paid', 'refunded', 'partially_refunded']
+        ).annotate(day=TruncDate('paid_at')).values(
+            'day', 'subscription__account_id', 'subscription__plan_id'
+        ).annotate(total=Sum('amount'), count=Count('id'))
+        for item in paid:
+            add(item['day'], item['subscription__account_id'], item['subscription__plan_id'],
+                revenue=item['total'], paid_count=item['count'])
+        
+        # Cada falha incrementa attempt_count; todas são datadas pela última
+        failed = Payment.objects.filter(failed_at__isnull=False).annotate(
+            day=TruncDate('failed_at')
+        ).values('day', 'subscription__account_id', 'subscription__plan_id').annotate(
+            count=Sum(Greatest('attempt_count', Value(1)))
+        )
+        for item in failed:
+            add(item['day'], item['subscription__account_id'], item['subscription__plan_id'],
+                failed_count=item['count'])
+        
+        refunded = Payment.objects.filter(status='refunded').annotate(
+            day=TruncDate('updated_at')
+        ).values('day', 'subscription__account_id', 'subscription__plan_id').annotate(total=Sum('amount'))
+        for item in refunded:
+            add(item['day'], item['subscription__account_id'], item['subscription__plan_id'],
+                refunds=item['total'])
+        
+        ever_paid = set(
+            Payment.objects.filter(paid_at__isnull=False).values_list('subscription_id', flat=True).distinct()
+        )
+        subscriptions = Subscription.objects.filter(
+            status__in=RevenueRollup.MRR_STATUSES + ('canceled', 'expired', 'suspended')
+        ).values_list(
+            'id', 'account_id', 'plan_id', 'plan__billing_cycle', 'status', 'price_snapshot',
+            'started_at', 'trial_ends_at', 'canceled_at', 'ends_at', 'updated_at'
+        )
+        for (subscription_id, account_id, plan_id, billing_cycle, status, price,
+                started_at, trial_ends_at, canceled_at, ends_at, updated_at) in subscriptions.iterator():
+            is_counted = status in RevenueRollup.MRR_STATUSES
+            if not is_counted and subscription_id not in ever_paid:
+                continue
+            
+            mrr = RevenueRollup.monthly_amount(price, billing_cycle)
+            activated_at = trial_ends_at if trial_ends_at and trial_ends_at > started_at else started_at
+            add(timezone.localdate(activated_at), account_id, plan_id,
+                mrr=mrr, new_mrr=mrr, new_subscriptions=1)
+            if not is_counted:
+                churned_at = ends_at or canceled_at or updated_at
+                add(timezone.localdate(max(churned_at, activated_at)), account_id, plan_id,
+                    mrr=-mrr, churned_mrr=mrr, churned_subscriptions=1)
+        
+        # mrr de cada linha é o acumulado até o dia (MRR ao fim do dia)
+        objects = []
+        running = defaultdict(Decimal)
+        for scope, scope_id, day in sorted(rows, key=lambda key: (key[0], str(key[1]), key[2])):
+            if scope_id is None:
+                continue
+            values = rows[(scope, scope_id, day)]
+            running[(scope, scope_id)] += values.pop('mrr', 0)
+            objects.append(RevenueRollup(
+                day=day,
+                mrr=running[(scope, scope_id)],
+                **{f'{scope}_id': scope_id},
+                **values
+            ))
+        
+        with transaction.atomic():
+            RevenueRollup.objects.all().delete()
+            RevenueRollup.objects.bulk_create(objects, batch_size=1000)
         
-        logger.info(f'Sent {sent_count} renewal reminders')
-        return sent_count
\ No newline at end of file
+        logger.info(f'Rebuilt {len(objects)} revenue rollup rows')
+        return len(objects)
@@ -0,0 +1,21 @@
+from celery import shared_task
+
+from .services import InvoiceRenderService, NotificationService, StripeWebhookService
+
+
+@shared_task
+def render_invoices(force=False):
+    """Renderiza as faturas novas ou alteradas"""
+    return InvoiceRenderService.render_pending(force=force)
+
+
+@shared_task
+def send_outbox_emails():
+    """Envia os emails pendentes da fila de notificações"""
+    return NotificationService.drain_outbox()
+
+
+@shared_task
+def process_webhook_events():
+    """Processa os eventos do Stripe pendentes"""
+    return StripeWebhookService.process_pending()
@@ -14,4 +14,7 @@ urlpatterns = [
     # Subscription API endpoints
     path('api/create-subscription/', views.create_subscription, name='create_subscription'),
     path('api/cancel-subscription/', views.cancel_subscription, name='cancel_subscription'),
+    
+    # Faturas
+    path('invoices/<uuid:invoice_id>/download/', views.invoice_download, name='invoice_download'),
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
@@ -18,7 +18,9 @@ from decimal import Decimal
 
 from .models import Plan, Subscription, Payment, Invoice
 from accounts.models import Account
+from accounts.tenant import get_current_tenant
 from permissions.decorators import user_has_permission
+from .services import InvoiceRenderService, StripeWebhookService
 
 # Configure Stripe
 stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', '')
@@ -26,7 +28,12 @@ logger = logging.getLogger(__name__)
 
 
 class StripeWebhookView(View):
-    """View para processar webhooks do Stripe"""
+    """View para receber webhooks do Stripe
+    
+    Apenas verifica a assinatura, grava o evento (uma vez por event_id) e
+    responde 200; o processamento é feito por StripeWebhookService em
+    background, na ordem dos eventos de cada assinatura.
+    """
     
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
@@ -38,9 +45,10 @@ class StripeWebhookView(View):
         endpoint_secret = getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
         
         try:
-            event = stripe.Webhook.construct_event(
+            stripe.Webhook.construct_event(
                 payload, sig_header, endpoint_secret
             )
+            event = json.loads(payload)
         except ValueError:
             logger.error('Invalid payload in Stripe webhook')
             return HttpResponse(status=400)
@@ -48,77 +56,13 @@ class StripeWebhookView(View):
             logger.error('Invalid signature in Stripe webhook')
             return HttpResponse(status=400)
         
-        # Handle the event
-        if event['type'] == 'payment_intent.succeeded':
-            self._handle_payment_succeeded(event['data']['object'])
-        elif event['type'] == 'payment_intent.payment_failed':
-            self._handle_payment_failed(event['data']['object'])
-        elif event['type'] == 'invoice.payment_succeeded':
-            self._handle_invoice_payment_succeeded(event['data']['object'])
-        elif event['type'] == 'invoice.payment_failed':
-            self._handle_invoice_payment_failed(event['data']['object'])
-        elif event['type'] == 'customer.subscription.updated':
-            self._handle_subscription_updated(event['data']['object'])
-        elif event['type'] == 'customer.subscription.deleted':
-            self._handle_subscription_deleted(event['data']['object'])
+        webhook_event, created = StripeWebhookService.ingest(event)
+        if created:
+            StripeWebhookService.schedule_processing()
         else:
-            logger.info(f'Unhandled Stripe event type: {event["type"]}')
+            logger.info(f'Duplicate Stripe event {webhook_event.event_id} ignored')
         
         return HttpResponse(status=200)
-    
-    def _handle_payment_succeeded(self, payment_intent):
-        """Processa pagamento bem-sucedido"""
-        try:
-            payment = Payment.objects.get(
-                gateway_transaction_id=payment_intent['id']
-            )
-            payment.mark_as_paid()
-            payment.gateway_response = payment_intent
-            payment.save()
-            
-            # Atualizar assinatura se necessário
-            if payment.subscription.status in ['past_due', 'trial']:
-                payment.subscription.status = 'active'
-                payment.subscription.save()
-                
-            logger.info(f'Payment {payment.id} marked as paid')
-        except Payment.DoesNotExist:
-            logger.error(f'Payment not found for transaction {payment_intent["id"]}')
-    
-    def _handle_payment_failed(self, payment_intent):
-        """Processa falha no pagamento"""
-        try:
-            payment = Payment.objects.get(
-                gateway_transaction_id=payment_intent['id']
-            )
-            failure_reason = payment_intent.get('last_payment_error', {}).get('message', 'Unknown error')
-            payment.mark_as_failed(failure_reason)
-            payment.gateway_response = payment_intent
-            payment.save()
-            
-            logger.info(f'Payment {payment.id} marked as failed: {failure_reason}')
-        except Payment.DoesNotExist:
-            logger.error(f'Payment not found for transaction {payment_intent["id"]}')
-    
-    def _handle_invoice_payment_succeeded(self, invoice):
-        """Processa pagamento de fatura bem-sucedido"""
-        # Implementar lógica específica para faturas
-        pass
-    
-    def _handle_invoice_payment_failed(self, invoice):
-        """Processa falha no pagamento de fatura"""
-        # Implementar lógica específica para faturas
-        pass
-    
-    def _handle_subscription_updated(self, subscription):
-        """Processa atualização de assinatura"""
-        # Implementar lógica de sincronização de assinatura
-        pass
-    
-    def _handle_subscription_deleted(self, subscription):
-        """Processa cancelamento de assinatura"""
-        # Implementar lógica de cancelamento
-        pass
 
 
 @api_view(['POST'])
@@ -367,3 +311,34 @@ def cancel_subscription(request):
             {'error': 'Failed to cancel subscription'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@login_required
+def invoice_download(request, invoice_id):
+    """Download da fatura renderizada (PDF quando disponível, senão HTML)"""
+    invoice = get_object_or_404(
+        Invoice.objects.select_related('subscription__account'),
+        id=invoice_id
+    )
+    if not get_current_tenant(request).is_member(invoice.subscription.account):
+        raise Http404('Fatura não encontrada')
+    
+    # Faturas ainda não processadas pelo lote são renderizadas na hora
+    if InvoiceRenderService.get_pending_queryset().filter(pk=invoice.pk).exists():
+        InvoiceRenderService.render_pending(
+            queryset=Invoice.objects.filter(pk=invoice.pk), workers=1
+        )
+        invoice.refresh_from_db()
+    
+    if invoice.pdf_file:
+        document, extension = invoice.pdf_file, 'pdf'
+    elif invoice.html_file:
+        document, extension = invoice.html_file, 'html'
+    else:
+        raise Http404('Fatura não encontrada')
+    
+    return FileResponse(
+        document.open('rb'),
+        as_attachment=request.GET.get('download') == '1',
+        filename=f'fatura-{invoice.invoice_number}.{extension}'
+    )
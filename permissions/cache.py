@@ -0,0 +1,249 @@
+"""
+Snapshot compilado das permissões efetivas de um usuário.
+
+O snapshot de cada par (usuário, conta) é montado uma única vez a partir de
+UserRole -> Role (e seus ancestrais, via RoleHierarchy) -> RolePermission e
+dos overrides de UserPermission
+(concessões e negações) e fica guardado no cache. A partir daí, cada
+verificação de permissão ou função é apenas uma busca em conjunto.
+
+A invalidação é feita por versões (ver permissions/signals.py):
+- versão global: muda quando Permission, Role ou RolePermission mudam;
+- versão do usuário: muda quando UserRole ou UserPermission do usuário mudam.
+"""
+import time
+
+from app_project.cache import hot_cache as cache
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+
+SNAPSHOT_TIMEOUT = 60 * 15
+
+GLOBAL_VERSION_KEY = 'permissions:version'
+USER_VERSION_KEY = 'permissions:user:{user_id}:version'
+SNAPSHOT_KEY = 'permissions:snapshot:{global_version}:{user_version}:{user_id}:{account_id}'
+PERMISSION_NAMES_KEY = 'permissions:names:{global_version}'
+
+
+class PermissionSnapshot:
+    """Conjunto imutável de permissões e funções efetivas de um usuário."""
+
+    def __init__(self, permissions=(), roles=()):
+        self.permissions = frozenset(permissions)
+        self.roles = frozenset(roles)
+
+    def has_permission(self, codename):
+        return codename in self.permissions
+
+    def has_role(self, codename):
+        return codename in self.roles
+
+
+EMPTY_SNAPSHOT = PermissionSnapshot()
+
+
+def _new_version():
+    # Versões baseadas no relógio evitam reaproveitar snapshots antigos caso a
+    # chave de versão seja removida do cache.
+    return int(time.time() * 1000)
+
+
+def _init_version(key):
+    version = _new_version()
+    if not cache.add(key, version, None):
+        version = cache.get(key, version)
+    return version
+
+
+def _get_versions(user_id):
+    user_key = USER_VERSION_KEY.format(user_id=user_id)
+    versions = cache.get_many([GLOBAL_VERSION_KEY, user_key])
+
+    global_version = versions.get(GLOBAL_VERSION_KEY)
+    if global_version is None:
+        global_version = _init_version(GLOBAL_VERSION_KEY)
+
+    user_version = versions.get(user_key)
+    if user_version is None:
+        user_version = _init_version(user_key)
+
+    return global_version, user_version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+    except DatabaseError:
+        # Com DatabaseCache a tabela de cache ainda pode não existir (por
+        # exemplo, durante o post_migrate); nesse caso não há snapshot a
+        # invalidar.
+        pass
+
+
+def _invalidate(key):
+    # A versão é incrementada imediatamente (leituras na mesma transação) e de
+    # novo após o commit, descartando snapshots compilados por outras
+    # requisições antes de as alterações ficarem visíveis.
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
+
+
+def invalidate_all_permissions():
+    """Invalida os snapshots de todos os usuários."""
+    _invalidate(GLOBAL_VERSION_KEY)
+
+
+def invalidate_user_permissions(user_id):
+    """Invalida os snapshots de um usuário em todas as contas."""
+    if user_id is not None:
+        _invalidate(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def _is_valid(valid_from, valid_until, now):
+    if valid_from and now < valid_from:
+        return False
+    if valid_until and now > valid_until:
+        return False
+    return True
+
+
+def _next_boundary(boundary, valid_from, valid_until, now):
+    """Retorna o próximo instante em que a validade de uma atribuição muda."""
+    for moment in (valid_from, valid_until):
+        if moment and moment > now and (boundary is None or moment < boundary):
+            boundary = moment
+    return boundary
+
+
+def compile_permission_snapshot(user, account=None):
+    """
+    Monta o snapshot de permissões do usuário consultando o banco.
+
+    Returns:
+        tuple: (PermissionSnapshot, segundos até a próxima mudança de validade
+        ou None)
+    """
+    from .models import RolePermission, UserPermission, UserRole
+
+    now = timezone.now()
+    boundary = None
+
+    user_roles = UserRole.objects.filter(
+        user=user,
+        status='active',
+        role__is_active=True
+    )
+    if account is not None:
+        user_roles = user_roles.filter(account=account)
+
+    role_ids = set()
+    roles = set()
+    for role_id, role_codename, valid_from, valid_until in user_roles.values_list(
+        'role_id', 'role__codename', 'valid_from', 'valid_until'
+    ):
+        boundary = _next_boundary(boundary, valid_from, valid_until, now)
+        if _is_valid(valid_from, valid_until, now):
+            role_ids.add(role_id)
+            roles.add(role_codename)
+
+    permissions = set()
+    if role_ids:
+        # Uma única junção com o fecho de RoleHierarchy resolve as permissões
+        # herdadas das funções pai em qualquer profundidade.
+        permissions.update(
+            RolePermission.objects.filter(
+                role__descendant_links__descendant_id__in=role_ids,
+                is_active=True,
+                permission__is_active=True
+            ).values_list('permission__codename', flat=True)
+        )
+
+    user_permissions = UserPermission.objects.filter(
+        user=user,
+        is_active=True,
+        permission__is_active=True
+    )
+    if account is not None:
+        user_permissions = user_permissions.filter(account=account)
+
+    denied = set()
+    for codename, grant_type, valid_from, valid_until in user_permissions.values_list(
+        'permission__codename', 'grant_type', 'valid_from', 'valid_until'
+    ):
+        boundary = _next_boundary(boundary, valid_from, valid_until, now)
+        if not _is_valid(valid_from, valid_until, now):
+            continue
+        if grant_type == 'deny':
+            denied.add(codename)
+        else:
+            permissions.add(codename)
+
+    # Negações explícitas sempre prevalecem
+    permissions -= denied
+
+    timeout = None
+    if boundary is not None:
+        timeout = max(1, int((boundary - now).total_seconds()) + 1)
+
+    return PermissionSnapshot(permissions, roles), timeout
+
+
+def get_permission_snapshot(user, account=None):
+    """
+    Obtém o snapshot de permissões efetivas do usuário, usando o cache.
+
+    Args:
+        user: Instância do usuário
+        account: Instância ou ID da conta (opcional)
+
+    Returns:
+        PermissionSnapshot: Permissões e funções efetivas
+    """
+    if user is None or not getattr(user, 'is_authenticated', False) or user.pk is None:
+        return EMPTY_SNAPSHOT
+
+    account_id = getattr(account, 'pk', account)
+    global_version, user_version = _get_versions(user.pk)
+    key = SNAPSHOT_KEY.format(
+        global_version=global_version,
+        user_version=user_version,
+        user_id=user.pk,
+        account_id=account_id if account_id is not None else 'all',
+    )
+
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot, timeout = compile_permission_snapshot(user, account_id)
+        if timeout is None or timeout > SNAPSHOT_TIMEOUT:
+            timeout = SNAPSHOT_TIMEOUT
+        cache.set(key, snapshot, timeout)
+
+    return snapshot
+
+
+def get_permission_names():
+    """
+    Retorna um dicionário {codename: nome} com as permissões ativas.
+    """
+    from .models import Permission
+
+    global_version = cache.get(GLOBAL_VERSION_KEY)
+    if global_version is None:
+        global_version = _init_version(GLOBAL_VERSION_KEY)
+
+    key = PERMISSION_NAMES_KEY.format(global_version=global_version)
+    names = cache.get(key)
+    if names is None:
+        names = dict(
+            Permission.objects.filter(is_active=True).values_list('codename', 'name')
+        )
+        cache.set(key, names, SNAPSHOT_TIMEOUT)
+    return names
+
+
+def get_permission_name(codename):
+    """Retorna o nome de uma permissão ativa ou None se ela não existir."""
+    return get_permission_names().get(codename)
@@ -1,10 +1,43 @@
 from functools import wraps
-from django.http import JsonResponse
-from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, redirect
-from .models import Permission, UserPermission, UserRole
+from django.shortcuts import redirect
+from .cache import get_permission_name, get_permission_snapshot
+from .models import Permission
 from accounts.models import Account
+from accounts.tenant import get_current_tenant
+
+
+def _get_member_account(request, account_id):
+    """
+    Conta informada (ou a atual do tenant) em que o usuário é membro ativo,
+    ou None. Uma conta inexistente continua resultando em 404.
+    """
+    account = get_current_tenant(request).get_account(account_id)
+    if account is None and account_id:
+        # Só consulta o banco quando o usuário não é membro da conta
+        try:
+            exists = Account.objects.filter(pk=account_id).exists()
+        except (ValidationError, ValueError):
+            exists = False
+        if not exists:
+            raise Http404("Conta não encontrada")
+    return account
+
+
+def _get_request_account(request, kwargs):
+    """
+    Conta da requisição (account_id da URL/querystring ou a conta atual do
+    tenant) em que o usuário é membro ativo.
+    """
+    account_id = kwargs.get('account_id') or request.GET.get('account_id')
+    if not account_id and get_current_tenant(request).account is None:
+        raise PermissionDenied("Conta não especificada")
+    account = _get_member_account(request, account_id)
+    if account is None:
+        raise PermissionDenied("Usuário não tem acesso a esta conta")
+    return account
 
 
 def admin_required(view_func):
@@ -58,44 +91,28 @@ def permission_required(permission_codename, account_required=True):
                 return view_func(request, *args, **kwargs)
             
             # Verificar se a permissão existe
-            try:
-                permission = Permission.objects.get(codename=permission_codename, is_active=True)
-            except Permission.DoesNotExist:
+            permission_name = get_permission_name(permission_codename)
+            if permission_name is None:
                 raise PermissionDenied(f"Permissão '{permission_codename}' não encontrada")
             
             # Se account_required, verificar no contexto da conta
             if account_required:
-                account_id = kwargs.get('account_id') or request.GET.get('account_id')
-                if not account_id:
-                    # Tentar obter da sessão ou primeira conta do usuário
-                    account_id = request.session.get('current_account_id')
-                    if not account_id:
-                        membership = user.account_memberships.first()
-                        if membership:
-                            account_id = membership.account.id
-                
-                if not account_id:
-                    raise PermissionDenied("Conta não especificada")
-                
-                account = get_object_or_404(Account, id=account_id)
-                
-                # Verificar se o usuário tem acesso à conta
-                if not user.account_memberships.filter(account=account).exists():
-                    raise PermissionDenied("Usuário não tem acesso a esta conta")
+                # Conta informada ou a atual (sessão ou primeira conta do usuário)
+                account = _get_request_account(request, kwargs)
                 
                 # Verificar permissão no contexto da conta
-                has_permission = user_has_permission(user, permission, account)
+                has_permission = user_has_permission(user, permission_codename, account)
             else:
                 # Verificar permissão global
-                has_permission = user_has_permission(user, permission)
+                has_permission = user_has_permission(user, permission_codename)
             
             if not has_permission:
                 if request.headers.get('Content-Type') == 'application/json' or request.path.startswith('/api/'):
                     return JsonResponse(
-                        {'error': f"Permissão '{permission.name}' necessária"},
+                        {'error': f"Permissão '{permission_name}' necessária"},
                         status=403
                     )
-                raise PermissionDenied(f"Permissão '{permission.name}' necessária")
+                raise PermissionDenied(f"Permissão '{permission_name}' necessária")
             
             return view_func(request, *args, **kwargs)
         return _wrapped_view
@@ -122,23 +139,8 @@ def role_required(role_codename, account_required=True):
             
             # Se account_required, verificar no contexto da conta
             if account_required:
-                account_id = kwargs.get('account_id') or request.GET.get('account_id')
-                if not account_id:
-                    # Tentar obter da sessão ou primeira conta do usuário
-                    account_id = request.session.get('current_account_id')
-                    if not account_id:
-                        membership = user.account_memberships.first()
-                        if membership:
-                            account_id = membership.account.id
-                
-                if not account_id:
-                    raise PermissionDenied("Conta não especificada")
-                
-                account = get_object_or_404(Account, id=account_id)
-                
-                # Verificar se o usuário tem acesso à conta
-                if not user.account_memberships.filter(account=account).exists():
-                    raise PermissionDenied("Usuário não tem acesso a esta conta")
+                # Conta informada ou a atual (sessão ou primeira conta do usuário)
+                account = _get_request_account(request, kwargs)
                 
                 # Verificar função no contexto da conta
                 has_role = user_has_role(user, role_codename, account)
@@ -162,6 +164,9 @@ def role_required(role_codename, account_required=True):
 def account_member_required(view_func):
     """
     Decorator para verificar se o usuário é membro da conta especificada.
+    
+    Apenas memberships ativas dão acesso (pendentes, inativas ou suspensas
+    recebem 403); uma conta inexistente resulta em 404.
     """
     @wraps(view_func)
     @login_required
@@ -179,10 +184,9 @@ def account_member_required(view_func):
         if not account_id:
             raise PermissionDenied("Conta não especificada")
         
-        account = get_object_or_404(Account, id=account_id)
-        
-        # Verificar se o usuário é membro da conta
-        if not user.account_memberships.filter(account=account).exists():
+        # Verificar se o usuário é membro ativo da conta
+        account = _get_member_account(request, account_id)
+        if account is None:
             if request.headers.get('Content-Type') == 'application/json' or request.path.startswith('/api/'):
                 return JsonResponse(
                     {'error': 'Usuário não é membro desta conta'},
@@ -201,6 +205,9 @@ def user_has_permission(user, permission, account=None):
     """
     Verifica se um usuário tem uma permissão específica.
     
+    A verificação é feita sobre o snapshot compilado de permissões do usuário
+    (ver permissions/cache.py), sem consultas ao banco quando ele está em cache.
+    
     Args:
         user: Instância do usuário
         permission: Instância da permissão ou código da permissão
@@ -212,37 +219,8 @@ def user_has_permission(user, permission, account=None):
     if user.is_superuser:
         return True
     
-    if isinstance(permission, str):
-        try:
-            permission = Permission.objects.get(codename=permission, is_active=True)
-        except Permission.DoesNotExist:
-            return False
-    
-    # Verificar permissão direta do usuário
-    user_permission_query = UserPermission.objects.filter(
-        user=user,
-        permission=permission,
-        is_active=True
-    )
-    
-    if account:
-        user_permission_query = user_permission_query.filter(account=account)
-    
-    if user_permission_query.exists():
-        return True
-    
-    # Verificar permissão através de funções
-    user_roles_query = UserRole.objects.filter(
-        user=user,
-        is_active=True,
-        role__is_active=True,
-        role__permissions=permission
-    )
-    
-    if account:
-        user_roles_query = user_roles_query.filter(account=account)
-    
-    return user_roles_query.exists()
+    codename = permission if isinstance(permission, str) else permission.codename
+    return get_permission_snapshot(user, account).has_permission(codename)
 
 
 def user_has_role(user, role_codename, account=None):
@@ -260,17 +238,7 @@ def user_has_role(user, role_codename, account=None):
     if user.is_superuser:
         return True
     
-    user_roles_query = UserRole.objects.filter(
-        user=user,
-        role__codename=role_codename,
-        role__is_active=True,
-        is_active=True
-    )
-    
-    if account:
-        user_roles_query = user_roles_query.filter(account=account)
-    
-    return user_roles_query.exists()
+    return get_permission_snapshot(user, account).has_role(role_codename)
 
 
 def get_user_permissions(user, account=None):
@@ -287,31 +255,8 @@ def get_user_permissions(user, account=None):
     if user.is_superuser:
         return Permission.objects.filter(is_active=True)
     
-    # Permissões diretas
-    direct_permissions_query = Permission.objects.filter(
-        user_permissions__user=user,
-        user_permissions__is_active=True,
-        is_active=True
-    )
-    
-    # Permissões através de funções
-    role_permissions_query = Permission.objects.filter(
-        roles__user_roles__user=user,
-        roles__user_roles__is_active=True,
-        roles__is_active=True,
-        is_active=True
-    )
-    
-    if account:
-        direct_permissions_query = direct_permissions_query.filter(
-            user_permissions__account=account
-        )
-        role_permissions_query = role_permissions_query.filter(
-            roles__user_roles__account=account
-        )
-    
-    # Combinar as duas consultas
-    return (direct_permissions_query | role_permissions_query).distinct()
+    snapshot = get_permission_snapshot(user, account)
+    return Permission.objects.filter(codename__in=snapshot.permissions, is_active=True)
 
 
 def get_user_roles(user, account=None):
@@ -330,15 +275,5 @@ def get_user_roles(user, account=None):
     if user.is_superuser:
         return Role.objects.filter(is_active=True)
     
-    user_roles_query = Role.objects.filter(
-        user_roles__user=user,
-        user_roles__is_active=True,
-        is_active=True
-    )
-    
-    if account:
-        user_roles_query = user_roles_query.filter(
-            user_roles__account=account
-        )
-    
-    return user_roles_query.distinct()
\ No newline at end of file
+    snapshot = get_permission_snapshot(user, account)
+    return Role.objects.filter(codename__in=snapshot.roles, is_active=True)
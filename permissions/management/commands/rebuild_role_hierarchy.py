@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from permissions.cache import invalidate_all_permissions
+from permissions.models import RoleHierarchy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the role hierarchy closure table from Role.parent_role'
+
+    def handle(self, *args, **options):
+        RoleHierarchy.objects.rebuild()
+        invalidate_all_permissions()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Role hierarchy rebuilt: {RoleHierarchy.objects.count()} links.')
+        )
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:04
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def build_role_hierarchy(apps, schema_editor):
+    Role = apps.get_model('permissions', 'Role')
+    RoleHierarchy = apps.get_model('permissions', 'RoleHierarchy')
+
+    parents = dict(Role.objects.values_list('id', 'parent_role_id'))
+    links = []
+    for role_id in parents:
+        ancestor_id, depth, seen = role_id, 0, set()
+        while ancestor_id and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(RoleHierarchy(ancestor_id=ancestor_id, descendant_id=role_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+
+    RoleHierarchy.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('permissions', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleHierarchy',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('depth', models.PositiveIntegerField(default=0, verbose_name='Profundidade')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='permissions.role', verbose_name='Ancestral')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='permissions.role', verbose_name='Descendente')),
+            ],
+            options={
+                'verbose_name': 'Hierarquia de Funções',
+                'verbose_name_plural': 'Hierarquias de Funções',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='permissions_descend_d49b0d_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_role_hierarchy, migrations.RunPython.noop),
+    ]
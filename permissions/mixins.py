@@ -2,8 +2,7 @@ from django.core.exceptions import PermissionDenied
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse
 from .decorators import user_has_permission, user_has_role, get_user_permissions
-from .models import Permission
-from accounts.models import Account
+from accounts.tenant import get_current_tenant
 
 
 class PermissionRequiredMixin(LoginRequiredMixin):
@@ -32,15 +31,6 @@ class PermissionRequiredMixin(LoginRequiredMixin):
         if user.is_superuser:
             return True
         
-        # Verificar se a permissão existe
-        try:
-            permission = Permission.objects.get(
-                codename=self.permission_required, 
-                is_active=True
-            )
-        except Permission.DoesNotExist:
-            return False
-        
         # Se account_required, verificar no contexto da conta
         if self.account_required:
             account = self.get_account()
@@ -48,36 +38,20 @@ class PermissionRequiredMixin(LoginRequiredMixin):
                 return False
             
             # Verificar se o usuário tem acesso à conta
-            if not user.account_memberships.filter(account=account, status='active').exists():
+            if not get_current_tenant(self.request).is_member(account):
                 return False
             
-            return user_has_permission(user, permission, account)
+            return user_has_permission(user, self.permission_required, account)
         else:
-            return user_has_permission(user, permission)
+            return user_has_permission(user, self.permission_required)
     
     def get_account(self):
         """
-        Obtém a conta do contexto da requisição.
+        Obtém a conta do contexto da requisição (informada, da sessão ou a
+        primeira conta do usuário), desde que ele seja membro ativo dela.
         """
-        account_id = (
-            self.kwargs.get('account_id') or 
-            self.request.GET.get('account_id') or
-            self.request.session.get('current_account_id')
-        )
-        
-        if not account_id:
-            # Tentar obter da primeira conta do usuário
-            membership = self.request.user.account_memberships.first()
-            if membership:
-                account_id = membership.account.id
-        
-        if account_id:
-            try:
-                return Account.objects.get(id=account_id)
-            except Account.DoesNotExist:
-                pass
-        
-        return None
+        account_id = self.kwargs.get('account_id') or self.request.GET.get('account_id')
+        return get_current_tenant(self.request).get_account(account_id)
     
     def handle_no_permission(self):
         """
@@ -128,7 +102,7 @@ class RoleRequiredMixin(LoginRequiredMixin):
                 return False
             
             # Verificar se o usuário tem acesso à conta
-            if not user.account_memberships.filter(account=account, status='active').exists():
+            if not get_current_tenant(self.request).is_member(account):
                 return False
             
             return user_has_role(user, self.role_required, account)
@@ -137,27 +111,11 @@ class RoleRequiredMixin(LoginRequiredMixin):
     
     def get_account(self):
         """
-        Obtém a conta do contexto da requisição.
+        Obtém a conta do contexto da requisição (informada, da sessão ou a
+        primeira conta do usuário), desde que ele seja membro ativo dela.
         """
-        account_id = (
-            self.kwargs.get('account_id') or 
-            self.request.GET.get('account_id') or
-            self.request.session.get('current_account_id')
-        )
-        
-        if not account_id:
-            # Tentar obter da primeira conta do usuário
-            membership = self.request.user.account_memberships.first()
-            if membership:
-                account_id = membership.account.id
-        
-        if account_id:
-            try:
-                return Account.objects.get(id=account_id)
-            except Account.DoesNotExist:
-                pass
-        
-        return None
+        account_id = self.kwargs.get('account_id') or self.request.GET.get('account_id')
+        return get_current_tenant(self.request).get_account(account_id)
     
     def handle_no_permission(self):
         """
@@ -201,10 +159,7 @@ class AccountMemberRequiredMixin(LoginRequiredMixin):
             return False
         
         # Verificar se o usuário é membro da conta
-        is_member = user.account_memberships.filter(
-            account=account, 
-            is_active=True
-        ).exists()
+        is_member = get_current_tenant(self.request).is_member(account)
         
         if is_member:
             # Adicionar a conta ao request para uso posterior
@@ -223,10 +178,7 @@ class AccountMemberRequiredMixin(LoginRequiredMixin):
         )
         
         if account_id:
-            try:
-                return Account.objects.get(id=account_id)
-            except Account.DoesNotExist:
-                pass
+            return get_current_tenant(self.request).get_account(account_id)
         
         return None
     
@@ -280,21 +232,14 @@ class MultiplePermissionsRequiredMixin(LoginRequiredMixin):
                 return False
             
             # Verificar se o usuário tem acesso à conta
-            if not user.account_memberships.filter(account=account, status='active').exists():
+            if not get_current_tenant(self.request).is_member(account):
                 return False
         
         # Verificar permissões
-        permissions_check = []
-        for permission_codename in self.permissions_required:
-            try:
-                permission = Permission.objects.get(
-                    codename=permission_codename, 
-                    is_active=True
-                )
-                has_perm = user_has_permission(user, permission, account)
-                permissions_check.append(has_perm)
-            except Permission.DoesNotExist:
-                permissions_check.append(False)
+        permissions_check = [
+            user_has_permission(user, permission_codename, account)
+            for permission_codename in self.permissions_required
+        ]
         
         # Aplicar operador lógico
         if self.permissions_operator == 'OR':
@@ -304,27 +249,11 @@ class MultiplePermissionsRequiredMixin(LoginRequiredMixin):
     
     def get_account(self):
         """
-        Obtém a conta do contexto da requisição.
+        Obtém a conta do contexto da requisição (informada, da sessão ou a
+        primeira conta do usuário), desde que ele seja membro ativo dela.
         """
-        account_id = (
-            self.kwargs.get('account_id') or 
-            self.request.GET.get('account_id') or
-            self.request.session.get('current_account_id')
-        )
-        
-        if not account_id:
-            # Tentar obter da primeira conta do usuário
-            membership = self.request.user.account_memberships.first()
-            if membership:
-                account_id = membership.account.id
-        
-        if account_id:
-            try:
-                return Account.objects.get(id=account_id)
-            except Account.DoesNotExist:
-                pass
-        
-        return None
+        account_id = self.kwargs.get('account_id') or self.request.GET.get('account_id')
+        return get_current_tenant(self.request).get_account(account_id)
     
     def handle_no_permission(self):
         """
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 import uuid
@@ -155,19 +156,47 @@ class Role(models.Model):
         return self.name
     
     def get_all_permissions(self):
-        """Retorna todas as permissões da função, incluindo as herdadas"""
-        permissions = set(self.permissions.filter(is_active=True))
+        """
+        Retorna todas as permissões da função, incluindo as herdadas.
         
-        # Adiciona permissões da função pai
-        if self.parent_role:
-            permissions.update(self.parent_role.get_all_permissions())
-        
-        return permissions
+        Usa o fecho transitivo de RoleHierarchy, resolvendo a herança em
+        qualquer profundidade com uma única consulta.
+        """
+        return Permission.objects.filter(
+            is_active=True,
+            rolepermission__is_active=True,
+            rolepermission__role__descendant_links__descendant=self
+        ).distinct()
     
     def has_permission(self, permission_codename):
         """Verifica se a função tem uma permissão específica"""
         return self.get_all_permissions().filter(codename=permission_codename).exists()
     
+    def get_ancestors(self):
+        """Retorna as funções ancestrais, da mais próxima para a mais distante"""
+        return Role.objects.filter(
+            descendant_links__descendant=self,
+            descendant_links__depth__gt=0
+        ).order_by('descendant_links__depth')
+    
+    def get_descendants(self):
+        """Retorna as funções descendentes em qualquer profundidade"""
+        return Role.objects.filter(
+            ancestor_links__ancestor=self,
+            ancestor_links__depth__gt=0
+        ).order_by('ancestor_links__depth')
+    
+    def clean(self):
+        super().clean()
+        if self.parent_role_id and self.pk and (
+            self.parent_role_id == self.pk or
+            RoleHierarchy.objects.filter(
+                ancestor_id=self.pk,
+                descendant_id=self.parent_role_id
+            ).exists()
+        ):
+            raise ValidationError({'parent_role': 'A função pai não pode ser a própria função ou uma descendente.'})
+    
     def save(self, *args, **kwargs):
         # Gera codename automaticamente se não fornecido
         if not self.codename:
@@ -176,7 +205,110 @@ class Role(models.Model):
                 self.codename = f'{self.account.slug}_{base_codename}'
             else:
                 self.codename = base_codename
-        super().save(*args, **kwargs)
+        
+        adding = self._state.adding
+        previous_parent_id = None
+        if not adding:
+            previous_parent_id = Role.objects.filter(pk=self.pk).values_list(
+                'parent_role_id', flat=True
+            ).first()
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                RoleHierarchy.objects.attach(self)
+            elif previous_parent_id != self.parent_role_id:
+                RoleHierarchy.objects.move(self)
+
+
+class RoleHierarchyManager(models.Manager):
+    """Mantém o fecho transitivo da hierarquia de funções"""
+    
+    def attach(self, role):
+        """Insere os vínculos de uma função recém-criada (sem descendentes)"""
+        links = [self.model(ancestor=role, descendant=role, depth=0)]
+        if role.parent_role_id:
+            links.extend(
+                self.model(ancestor_id=ancestor_id, descendant=role, depth=depth + 1)
+                for ancestor_id, depth in self.filter(
+                    descendant_id=role.parent_role_id
+                ).values_list('ancestor_id', 'depth')
+            )
+        self.bulk_create(links)
+    
+    def move(self, role):
+        """Atualiza os vínculos da subárvore de uma função cujo pai mudou"""
+        subtree = list(self.filter(ancestor=role).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        
+        if role.parent_role_id in subtree_ids:
+            raise ValidationError({'parent_role': 'A função pai não pode ser a própria função ou uma descendente.'})
+        
+        # Remove os vínculos da subárvore com os antigos ancestrais
+        self.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        
+        if not role.parent_role_id:
+            return
+        
+        ancestors = list(self.filter(descendant_id=role.parent_role_id).values_list('ancestor_id', 'depth'))
+        self.bulk_create([
+            self.model(
+                ancestor_id=ancestor_id,
+                descendant_id=descendant_id,
+                depth=ancestor_depth + descendant_depth + 1
+            )
+            for ancestor_id, ancestor_depth in ancestors
+            for descendant_id, descendant_depth in subtree
+        ])
+    
+    def rebuild(self):
+        """Reconstrói o fecho transitivo completo a partir de Role.parent_role"""
+        parents = dict(Role.objects.values_list('id', 'parent_role_id'))
+        links = []
+        for role_id in parents:
+            ancestor_id, depth, seen = role_id, 0, set()
+            while ancestor_id and ancestor_id not in seen:
+                seen.add(ancestor_id)
+                links.append(self.model(ancestor_id=ancestor_id, descendant_id=role_id, depth=depth))
+                ancestor_id, depth = parents.get(ancestor_id), depth + 1
+        
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(links, batch_size=1000)
+
+
+class RoleHierarchy(models.Model):
+    """Fecho transitivo da hierarquia de funções (Role.parent_role)"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ancestor = models.ForeignKey(
+        Role,
+        on_delete=models.CASCADE,
+        related_name='descendant_links',
+        verbose_name='Ancestral'
+    )
+    descendant = models.ForeignKey(
+        Role,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links',
+        verbose_name='Descendente'
+    )
+    
+    # Distância entre as funções (0 = a própria função)
+    depth = models.PositiveIntegerField('Profundidade', default=0)
+    
+    objects = RoleHierarchyManager()
+    
+    class Meta:
+        verbose_name = 'Hierarquia de Funções'
+        verbose_name_plural = 'Hierarquias de Funções'
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+    
+    def __str__(self):
+        return f'{self.ancestor.name} -> {self.descendant.name} ({self.depth})'
 
 
 class RolePermission(models.Model):
@@ -1,7 +1,35 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
-from .models import Permission, Role, RolePermission
+from .cache import invalidate_all_permissions, invalidate_user_permissions
+from .models import Permission, Role, RolePermission, UserRole, UserPermission
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=RolePermission)
+@receiver(post_delete, sender=RolePermission)
+def invalidate_permission_snapshots(sender, **kwargs):
+    """Invalida todos os snapshots quando permissões ou funções mudam."""
+    invalidate_all_permissions()
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_permission_snapshots_on_m2m(sender, action, **kwargs):
+    """Invalida todos os snapshots quando role.permissions é alterado."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_all_permissions()
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=UserPermission)
+@receiver(post_delete, sender=UserPermission)
+def invalidate_user_permission_snapshot(sender, instance, **kwargs):
+    """Invalida o snapshot do usuário quando suas funções ou permissões mudam."""
+    invalidate_user_permissions(instance.user_id)
 
 
 @receiver(post_migrate)
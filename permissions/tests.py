@@ -1,3 +1,121 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from accounts.models import Account
+from .decorators import user_has_permission, user_has_role
+from .models import Permission, Role, RolePermission, UserPermission, UserRole
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PermissionSnapshotTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		User = get_user_model()
+		self.user = User.objects.create_user(email='member@test.com', password='test123', username='member')
+		self.owner = User.objects.create_user(email='owner@test.com', password='test123', username='owner')
+		self.account = Account.objects.create(name='Conta Teste', owner=self.owner)
+		self.view = Permission.objects.create(
+			name='Ver Relatórios Teste', codename='test_view_reports', resource='report'
+		)
+		self.export = Permission.objects.create(
+			name='Exportar Relatórios Teste', codename='test_export_reports', resource='report'
+		)
+		self.role = Role.objects.create(name='Analista', codename='test_analyst', account=self.account)
+		RolePermission.objects.create(role=self.role, permission=self.view)
+		RolePermission.objects.create(role=self.role, permission=self.export)
+		self.user_role = UserRole.objects.create(user=self.user, role=self.role, account=self.account)
+
+	def test_role_permissions_are_granted(self):
+		self.assertTrue(user_has_permission(self.user, 'test_view_reports', self.account))
+		self.assertTrue(user_has_permission(self.user, self.export, self.account))
+		self.assertTrue(user_has_role(self.user, 'test_analyst', self.account))
+		self.assertFalse(user_has_permission(self.user, 'view_billing', self.account))
+
+	def test_cached_checks_do_not_query_database(self):
+		user_has_permission(self.user, 'test_view_reports', self.account)
+		with self.assertNumQueries(0):
+			self.assertTrue(user_has_permission(self.user, 'test_view_reports', self.account))
+			self.assertTrue(user_has_role(self.user, 'test_analyst', self.account))
+
+	def test_deny_overrides_role_grant(self):
+		UserPermission.objects.create(
+			user=self.user, permission=self.export, account=self.account, grant_type='deny'
+		)
+		self.assertTrue(user_has_permission(self.user, 'test_view_reports', self.account))
+		self.assertFalse(user_has_permission(self.user, 'test_export_reports', self.account))
+
+	def test_snapshot_invalidated_on_changes(self):
+		self.assertTrue(user_has_permission(self.user, 'test_view_reports', self.account))
+
+		self.view.is_active = False
+		self.view.save()
+		self.assertFalse(user_has_permission(self.user, 'test_view_reports', self.account))
+
+		self.user_role.delete()
+		self.assertFalse(user_has_permission(self.user, 'test_export_reports', self.account))
+		self.assertFalse(user_has_role(self.user, 'test_analyst', self.account))
+
+	def test_cache_outage_falls_back_to_database(self):
+		down = mock.Mock(side_effect=ConnectionError('redis down'))
+		with mock.patch.multiple(caches['default'], get=down, get_many=down, set=down, add=down, incr=down):
+			self.assertTrue(user_has_permission(self.user, 'test_view_reports', self.account))
+			with self.assertLogs('app_project.cache', 'ERROR'):
+				self.view.is_active = False
+				self.view.save()
+			self.assertFalse(user_has_permission(self.user, 'test_view_reports', self.account))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RoleHierarchyTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		User = get_user_model()
+		self.user = User.objects.create_user(email='member@test.com', password='test123', username='member')
+		self.perms = {
+			codename: Permission.objects.create(name=codename, codename=codename, resource='test')
+			for codename in ('test_read', 'test_write', 'test_admin')
+		}
+		self.base = Role.objects.create(name='Base', codename='test_base')
+		self.middle = Role.objects.create(name='Middle', codename='test_middle', parent_role=self.base)
+		self.leaf = Role.objects.create(name='Leaf', codename='test_leaf', parent_role=self.middle)
+		RolePermission.objects.create(role=self.base, permission=self.perms['test_read'])
+		RolePermission.objects.create(role=self.middle, permission=self.perms['test_write'])
+
+	def test_inherited_permissions_resolved_in_one_query(self):
+		with self.assertNumQueries(1):
+			codenames = set(self.leaf.get_all_permissions().values_list('codename', flat=True))
+		self.assertEqual(codenames, {'test_read', 'test_write'})
+		self.assertTrue(self.leaf.has_permission('test_read'))
+		self.assertFalse(self.base.has_permission('test_write'))
+
+	def test_ancestors_and_descendants(self):
+		self.assertEqual(list(self.leaf.get_ancestors()), [self.middle, self.base])
+		self.assertEqual(list(self.base.get_descendants()), [self.middle, self.leaf])
+
+	def test_moving_subtree_updates_closure(self):
+		other = Role.objects.create(name='Other', codename='test_other')
+		RolePermission.objects.create(role=other, permission=self.perms['test_admin'])
+		UserRole.objects.create(user=self.user, role=self.leaf)
+		self.assertTrue(user_has_permission(self.user, 'test_read'))
+
+		self.middle.parent_role = other
+		self.middle.save()
+
+		self.assertEqual(
+			set(self.leaf.get_all_permissions().values_list('codename', flat=True)),
+			{'test_write', 'test_admin'}
+		)
+		self.assertFalse(user_has_permission(self.user, 'test_read'))
+		self.assertTrue(user_has_permission(self.user, 'test_admin'))
+
+	def test_cycle_is_rejected(self):
+		self.base.parent_role = self.leaf
+		with self.assertRaises(ValidationError):
+			self.base.save()
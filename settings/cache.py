@@ -0,0 +1,136 @@
+"""
+Registro em memória das configurações globais (GlobalSetting).
+
+Todas as configurações são carregadas de uma vez, com os valores já
+convertidos por get_typed_value(), e guardadas no cache compartilhado sob
+uma versão; cada processo mantém uma cópia local. Depois disso, ler uma
+configuração (por exemplo, no context processor appearance_settings, que roda
+em toda renderização de template) não acessa o banco.
+
+A invalidação é feita pela versão (ver settings/signals.py): salvar ou excluir
+um GlobalSetting incrementa a versão e os processos recarregam o registro na
+próxima leitura, em até GLOBAL_SETTINGS_CHECK_INTERVAL segundos. Alterações
+feitas com queryset.update() ou bulk_create() não disparam signals e devem
+chamar invalidate_global_settings().
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from app_project.cache import hot_cache as cache
+
+logger = logging.getLogger(__name__)
+
+
+REGISTRY_TIMEOUT = 60 * 60 * 24
+
+VERSION_KEY = 'settings:global:version'
+REGISTRY_KEY = 'settings:global:registry:{version}'
+
+
+class GlobalSettingsRegistry:
+    """Configurações globais de uma versão: {chave: valor tipado}"""
+
+    def __init__(self, version=None, values=None, public_keys=()):
+        self.version = version
+        self.values = values or {}
+        self.public_keys = frozenset(public_keys)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def as_dict(self, public_only=False):
+        if public_only:
+            return {key: value for key, value in self.values.items() if key in self.public_keys}
+        return dict(self.values)
+
+
+_local = {'registry': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def _new_version():
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    """Versão atual guardada em key (inicializada pelo relógio se ausente)."""
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+    except DatabaseError:
+        # Tabela do DatabaseCache ainda inexistente (ex.: durante o migrate)
+        pass
+
+
+def invalidate_version(key):
+    """Incrementa a versão agora e de novo após o commit da transação."""
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def invalidate_global_settings():
+    """Descarta o registro atual (neste processo e, pela versão, nos demais)."""
+    _local['registry'] = None
+    invalidate_version(VERSION_KEY)
+
+
+def build_registry(version=None):
+    """Carrega todas as configurações globais com os valores já convertidos."""
+    from .models import GlobalSetting
+
+    values = {}
+    public_keys = []
+    for setting in GlobalSetting.objects.only('key', 'value', 'setting_type', 'is_public'):
+        try:
+            values[setting.key] = setting.get_typed_value()
+        except (TypeError, ValueError) as exc:
+            logger.warning(f'Invalid value for global setting {setting.key}: {exc}')
+            values[setting.key] = setting.value
+        if setting.is_public:
+            public_keys.append(setting.key)
+    return GlobalSettingsRegistry(version, values, public_keys)
+
+
+def get_registry():
+    """Retorna o registro de configurações globais, carregando-o se preciso."""
+    registry = _local['registry']
+    interval = getattr(settings, 'GLOBAL_SETTINGS_CHECK_INTERVAL', 5)
+    if registry is not None and time.monotonic() - _local['checked_at'] < interval:
+        return registry
+
+    with _lock:
+        version = get_version(VERSION_KEY)
+        registry = _local['registry']
+        if registry is None or registry.version != version:
+            key = REGISTRY_KEY.format(version=version)
+            registry = cache.get(key)
+            if registry is None:
+                registry = build_registry(version)
+                cache.set(key, registry, REGISTRY_TIMEOUT)
+            _local['registry'] = registry
+        _local['checked_at'] = time.monotonic()
+    return registry
+
+
+def get_global_setting(key, default=None):
+    """Valor tipado de uma configuração global (ou default se não existir)."""
+    return get_registry().get(key, default)
+
+
+def get_global_settings(public_only=False):
+    """Dicionário {chave: valor tipado} das configurações globais."""
+    return get_registry().as_dict(public_only)
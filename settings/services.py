@@ -0,0 +1,313 @@
+import json
+import logging
+import re
+
+from django.db import transaction
+
+from app_project.cache import hot_cache as cache
+
+from .cache import get_global_settings, get_version, invalidate_version
+from .models import AccountSetting, UserSetting, SettingTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsResolver:
+    """Resolve o valor efetivo (tipado) de configurações para um usuário/conta.
+
+    Ordem de resolução de cada chave:
+        1. UserSetting do usuário (se is_inherited=False)
+        2. AccountSetting da conta (se is_inherited=False)
+        3. GlobalSetting (registro em memória, ver settings/cache.py)
+        4. default_value do SettingTemplate da chave
+
+    As configurações de cada conta, de cada usuário e os templates ficam no
+    cache, cada escopo com sua própria versão (invalidada pelos signals em
+    settings/signals.py). get_many() resolve várias chaves com no máximo três
+    consultas (conta, usuário e templates) e nenhuma quando tudo está em cache.
+    """
+
+    ACCOUNT_VERSION_KEY = 'settings:account:{account_id}:version'
+    USER_VERSION_KEY = 'settings:user:{user_id}:version'
+    TEMPLATES_VERSION_KEY = 'settings:templates:version'
+    DATA_KEY = '{version_key}:data:{version}'
+    DATA_TIMEOUT = 60 * 60
+
+    @staticmethod
+    def convert_value(value, setting_type):
+        """Converte o valor textual para o tipo (mesma regra de get_typed_value)"""
+        try:
+            if setting_type == 'integer':
+                return int(value)
+            elif setting_type == 'float':
+                return float(value)
+            elif setting_type == 'boolean':
+                return value.lower() in ('true', '1', 'yes', 'on')
+            elif setting_type == 'json':
+                return json.loads(value)
+        except (TypeError, ValueError) as exc:
+            logger.warning(f'Invalid {setting_type} setting value {value!r}: {exc}')
+        return value
+
+    # -------------------------------------------------------------
+    # Invalidação por escopo
+    # -------------------------------------------------------------
+    @staticmethod
+    def invalidate_account(account_id):
+        invalidate_version(SettingsResolver.ACCOUNT_VERSION_KEY.format(account_id=account_id))
+
+    @staticmethod
+    def invalidate_user(user_id):
+        invalidate_version(SettingsResolver.USER_VERSION_KEY.format(user_id=user_id))
+
+    @staticmethod
+    def invalidate_templates():
+        invalidate_version(SettingsResolver.TEMPLATES_VERSION_KEY)
+
+    # -------------------------------------------------------------
+    # Carregamento dos escopos
+    # -------------------------------------------------------------
+    @staticmethod
+    def _load_account(account_id):
+        """{chave: (valor tipado, is_inherited)} das configurações da conta"""
+        return {
+            s.key: (SettingsResolver.convert_value(s.value, s.setting_type), s.is_inherited)
+            for s in AccountSetting.objects.filter(account_id=account_id).only(
+                'key', 'value', 'setting_type', 'is_inherited'
+            ).order_by()
+        }
+
+    @staticmethod
+    def _load_user(user_id):
+        """{chave: (valor tipado, is_inherited)} das configurações do usuário"""
+        return {
+            s.key: (SettingsResolver.convert_value(s.value, s.setting_type), s.is_inherited)
+            for s in UserSetting.objects.filter(user_id=user_id).only(
+                'key', 'value', 'setting_type', 'is_inherited'
+            ).order_by()
+        }
+
+    @staticmethod
+    def _load_templates():
+        """{chave: valor padrão tipado} dos templates com default_value"""
+        return {
+            t.key: SettingsResolver.convert_value(t.default_value, t.setting_type)
+            for t in SettingTemplate.objects.exclude(default_value='').only(
+                'key', 'default_value', 'setting_type'
+            ).order_by()
+        }
+
+    @staticmethod
+    def _get_scopes(user_id, account_id):
+        """Lê os dados dos escopos com um get_many por etapa (versões e dados)"""
+        resolver = SettingsResolver
+        scopes = {'templates': (resolver.TEMPLATES_VERSION_KEY, resolver._load_templates)}
+        if account_id is not None:
+            scopes['account'] = (
+                resolver.ACCOUNT_VERSION_KEY.format(account_id=account_id),
+                lambda: resolver._load_account(account_id),
+            )
+        if user_id is not None:
+            scopes['user'] = (
+                resolver.USER_VERSION_KEY.format(user_id=user_id),
+                lambda: resolver._load_user(user_id),
+            )
+
+        version_keys = [version_key for version_key, _ in scopes.values()]
+        versions = cache.get_many(version_keys)
+        data_keys = {}
+        for name, (version_key, _) in scopes.items():
+            version = versions.get(version_key)
+            if version is None:
+                version = get_version(version_key)
+            data_keys[name] = resolver.DATA_KEY.format(version_key=version_key, version=version)
+
+        cached = cache.get_many(list(data_keys.values()))
+        data = {}
+        missing = {}
+        for name, (_, load) in scopes.items():
+            value = cached.get(data_keys[name])
+            if value is None:
+                value = load()
+                missing[data_keys[name]] = value
+            data[name] = value
+        if missing:
+            cache.set_many(missing, resolver.DATA_TIMEOUT)
+        return data
+
+    # -------------------------------------------------------------
+    # Resolução
+    # -------------------------------------------------------------
+    @staticmethod
+    def get_many(keys, user=None, account=None, default=None, public_only=False):
+        """Retorna {chave: valor efetivo} para as chaves informadas.
+
+        Args:
+            keys: Chaves das configurações
+            user: Usuário (instância ou ID, opcional)
+            account: Conta (instância ou ID, opcional)
+            default: Valor para chaves sem configuração em nenhum escopo
+            public_only: Considera apenas configurações globais públicas
+        """
+        user_id = getattr(user, 'pk', user)
+        account_id = getattr(account, 'pk', account)
+        scopes = SettingsResolver._get_scopes(user_id, account_id)
+        global_values = get_global_settings(public_only)
+        user_values = scopes.get('user', {})
+        account_values = scopes.get('account', {})
+        template_values = scopes['templates']
+
+        resolved = {}
+        for key in keys:
+            value, inherited = user_values.get(key, (None, True))
+            if inherited:
+                value, inherited = account_values.get(key, (None, True))
+            if inherited:
+                if key in global_values:
+                    value = global_values[key]
+                else:
+                    value = template_values.get(key, default)
+            resolved[key] = value
+        return resolved
+
+    @staticmethod
+    def get(key, user=None, account=None, default=None, public_only=False):
+        """Valor efetivo de uma configuração"""
+        return SettingsResolver.get_many([key], user, account, default, public_only)[key]
+
+
+class SettingsBulkService:
+    """Criação/atualização em lote de configurações de conta e de usuário.
+
+    Os valores são validados em memória (tipo e SettingTemplate.validation_rules)
+    e gravados com um único INSERT ... ON CONFLICT DO UPDATE sobre os pares
+    únicos (conta, chave) / (usuário, chave), dentro de uma transação. O número
+    de consultas é constante, independente da quantidade de chaves.
+    """
+
+    BOOLEAN_VALUES = ('true', 'false', '1', '0', 'yes', 'no', 'on', 'off')
+
+    @staticmethod
+    def validate_value(value, setting_type, rules=None):
+        """Retorna a lista de erros do valor para o tipo e as regras do template"""
+        errors = []
+        number = None
+        try:
+            if setting_type == 'integer':
+                number = int(value)
+            elif setting_type == 'float':
+                number = float(value)
+            elif setting_type == 'boolean':
+                if value.lower() not in SettingsBulkService.BOOLEAN_VALUES:
+                    errors.append("Valor booleano deve ser: true/false, 1/0, yes/no, on/off")
+            elif setting_type == 'json':
+                json.loads(value)
+        except (ValueError, TypeError) as e:
+            errors.append(f"Valor inválido para o tipo {setting_type}: {str(e)}")
+            return errors
+
+        rules = rules or {}
+        choices = rules.get('choices')
+        if choices and value not in [str(choice) for choice in choices]:
+            errors.append(f"Valor deve ser um de: {', '.join(str(c) for c in choices)}")
+        if 'min_length' in rules and len(value) < rules['min_length']:
+            errors.append(f"Valor deve ter ao menos {rules['min_length']} caracteres")
+        if 'max_length' in rules and len(value) > rules['max_length']:
+            errors.append(f"Valor deve ter no máximo {rules['max_length']} caracteres")
+        if rules.get('pattern') and not re.search(rules['pattern'], value):
+            errors.append("Valor não corresponde ao formato esperado")
+        if number is not None:
+            if 'min_value' in rules and number < rules['min_value']:
+                errors.append(f"Valor deve ser maior ou igual a {rules['min_value']}")
+            if 'max_value' in rules and number > rules['max_value']:
+                errors.append(f"Valor deve ser menor ou igual a {rules['max_value']}")
+        return errors
+
+    @staticmethod
+    def upsert(model, owner_field, owner, values):
+        """Cria ou atualiza as configurações {chave: valor} do dono informado.
+
+        Args:
+            model: AccountSetting ou UserSetting
+            owner_field: 'account' ou 'user'
+            owner: Conta ou usuário dono das configurações
+            values: Dicionário {chave: valor textual}
+
+        Returns:
+            tuple: (lista de configurações gravadas, {chave: [erros]})
+        """
+        keys = list(values)
+        templates = {t.key: t for t in SettingTemplate.objects.filter(key__in=keys)}
+        existing = {
+            s.key: s for s in model.objects.filter(**{owner_field: owner, 'key__in': keys})
+        }
+
+        errors = {}
+        objs = []
+        for key, value in values.items():
+            template = templates.get(key)
+            current = existing.get(key)
+            setting_type = (
+                current.setting_type if current else
+                template.setting_type if template else 'string'
+            )
+            key_errors = SettingsBulkService.validate_value(
+                value, setting_type, template.validation_rules if template else None
+            )
+            if key_errors:
+                errors[key] = key_errors
+                continue
+            objs.append(model(**{
+                owner_field: owner,
+                'key': key,
+                'value': value,
+                'setting_type': setting_type,
+                'description': template.description if template else '',
+                'category': template.category if template else '',
+            }))
+
+        if errors:
+            return [], errors
+
+        with transaction.atomic():
+            model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=[owner_field, 'key'],
+                update_fields=['value', 'updated_at'],
+            )
+            # bulk_create não dispara signals: invalida o escopo manualmente
+            if owner_field == 'account':
+                SettingsResolver.invalidate_account(owner.pk)
+            else:
+                SettingsResolver.invalidate_user(owner.pk)
+            settings = list(model.objects.filter(**{owner_field: owner, 'key__in': keys}))
+        return settings, {}
+
+    @staticmethod
+    def create_from_templates(model, owner_field, owner, templates):
+        """Cria, em uma única inserção, as configurações ainda inexistentes dos templates"""
+        templates = list(templates)
+        existing = set(
+            model.objects.filter(
+                **{owner_field: owner, 'key__in': [t.key for t in templates]}
+            ).values_list('key', flat=True)
+        )
+        objs = [
+            model(**{
+                owner_field: owner,
+                'key': template.key,
+                'value': template.default_value,
+                'setting_type': template.setting_type,
+                'description': template.description,
+                'category': template.category,
+            })
+            for template in templates if template.key not in existing
+        ]
+        if objs:
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+            if owner_field == 'account':
+                SettingsResolver.invalidate_account(owner.pk)
+            else:
+                SettingsResolver.invalidate_user(owner.pk)
+        return objs
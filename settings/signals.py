@@ -0,0 +1,42 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_global_settings
+from .models import GlobalSetting, AccountSetting, UserSetting, SettingTemplate
+from .services import SettingsResolver
+
+
+@receiver(post_save, sender=GlobalSetting)
+@receiver(post_delete, sender=GlobalSetting)
+def global_setting_changed(sender, instance, raw=False, **kwargs):
+    """Invalida o registro de configurações globais em cache."""
+    if raw:
+        return
+    invalidate_global_settings()
+
+
+@receiver(post_save, sender=AccountSetting)
+@receiver(post_delete, sender=AccountSetting)
+def account_setting_changed(sender, instance, raw=False, **kwargs):
+    """Invalida as configurações em cache da conta."""
+    if raw:
+        return
+    SettingsResolver.invalidate_account(instance.account_id)
+
+
+@receiver(post_save, sender=UserSetting)
+@receiver(post_delete, sender=UserSetting)
+def user_setting_changed(sender, instance, raw=False, **kwargs):
+    """Invalida as configurações em cache do usuário."""
+    if raw:
+        return
+    SettingsResolver.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=SettingTemplate)
+@receiver(post_delete, sender=SettingTemplate)
+def setting_template_changed(sender, instance, raw=False, **kwargs):
+    """Invalida os valores padrão dos templates em cache."""
+    if raw:
+        return
+    SettingsResolver.invalidate_templates()
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from app_project.context_processors import appearance_settings
+from settings.cache import get_global_setting, get_global_settings, invalidate_global_settings
+from settings.models import GlobalSetting
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GlobalSettingsRegistryTest(TestCase):
+    """Testes para o registro em cache das configurações globais"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_global_settings()
+        self.primary = GlobalSetting.objects.create(key='primary_color', value='#111111', is_public=True)
+        GlobalSetting.objects.create(key='max_sites', value='5', setting_type='integer')
+
+    def test_values_are_typed_and_cached(self):
+        """Valores tipados são lidos sem consultas após o carregamento"""
+        self.assertEqual(get_global_setting('max_sites'), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_global_setting('primary_color'), '#111111')
+            self.assertEqual(get_global_setting('missing', 'default'), 'default')
+            self.assertEqual(get_global_settings(public_only=True), {'primary_color': '#111111'})
+            context = appearance_settings(RequestFactory().get('/'))
+        self.assertEqual(context['global_primary_color'], '#111111')
+        self.assertEqual(context['global_secondary_color'], '#6B7280')
+
+    def test_registry_invalidated_on_save_and_delete(self):
+        """Salvar ou excluir uma configuração invalida o registro"""
+        self.assertEqual(get_global_setting('primary_color'), '#111111')
+        self.primary.value = '#222222'
+        self.primary.save()
+        self.assertEqual(get_global_setting('primary_color'), '#222222')
+        self.primary.delete()
+        self.assertIsNone(get_global_setting('primary_color'))
+
+    def test_invalid_value_falls_back_to_raw(self):
+        """Valores que não convertem para o tipo são mantidos como texto"""
+        GlobalSetting.objects.create(key='broken', value='abc', setting_type='integer')
+        self.assertEqual(get_global_setting('broken'), 'abc')
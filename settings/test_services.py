@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import Account
+from settings.cache import invalidate_global_settings
+from settings.models import GlobalSetting, AccountSetting, UserSetting, SettingTemplate
+from settings.services import SettingsResolver, SettingsBulkService
+from settings.views import UserSettingViewSet
+
+User = get_user_model()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettingsResolverTest(TestCase):
+    """Testes para a resolução hierárquica de configurações"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_global_settings()
+        self.user = User.objects.create_user(email='user@test.com', password='test123', username='user')
+        self.account = Account.objects.create(name='Conta', slug='conta', owner=self.user)
+        GlobalSetting.objects.create(key='theme', value='light')
+        GlobalSetting.objects.create(key='page_size', value='20', setting_type='integer')
+        AccountSetting.objects.create(account=self.account, key='theme', value='blue')
+        AccountSetting.objects.create(account=self.account, key='page_size', value='50', setting_type='integer', is_inherited=True)
+        self.user_setting = UserSetting.objects.create(user=self.user, key='theme', value='dark')
+        SettingTemplate.objects.create(
+            key='notifications', name='Notificações', description='', setting_type='boolean',
+            default_value='true', category='general', scope='user'
+        )
+
+    def test_effective_values_follow_hierarchy(self):
+        """Usuário > conta > global > template, respeitando is_inherited"""
+        values = SettingsResolver.get_many(
+            ['theme', 'page_size', 'notifications', 'missing'], self.user, self.account
+        )
+        self.assertEqual(values, {'theme': 'dark', 'page_size': 20, 'notifications': True, 'missing': None})
+        self.assertEqual(SettingsResolver.get('theme', account=self.account), 'blue')
+        self.assertEqual(SettingsResolver.get('theme'), 'light')
+
+    def test_batched_lookup_query_count(self):
+        """Uma consulta por escopo na primeira leitura e nenhuma em cache"""
+        with self.assertNumQueries(4):  # registro global, templates, conta e usuário
+            SettingsResolver.get_many(['theme', 'page_size'], self.user, self.account)
+        with self.assertNumQueries(0):
+            SettingsResolver.get_many(['theme', 'page_size', 'notifications'], self.user, self.account)
+
+    def test_scope_invalidation(self):
+        """Alterar uma configuração invalida apenas o seu escopo"""
+        self.assertEqual(SettingsResolver.get('theme', self.user, self.account), 'dark')
+        self.user_setting.is_inherited = True
+        self.user_setting.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(SettingsResolver.get('theme', self.user, self.account), 'blue')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SettingsBulkServiceTest(TestCase):
+    """Testes para a gravação em lote de configurações"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@test.com', password='test123', username='user')
+        self.account = Account.objects.create(name='Conta', slug='conta', owner=self.user)
+        SettingTemplate.objects.create(
+            key='items_per_page', name='Itens', description='Itens por página', setting_type='integer',
+            default_value='20', category='display', scope='account',
+            validation_rules={'min_value': 5, 'max_value': 100}
+        )
+        SettingTemplate.objects.create(
+            key='layout', name='Layout', description='', setting_type='string',
+            default_value='grid', category='display', scope='account',
+            validation_rules={'choices': ['grid', 'list']}
+        )
+        AccountSetting.objects.create(account=self.account, key='layout', value='grid')
+
+    def test_upsert_uses_constant_queries(self):
+        """Cria e atualiza várias chaves com número fixo de consultas"""
+        values = {'layout': 'list', 'items_per_page': '50'}
+        values.update({f'custom_{i}': str(i) for i in range(20)})
+        self.assertEqual(SettingsResolver.get('layout', account=self.account), 'grid')
+        # templates, existentes, savepoint, INSERT ... ON CONFLICT, releitura, release
+        with self.assertNumQueries(6):
+            settings, errors = SettingsBulkService.upsert(AccountSetting, 'account', self.account, values)
+        self.assertEqual(errors, {})
+        self.assertEqual(len(settings), 22)
+        stored = {s.key: s for s in AccountSetting.objects.filter(account=self.account)}
+        self.assertEqual(stored['layout'].value, 'list')
+        self.assertEqual(stored['items_per_page'].setting_type, 'integer')
+        self.assertEqual(stored['items_per_page'].category, 'display')
+        self.assertEqual(SettingsResolver.get('layout', account=self.account), 'list')
+
+    def test_validation_rules_checked_in_memory(self):
+        """Regras do template rejeitam o lote inteiro sem gravar nada"""
+        settings, errors = SettingsBulkService.upsert(
+            AccountSetting, 'account', self.account, {'layout': 'table', 'items_per_page': '500', 'other': 'x'}
+        )
+        self.assertEqual(settings, [])
+        self.assertEqual(set(errors), {'layout', 'items_per_page'})
+        self.assertEqual(AccountSetting.objects.get(account=self.account, key='layout').value, 'grid')
+        self.assertFalse(AccountSetting.objects.filter(key='other').exists())
+
+    def test_user_bulk_update_endpoint(self):
+        """Endpoint bulk_update de usuário grava e retorna as configurações"""
+        UserSetting.objects.create(user=self.user, key='theme', value='light')
+        request = APIRequestFactory().post(
+            '/settings/user/bulk_update/', {'settings': {'theme': 'dark', 'lang': 'pt'}}, format='json'
+        )
+        force_authenticate(request, user=self.user)
+        response = UserSettingViewSet.as_view({'post': 'bulk_update'})(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({s['key']: s['value'] for s in response.data['settings']}, {'theme': 'dark', 'lang': 'pt'})
+        self.assertEqual(UserSetting.objects.filter(user=self.user).count(), 2)
@@ -18,4 +18,5 @@ urlpatterns = [
     # APIs específicas
     path('manager/', views.SettingsManagerAPIView.as_view(), name='settings_manager'),
     path('value/<str:scope>/<str:key>/', views.SettingValueAPIView.as_view(), name='setting_value'),
+    path('resolve/', views.ResolvedSettingsAPIView.as_view(), name='settings_resolve'),
 ]
\ No newline at end of file
@@ -11,11 +11,13 @@ from django_filters.rest_framework import DjangoFilterBackend
 
 from accounts.models import Account, AccountMembership
 from api.permissions import IsAuthenticatedAndAccountMember
+from accounts.tenant import get_current_tenant
 from .models import GlobalSetting, AccountSetting, UserSetting, SettingTemplate
 from .serializers import (
     GlobalSettingSerializer, AccountSettingSerializer, UserSettingSerializer,
     SettingTemplateSerializer, SettingValueSerializer, BulkSettingsSerializer
 )
+from .services import SettingsResolver, SettingsBulkService
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -85,15 +87,15 @@ class AccountSettingViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filtra configurações da conta atual do usuário"""
-        if not hasattr(self.request.user, 'current_account'):
+        account = get_current_tenant(self.request).account
+        if account is None:
             return AccountSetting.objects.none()
         
-        account = self.request.user.current_account
         return AccountSetting.objects.filter(account=account)
     
     def perform_create(self, serializer):
         """Associa a configuração à conta atual"""
-        account = self.request.user.current_account
+        account = get_current_tenant(self.request).account
         serializer.save(account=account)
     
     @action(detail=False, methods=['get'])
@@ -129,19 +131,17 @@ class AccountSettingViewSet(viewsets.ModelViewSet):
         """Atualiza múltiplas configurações de uma vez"""
         serializer = BulkSettingsSerializer(data=request.data)
         if serializer.is_valid():
-            account = self.request.user.current_account
-            updated_settings = []
-            
-            for key, value in serializer.validated_data['settings'].items():
-                setting, created = AccountSetting.objects.get_or_create(
-                    account=account,
-                    key=key,
-                    defaults={'value': value, 'setting_type': 'string'}
+            account = get_current_tenant(request).account
+            if account is None:
+                return Response(
+                    {'error': 'Conta não encontrada'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                if not created:
-                    setting.value = value
-                    setting.save()
-                updated_settings.append(setting)
+            updated_settings, errors = SettingsBulkService.upsert(
+                AccountSetting, 'account', account, serializer.validated_data['settings']
+            )
+            if errors:
+                return Response({'settings': errors}, status=status.HTTP_400_BAD_REQUEST)
             
             return Response({
                 'message': f'{len(updated_settings)} configurações atualizadas',
@@ -203,19 +203,11 @@ class UserSettingViewSet(viewsets.ModelViewSet):
         """Atualiza múltiplas configurações de uma vez"""
         serializer = BulkSettingsSerializer(data=request.data)
         if serializer.is_valid():
-            user = self.request.user
-            updated_settings = []
-            
-            for key, value in serializer.validated_data['settings'].items():
-                setting, created = UserSetting.objects.get_or_create(
-                    user=user,
-                    key=key,
-                    defaults={'value': value, 'setting_type': 'string'}
-                )
-                if not created:
-                    setting.value = value
-                    setting.save()
-                updated_settings.append(setting)
+            updated_settings, errors = SettingsBulkService.upsert(
+                UserSetting, 'user', self.request.user, serializer.validated_data['settings']
+            )
+            if errors:
+                return Response({'settings': errors}, status=status.HTTP_400_BAD_REQUEST)
             
             return Response({
                 'message': f'{len(updated_settings)} configurações atualizadas',
@@ -271,9 +263,10 @@ class SettingsManagerAPIView(APIView):
         data['global'] = GlobalSettingSerializer(global_settings, many=True).data
         
         # Configurações da conta (se o usuário tem conta atual)
-        if hasattr(request.user, 'current_account'):
+        account = get_current_tenant(request).account
+        if account is not None:
             account_settings = AccountSetting.objects.filter(
-                account=request.user.current_account
+                account=account
             )
             data['account'] = AccountSettingSerializer(account_settings, many=True).data
         
@@ -301,47 +294,31 @@ class SettingsManagerAPIView(APIView):
         
         created_settings = []
         
-        for template in templates:
-            if scope == 'global':
-                if not request.user.is_superuser:
-                    continue
-                setting, created = GlobalSetting.objects.get_or_create(
-                    key=template.key,
-                    defaults={
-                        'value': template.default_value,
-                        'setting_type': template.setting_type,
-                        'description': template.description,
-                        'category': template.category,
-                        'is_public': template.is_public
-                    }
-                )
-            elif scope == 'account':
-                if not hasattr(request.user, 'current_account'):
-                    continue
-                setting, created = AccountSetting.objects.get_or_create(
-                    account=request.user.current_account,
-                    key=template.key,
-                    defaults={
-                        'value': template.default_value,
-                        'setting_type': template.setting_type,
-                        'description': template.description,
-                        'category': template.category
-                    }
-                )
-            elif scope == 'user':
-                setting, created = UserSetting.objects.get_or_create(
-                    user=request.user,
-                    key=template.key,
-                    defaults={
-                        'value': template.default_value,
-                        'setting_type': template.setting_type,
-                        'description': template.description,
-                        'category': template.category
-                    }
+        if scope == 'global':
+            if request.user.is_superuser:
+                for template in templates:
+                    setting, created = GlobalSetting.objects.get_or_create(
+                        key=template.key,
+                        defaults={
+                            'value': template.default_value,
+                            'setting_type': template.setting_type,
+                            'description': template.description,
+                            'category': template.category,
+                            'is_public': template.is_public
+                        }
+                    )
+                    if created:
+                        created_settings.append(setting)
+        elif scope == 'account':
+            account = get_current_tenant(request).account
+            if account is not None:
+                created_settings = SettingsBulkService.create_from_templates(
+                    AccountSetting, 'account', account, templates
                 )
-            
-            if created:
-                created_settings.append(setting)
+        elif scope == 'user':
+            created_settings = SettingsBulkService.create_from_templates(
+                UserSetting, 'user', request.user, templates
+            )
         
         return Response({
             'message': f'{len(created_settings)} configurações criadas',
@@ -356,6 +333,19 @@ class SettingValueAPIView(APIView):
     def get(self, request, scope, key):
         """Obtém o valor de uma configuração específica"""
         setting = None
+        account = get_current_tenant(request).account
+        
+        if scope == 'effective':
+            # Valor efetivo resolvido entre usuário, conta, global e template
+            value = SettingsResolver.get(
+                key, request.user, account, public_only=not request.user.is_staff
+            )
+            if value is None:
+                return Response(
+                    {'error': 'Configuração não encontrada'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response({'key': key, 'typed_value': value})
         
         if scope == 'global':
             try:
@@ -363,10 +353,10 @@ class SettingValueAPIView(APIView):
             except GlobalSetting.DoesNotExist:
                 pass
         elif scope == 'account':
-            if hasattr(request.user, 'current_account'):
+            if account is not None:
                 try:
                     setting = AccountSetting.objects.get(
-                        account=request.user.current_account,
+                        account=account,
                         key=key
                     )
                 except AccountSetting.DoesNotExist:
@@ -389,3 +379,25 @@ class SettingValueAPIView(APIView):
             'typed_value': setting.get_typed_value(),
             'setting_type': setting.setting_type
         })
+
+
+class ResolvedSettingsAPIView(APIView):
+    """API para obter os valores efetivos de várias configurações de uma vez"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """Retorna {chave: valor efetivo} para ?keys=chave1,chave2,..."""
+        keys = [k.strip() for k in request.query_params.get('keys', '').split(',') if k.strip()]
+        if not keys:
+            return Response(
+                {'error': 'Informe as chaves em ?keys='},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        values = SettingsResolver.get_many(
+            keys,
+            request.user,
+            get_current_tenant(request).account,
+            public_only=not request.user.is_staff
+        )
+        return Response(values)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SiteManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'site_management'
+
+    def ready(self):
+        import site_management.signals
@@ -0,0 +1,47 @@
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Account
+from site_management.models import Site
+from site_management.services import SitePayloadService
+
+
+class Command(BaseCommand):
+    help = 'Exporta em NDJSON o payload público (formato de /api/site/full/) dos sites de uma conta.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', help='ID da conta (padrão: todas as contas)')
+        parser.add_argument('--status', help='Exporta apenas sites com este status (ex.: active)')
+        parser.add_argument('--sections', default='', help='Seções separadas por vírgula (padrão: todas)')
+        parser.add_argument('--output', '-o', help='Arquivo de saída (padrão: stdout)')
+
+    def handle(self, *args, **options):
+        sites = Site.objects.all()
+        if options['account']:
+            try:
+                account = Account.objects.get(pk=options['account'])
+            except (Account.DoesNotExist, ValueError):
+                raise CommandError('Conta não encontrada')
+            sites = sites.filter(account=account)
+        if options['status']:
+            sites = sites.filter(status=options['status'])
+
+        sections = [s.strip() for s in options['sections'].split(',') if s.strip()]
+        invalid = [s for s in sections if s not in SitePayloadService.SECTIONS]
+        if invalid:
+            raise CommandError(f"Seções inválidas: {', '.join(invalid)}")
+        sections = tuple(s for s in SitePayloadService.SECTIONS if not sections or s in sections)
+
+        lines = SitePayloadService.iter_ndjson(SitePayloadService.iter_payloads(sites, sections))
+        count = 0
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                for line in lines:
+                    output.write(line)
+                    count += 1
+            self.stdout.write(self.style.SUCCESS(f'{count} site(s) exportado(s) para {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+                count += 1
+            # Resumo em stderr para não misturar com o NDJSON
+            self.stderr.write(self.style.SUCCESS(f'{count} site(s) exportado(s)'))
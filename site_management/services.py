@@ -0,0 +1,600 @@
+from django.conf import settings
+from app_project.cache import hot_cache as cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils.html import strip_tags
+from django.utils import timezone
+from django.utils.text import Truncator
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from .models import Site, SiteBio, SiteCategory, Service, SocialNetwork, CTA, BlogPost, Banner, SiteAPIKey
+
+logger = logging.getLogger(__name__)
+
+
+class SitePayloadService:
+    """Serviço para montar e armazenar o payload público agregado dos sites.
+
+    O payload é dividido em seções (bio, categories, services, ...), cada uma
+    com seu próprio contador de versão e sua própria entrada no cache. Os
+    signals de Site, SiteBio, SiteCategory, Service, SocialNetwork, CTA,
+    BlogPost e Banner incrementam apenas as versões das seções afetadas, de
+    modo que editar um post não invalida, por exemplo, os serviços. Versões e
+    seções são lidas com um único get_many.
+
+    A pseudo-seção 'site' versiona os campos do próprio Site (servidos a partir
+    da instância autenticada) e o instante da última alteração é guardado para
+    o Last-Modified das respostas condicionais.
+    """
+
+    SECTIONS = ('bio', 'categories', 'services', 'social_networks', 'ctas', 'blog_posts', 'banners')
+    SITE_FIELDS = ('id', 'domain', 'status', 'created_at', 'updated_at')
+
+    # Seções invalidadas pela alteração de cada modelo (BlogPost.category usa
+    # SET_NULL, que não dispara signals nos posts)
+    MODEL_SECTIONS = {
+        Site: ('site',),
+        SiteBio: ('bio',),
+        SiteCategory: ('categories', 'blog_posts'),
+        Service: ('services',),
+        SocialNetwork: ('social_networks',),
+        CTA: ('ctas',),
+        BlogPost: ('blog_posts',),
+        Banner: ('banners',),
+    }
+
+    VERSION_KEY = 'site_payload:version:{site_id}:{section}'
+    CHANGED_KEY = 'site_payload:changed:{site_id}'
+    SECTION_KEY = 'site_payload:data:{site_id}:{section}'
+    PAYLOAD_TIMEOUT = 60 * 60 * 24
+
+    BLOG_EXCERPT_LENGTH = 280
+    # Sites por lote na exportação: as seções de cada lote são pré-carregadas
+    # com um número fixo de consultas, independente do número de sites.
+    EXPORT_CHUNK_SIZE = 200
+
+    # -------------------------------------------------------------
+    # Versões de conteúdo
+    # -------------------------------------------------------------
+    @staticmethod
+    def _version_key(site_id, section):
+        return SitePayloadService.VERSION_KEY.format(site_id=site_id, section=section)
+
+    @staticmethod
+    def _changed_key(site_id):
+        return SitePayloadService.CHANGED_KEY.format(site_id=site_id)
+
+    @staticmethod
+    def _section_key(site_id, section):
+        return SitePayloadService.SECTION_KEY.format(site_id=site_id, section=section)
+
+    @staticmethod
+    def _init_version(site_id, section):
+        # Versões baseadas no relógio evitam reaproveitar um payload antigo caso
+        # a chave de versão seja removida do cache.
+        key = SitePayloadService._version_key(site_id, section)
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        return version
+
+    @staticmethod
+    def _init_changed(site_id):
+        key = SitePayloadService._changed_key(site_id)
+        changed = int(time.time())
+        if not cache.add(key, changed, None):
+            changed = cache.get(key, changed)
+        return changed
+
+    @staticmethod
+    def bump_versions(site_id, sections):
+        """Incrementa as versões das seções informadas, invalidando seus dados"""
+        for section in sections:
+            try:
+                cache.incr(SitePayloadService._version_key(site_id, section))
+            except ValueError:
+                SitePayloadService._init_version(site_id, section)
+        cache.set(SitePayloadService._changed_key(site_id), int(time.time()), None)
+
+    @staticmethod
+    def get_state(site_id, sections=SECTIONS):
+        """Retorna ({seção: versão}, timestamp da última alteração) sem ler os dados.
+
+        A pseudo-seção 'site' é sempre incluída.
+        """
+        names = ('site',) + tuple(sections)
+        version_keys = {section: SitePayloadService._version_key(site_id, section) for section in names}
+        changed_key = SitePayloadService._changed_key(site_id)
+        values = cache.get_many(list(version_keys.values()) + [changed_key])
+        return SitePayloadService._read_state(site_id, version_keys, changed_key, values)
+
+    @staticmethod
+    def _read_state(site_id, version_keys, changed_key, values):
+        versions = {}
+        for section, key in version_keys.items():
+            version = values.get(key)
+            if version is None:
+                version = SitePayloadService._init_version(site_id, section)
+            versions[section] = version
+        changed = values.get(changed_key)
+        if changed is None:
+            changed = SitePayloadService._init_changed(site_id)
+        return versions, changed
+
+    @staticmethod
+    def get_digest(versions, *extra):
+        """Resume versões (e parâmetros extras) em um identificador estável"""
+        raw = '|'.join(f'{section}={versions[section]}' for section in sorted(versions))
+        raw = '|'.join([raw] + [str(value) for value in extra])
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    @staticmethod
+    def clear(site_id):
+        """Remove versões e dados de um site excluído"""
+        names = ('site',) + SitePayloadService.SECTIONS
+        cache.delete_many(
+            [SitePayloadService._version_key(site_id, section) for section in names] +
+            [SitePayloadService._section_key(site_id, section) for section in SitePayloadService.SECTIONS] +
+            [SitePayloadService._changed_key(site_id)]
+        )
+
+    # -------------------------------------------------------------
+    # Serialização
+    # -------------------------------------------------------------
+    @staticmethod
+    def get_site_queryset(sections=SECTIONS):
+        """Queryset com os relacionamentos das seções pré-carregados.
+
+        Os filtros do payload (itens ativos, posts publicados) são aplicados nos
+        Prefetch, de modo que a serialização usa apenas .all().
+        """
+        prefetches = {
+            'categories': 'categories',
+            'services': 'services',
+            'social_networks': Prefetch('social_networks', queryset=SocialNetwork.objects.filter(is_active=True)),
+            'ctas': Prefetch('ctas', queryset=CTA.objects.filter(is_active=True)),
+            'blog_posts': Prefetch('blog_posts', queryset=BlogPost.objects.filter(is_published=True)),
+            'banners': Prefetch('banners', queryset=Banner.objects.filter(is_active=True)),
+        }
+        queryset = Site.objects.all()
+        if 'bio' in sections:
+            queryset = queryset.select_related('bio')
+        return queryset.prefetch_related(*[prefetches[s] for s in sections if s in prefetches])
+
+    @staticmethod
+    def serialize_site(site):
+        return {
+            'id': site.id,
+            'domain': site.domain,
+            'status': site.status,
+            'created_at': site.created_at.isoformat(),
+            'updated_at': site.updated_at.isoformat(),
+        }
+
+    @staticmethod
+    def serialize_bio(bio):
+        return {
+            'title': bio.title,
+            'description': bio.description,
+            'logo': bio.logo.url if bio.logo else None,
+            'favicon': bio.favicon.url if bio.favicon else None,
+            'email': bio.email,
+            'whatsapp': bio.whatsapp,
+            'phone': bio.phone,
+            'address': bio.address,
+            'google_maps': bio.google_maps,
+        }
+
+    @staticmethod
+    def serialize_category(c):
+        return {
+            'id': c.id,
+            'name': c.name,
+            'icon': c.icon,
+            'image': c.image.url if c.image else None,
+            'order': c.order,
+            'is_active': c.is_active,
+        }
+
+    @staticmethod
+    def serialize_service(s):
+        return {
+            'id': s.id,
+            'category_id': s.category_id,
+            'title': s.title,
+            'description': s.description,
+            'image': s.image.url if s.image else None,
+            'value': str(s.value) if s.value is not None else None,
+            'discount': str(s.discount),
+            'final_value': str(s.final_value) if s.final_value is not None else None,
+            'order': s.order,
+            'is_active': s.is_active,
+        }
+
+    @staticmethod
+    def serialize_social_network(sn):
+        return {
+            'id': sn.id,
+            'network_type': sn.network_type,
+            'url': sn.url,
+            'icon_style': sn.icon_style,
+        }
+
+    @staticmethod
+    def serialize_cta(c):
+        return {
+            'id': c.id,
+            'title': c.title,
+            'description': c.description,
+            'action_type': c.action_type,
+            'button_text': c.button_text,
+            'image': c.image.url if c.image else None,
+            'order': c.order,
+        }
+
+    @staticmethod
+    def serialize_blog_post(p):
+        return {
+            'id': p.id,
+            'title': p.title,
+            'image': p.image.url if p.image else None,
+            'video_url': p.video_url,
+            'content': p.content,
+            'link': p.link,
+            'category_id': p.category_id,
+            'tags': p.tags,
+            'is_published': p.is_published,
+            'published_at': p.published_at.isoformat() if p.published_at else None,
+        }
+
+    @staticmethod
+    def serialize_banner(b):
+        return {
+            'id': b.id,
+            'image': b.image.url if b.image else None,
+            'link': b.link,
+            'description': b.description,
+            'order': b.order,
+        }
+
+    @staticmethod
+    def serialize_blog_post_summary(p):
+        """Versão resumida do post (sem o corpo) usada na listagem paginada"""
+        return {
+            'id': p.id,
+            'title': p.title,
+            'image': p.image.url if p.image else None,
+            'video_url': p.video_url,
+            'excerpt': Truncator(strip_tags(p.content)).chars(SitePayloadService.BLOG_EXCERPT_LENGTH),
+            'link': p.link,
+            'category_id': p.category_id,
+            'tags': p.tags,
+            'published_at': p.published_at.isoformat() if p.published_at else None,
+        }
+
+    @staticmethod
+    def serialize_section(site, section):
+        """Serializa uma seção de um site carregado via get_site_queryset()"""
+        service = SitePayloadService
+        if section == 'bio':
+            bio = site.bio if hasattr(site, 'bio') else None
+            return service.serialize_bio(bio) if bio else None
+        serializers = {
+            'categories': (site.categories, service.serialize_category),
+            'services': (site.services, service.serialize_service),
+            'social_networks': (site.social_networks, service.serialize_social_network),
+            'ctas': (site.ctas, service.serialize_cta),
+            'blog_posts': (site.blog_posts, service.serialize_blog_post),
+            'banners': (site.banners, service.serialize_banner),
+        }
+        manager, serialize = serializers[section]
+        return [serialize(obj) for obj in manager.all()]
+
+    @staticmethod
+    def build_payload(site, sections=SECTIONS):
+        """Monta o payload de um site carregado via get_site_queryset()"""
+        payload = SitePayloadService.serialize_site(site)
+        for section in sections:
+            payload[section] = SitePayloadService.serialize_section(site, section)
+        return payload
+
+    @staticmethod
+    def select_fields(payload, fields):
+        """Restringe o payload aos campos pedidos em ?fields=.
+
+        Nomes simples (ex.: domain) filtram os campos do site; nomes com
+        prefixo de seção (ex.: services.title) filtram os itens da seção.
+        Seções sem campos informados são mantidas completas.
+        """
+        if not fields:
+            return payload
+        site_fields = {f for f in fields if '.' not in f}
+        section_fields = {}
+        for field in fields:
+            if '.' in field:
+                section, name = field.split('.', 1)
+                section_fields.setdefault(section, set()).add(name)
+
+        selected = {}
+        for key, value in payload.items():
+            if key in SitePayloadService.SITE_FIELDS:
+                if not site_fields or key in site_fields or key == 'id':
+                    selected[key] = value
+            elif key in section_fields:
+                names = section_fields[key]
+                if isinstance(value, list):
+                    selected[key] = [{k: v for k, v in item.items() if k in names} for item in value]
+                elif isinstance(value, dict):
+                    selected[key] = {k: v for k, v in value.items() if k in names}
+                else:
+                    selected[key] = value
+            else:
+                selected[key] = value
+        return selected
+
+    @staticmethod
+    def iter_payloads(queryset, sections=SECTIONS):
+        """Gera o payload completo de cada site do queryset (exportação em lote)"""
+        sites = SitePayloadService.get_site_queryset(sections).filter(
+            pk__in=queryset.values('pk')
+        ).order_by('created_at', 'pk')
+        for site in sites.iterator(chunk_size=SitePayloadService.EXPORT_CHUNK_SIZE):
+            yield SitePayloadService.build_payload(site, sections)
+
+    @staticmethod
+    def iter_ndjson(payloads):
+        """Serializa payloads como NDJSON (um objeto JSON por linha)"""
+        for payload in payloads:
+            yield json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    # -------------------------------------------------------------
+    # Armazenamento
+    # -------------------------------------------------------------
+    @staticmethod
+    def get_sections(site_id, sections=SECTIONS):
+        """Retorna (versões, última alteração, {seção: dados}, hit).
+
+        Versões e dados são lidos com um único get_many; as seções ausentes ou
+        desatualizadas são montadas e gravadas antes do retorno.
+        """
+        service = SitePayloadService
+        names = ('site',) + tuple(sections)
+        version_keys = {section: service._version_key(site_id, section) for section in names}
+        section_keys = {section: service._section_key(site_id, section) for section in sections}
+        changed_key = service._changed_key(site_id)
+        values = cache.get_many(list(version_keys.values()) + list(section_keys.values()) + [changed_key])
+
+        versions, changed = service._read_state(site_id, version_keys, changed_key, values)
+        data = {}
+        stale = []
+        for section in sections:
+            stored = values.get(section_keys[section])
+            if stored and stored.get('version') == versions[section]:
+                data[section] = stored['data']
+            else:
+                stale.append(section)
+
+        if stale:
+            data.update(service.rebuild(site_id, stale, versions))
+        return versions, changed, data, not stale
+
+    @staticmethod
+    def rebuild(site_id, sections=SECTIONS, versions=None):
+        """Monta e grava as seções informadas; retorna {seção: dados}"""
+        # As versões são lidas antes da montagem: se o conteúdo mudar no meio
+        # do caminho, a seção fica marcada com a versão antiga e é refeita.
+        if versions is None:
+            versions, _ = SitePayloadService.get_state(site_id, sections)
+        site = SitePayloadService.get_site_queryset(sections).filter(pk=site_id).first()
+        if site is None:
+            SitePayloadService.clear(site_id)
+            return {section: None for section in sections}
+
+        data = {section: SitePayloadService.serialize_section(site, section) for section in sections}
+        cache.set_many(
+            {
+                SitePayloadService._section_key(site_id, section): {
+                    'version': versions[section],
+                    'data': data[section],
+                }
+                for section in sections
+            },
+            SitePayloadService.PAYLOAD_TIMEOUT
+        )
+        return data
+
+    @staticmethod
+    def schedule_rebuild(site_id, sections=SECTIONS):
+        """Agenda a remontagem das seções em background (Celery)"""
+        if not getattr(settings, 'SITE_PAYLOAD_PREBUILD', False):
+            return
+        from .tasks import rebuild_site_payload
+        sections = [section for section in sections if section in SitePayloadService.SECTIONS]
+        if not sections:
+            return
+        try:
+            rebuild_site_payload.apply_async(
+                args=[str(site_id), sections],
+                countdown=getattr(settings, 'SITE_PAYLOAD_PREBUILD_DELAY', 2)
+            )
+        except Exception as exc:
+            # Sem broker as seções são montadas na próxima requisição
+            logger.warning(f'Could not schedule payload rebuild for site {site_id}: {exc}')
+
+
+class LocalTTLCache:
+    """Cache LRU em memória do processo, limitado em tamanho e com expiração"""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SiteAPIKeyService:
+    """Verificação das chaves de API dos sites sem acessar o banco a cada requisição.
+
+    O resultado da verificação (hash da chave -> ids da chave e do site, se o
+    site está ativo e seus campos públicos, ou None para chaves
+    inválidas/inativas) fica em dois níveis: um LRU em memória do processo e o
+    cache compartilhado. A entrada guarda apenas valores simples, nunca a
+    instância do Site. Os signals de SiteAPIKey e Site removem as entradas
+    quando uma chave é revogada ou o site muda; os demais processos deixam de
+    aceitar a chave em até SITE_API_KEY_LOCAL_TTL segundos.
+
+    O last_used_at não é mais gravado a cada requisição: o uso é registrado no
+    cache no máximo uma vez por intervalo por chave, junto com o id da chave
+    numa fila numerada (USED_SEQ_KEY / USED_SLOT_KEY). A task periódica
+    flush_site_api_key_usage chama flush_usage(), que lê só as chaves usadas
+    desde o último flush e grava tudo em lote.
+    """
+
+    CACHE_KEY = 'site_api_key:{key_hash}'
+    USED_KEY = 'site_api_key:used:{key_id}'
+    TOUCH_KEY = 'site_api_key:touch:{key_id}'
+    USED_SEQ_KEY = 'site_api_key:used_seq'
+    USED_SLOT_KEY = 'site_api_key:used_slot:{seq}'
+    FLUSH_CURSOR_KEY = 'site_api_key:flush_cursor'
+    USED_TIMEOUT = 60 * 60 * 24
+
+    local_cache = LocalTTLCache(
+        maxsize=getattr(settings, 'SITE_API_KEY_CACHE_SIZE', 1024),
+        ttl=getattr(settings, 'SITE_API_KEY_LOCAL_TTL', 30),
+    )
+
+    @staticmethod
+    def hash_key(presented_key):
+        return hashlib.sha256(presented_key.encode()).hexdigest()
+
+    @staticmethod
+    def _cache_key(key_hash):
+        return SiteAPIKeyService.CACHE_KEY.format(key_hash=key_hash)
+
+    @staticmethod
+    def _load(key_hash):
+        api_key = SiteAPIKey.objects.filter(key_hash=key_hash).select_related('site').first()
+        if api_key is None or not api_key.is_active:
+            return None
+        return {
+            'key_id': api_key.pk,
+            'site_id': api_key.site_id,
+            'is_active': api_key.site.status == 'active',
+            'site': SitePayloadService.serialize_site(api_key.site),
+        }
+
+    @staticmethod
+    def authenticate(presented_key):
+        """Retorna {'key_id', 'site_id', 'is_active', 'site'} da chave ativa ou None
+
+        'site' são os campos públicos do site (SitePayloadService.serialize_site);
+        a entrada é compartilhada pelo cache local, então não deve ser alterada.
+        """
+        service = SiteAPIKeyService
+        try:
+            key_hash = service.hash_key(presented_key)
+        except Exception:
+            return None
+
+        entry = service.local_cache.get(key_hash, False)
+        if entry is False:
+            cache_key = service._cache_key(key_hash)
+            # Chaves inválidas também são guardadas (como None) para que
+            # tentativas repetidas não cheguem ao banco.
+            entry = cache.get(cache_key, False)
+            if entry is False:
+                entry = service._load(key_hash)
+                cache.set(cache_key, entry, getattr(settings, 'SITE_API_KEY_CACHE_TIMEOUT', 300))
+            service.local_cache.set(key_hash, entry)
+        return entry
+
+    @staticmethod
+    def invalidate(key_hashes):
+        """Remove chaves dos caches (revogação, alteração ou exclusão)"""
+        key_hashes = list(key_hashes)
+        for key_hash in key_hashes:
+            SiteAPIKeyService.local_cache.delete(key_hash)
+        cache.delete_many([SiteAPIKeyService._cache_key(key_hash) for key_hash in key_hashes])
+
+    @staticmethod
+    def invalidate_site(site_id):
+        """Remove dos caches as chaves de um site (o site fica guardado junto)"""
+        SiteAPIKeyService.invalidate(
+            SiteAPIKey.objects.filter(site_id=site_id).values_list('key_hash', flat=True)
+        )
+
+    @staticmethod
+    def touch(key_id):
+        """Registra o uso da chave; gravado no banco em lote por flush_usage()"""
+        service = SiteAPIKeyService
+        interval = getattr(settings, 'SITE_API_KEY_USAGE_INTERVAL', 60)
+        if not cache.add(service.TOUCH_KEY.format(key_id=key_id), 1, interval):
+            return
+        cache.set(service.USED_KEY.format(key_id=key_id), timezone.now(), service.USED_TIMEOUT)
+        try:
+            seq = cache.incr(service.USED_SEQ_KEY)
+        except ValueError:
+            cache.add(service.USED_SEQ_KEY, 0, None)
+            seq = cache.incr(service.USED_SEQ_KEY)
+        cache.set(service.USED_SLOT_KEY.format(seq=seq), key_id, service.USED_TIMEOUT)
+
+    @staticmethod
+    def flush_usage():
+        """Grava com um único UPDATE os last_used_at das chaves usadas desde o último flush"""
+        service = SiteAPIKeyService
+        end = cache.get(service.USED_SEQ_KEY, 0)
+        start = cache.get(service.FLUSH_CURSOR_KEY, 0)
+        if start > end:
+            # Sequência removida do cache (reinício/eviction): recomeça do zero
+            start = 0
+        if start == end:
+            return 0
+
+        slot_keys = [service.USED_SLOT_KEY.format(seq=seq) for seq in range(start + 1, end + 1)]
+        key_ids = set(cache.get_many(slot_keys).values())
+        used = cache.get_many([service.USED_KEY.format(key_id=key_id) for key_id in key_ids])
+        changed = []
+        if used:
+            keys = SiteAPIKey.objects.filter(pk__in=key_ids).only('id', 'last_used_at')
+            for key in keys:
+                last_used_at = used.get(service.USED_KEY.format(key_id=key.pk))
+                if last_used_at and (key.last_used_at is None or last_used_at > key.last_used_at):
+                    key.last_used_at = last_used_at
+                    changed.append(key)
+            if changed:
+                SiteAPIKey.objects.bulk_update(changed, ['last_used_at'])
+        cache.set(service.FLUSH_CURSOR_KEY, end, None)
+        cache.delete_many(slot_keys)
+        return len(changed)
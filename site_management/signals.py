@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Site, SiteAPIKey, SiteBio, SiteCategory, Service, SocialNetwork, CTA, BlogPost, Banner
+from .services import SitePayloadService, SiteAPIKeyService
+
+
+def _content_changed(site_id, sender):
+    sections = SitePayloadService.MODEL_SECTIONS[sender]
+    SitePayloadService.bump_versions(site_id, sections)
+    # Incrementa de novo após o commit para descartar seções montadas por
+    # outras requisições antes de as alterações ficarem visíveis.
+    transaction.on_commit(lambda: SitePayloadService.bump_versions(site_id, sections))
+    transaction.on_commit(lambda: SitePayloadService.schedule_rebuild(site_id, sections))
+
+
+@receiver(post_save, sender=Site)
+def site_saved(sender, instance, raw=False, **kwargs):
+    """Invalida a versão dos dados do próprio site quando ele muda."""
+    if raw:
+        return
+    _content_changed(instance.pk, sender)
+    # As chaves em cache guardam o site (status, domínio)
+    site_id = instance.pk
+    SiteAPIKeyService.invalidate_site(site_id)
+    transaction.on_commit(lambda: SiteAPIKeyService.invalidate_site(site_id))
+
+
+@receiver(post_delete, sender=Site)
+def site_deleted(sender, instance, **kwargs):
+    """Remove o payload do site excluído."""
+    site_id = instance.pk
+    transaction.on_commit(lambda: SitePayloadService.clear(site_id))
+
+
+@receiver(post_save, sender=SiteAPIKey)
+@receiver(post_delete, sender=SiteAPIKey)
+def site_api_key_changed(sender, instance, raw=False, **kwargs):
+    """Remove a chave dos caches de verificação (revogação imediata)."""
+    if raw:
+        return
+    key_hash = instance.key_hash
+    SiteAPIKeyService.invalidate([key_hash])
+    transaction.on_commit(lambda: SiteAPIKeyService.invalidate([key_hash]))
+
+
+@receiver(post_save, sender=SiteBio)
+@receiver(post_delete, sender=SiteBio)
+@receiver(post_save, sender=SiteCategory)
+@receiver(post_delete, sender=SiteCategory)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=SocialNetwork)
+@receiver(post_delete, sender=SocialNetwork)
+@receiver(post_save, sender=CTA)
+@receiver(post_delete, sender=CTA)
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def site_content_changed(sender, instance, raw=False, **kwargs):
+    """Invalida as seções do payload afetadas por um conteúdo relacionado."""
+    if raw:
+        return
+    _content_changed(instance.site_id, sender)
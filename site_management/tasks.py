@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from .services import SitePayloadService, SiteAPIKeyService
+
+
+@shared_task(ignore_result=True)
+def rebuild_site_payload(site_id, sections=None):
+    """Remonta as seções do payload público do site que estiverem desatualizadas"""
+    SitePayloadService.get_sections(site_id, tuple(sections or SitePayloadService.SECTIONS))
+
+
+@shared_task(ignore_result=True)
+def flush_site_api_key_usage():
+    """Grava em lote o last_used_at das chaves de API usadas recentemente"""
+    SiteAPIKeyService.flush_usage()
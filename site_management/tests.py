@@ -1,8 +1,16 @@
-from django.test import TestCase
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.utils import timezone
-from accounts.models import Account
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import Account, AccountMembership
 from django.contrib.auth import get_user_model
-from .models import Site, TemplateCategory, PlanType, Item, SiteCategory, Service
+from api.views import SiteDetailAPIView, SiteBlogPostListAPIView, AccountSitePayloadExportAPIView
+from .services import SitePayloadService, SiteAPIKeyService
+from .models import Site, TemplateCategory, PlanType, Item, SiteCategory, Service, SiteAPIKey, BlogPost
 
 
 class ServiceModelTests(TestCase):
@@ -39,3 +47,241 @@ class ServiceModelTests(TestCase):
 		self.assertNotEqual(s1.link, s2.link)
 		self.assertTrue(s2.link.startswith('/lavagem'))
 		self.assertEqual(s1.order + 1, s2.order)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SiteDetailPayloadTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		SiteAPIKeyService.local_cache.clear()
+		User = get_user_model()
+		self.owner = User.objects.create_user(email='owner@test.com', password='test123', username='owner')
+		self.account = Account.objects.create(name='Conta Teste', owner=self.owner)
+		template_cat = TemplateCategory.objects.create(
+			name='Padrao', description='',
+			desktop_image='templates/desktop/x.png',
+			mobile_image='templates/mobile/x.png'
+		)
+		plan = PlanType.objects.create(title='Plano', description='Desc', discount=0, template_category=template_cat)
+		self.site = Site.objects.create(
+			account=self.account,
+			domain='https://example.com',
+			template_category=template_cat,
+			plan_type=plan,
+			status='active',
+			expiration_date=timezone.now()
+		)
+		self.category = SiteCategory.objects.create(site=self.site, name='Cat')
+		self.service = Service.objects.create(site=self.site, category=self.category, title='Lavagem')
+		self.key, self.api_key = SiteAPIKey.create_key(site=self.site)
+		self.factory = APIRequestFactory()
+
+	def get_response(self, params=None, **headers):
+		request = self.factory.get('/api/site/full/', params or {}, HTTP_X_API_KEY=self.api_key, **headers)
+		return SiteDetailAPIView.as_view()(request)
+
+	def get_payload(self):
+		response = self.get_response()
+		self.assertEqual(response.status_code, 200)
+		return response
+
+	def test_payload_served_from_cache_until_content_changes(self):
+		first = self.get_payload()
+		self.assertEqual(first['X-Cache'], 'MISS')
+		self.assertEqual([s['title'] for s in first.data['services']], ['Lavagem'])
+
+		second = self.get_payload()
+		self.assertEqual(second['X-Cache'], 'HIT')
+		self.assertEqual(first.data['cache']['version'], second.data['cache']['version'])
+
+		self.service.title = 'Polimento'
+		self.service.save()
+
+		third = self.get_payload()
+		self.assertEqual(third['X-Cache'], 'MISS')
+		self.assertNotEqual(second.data['cache']['version'], third.data['cache']['version'])
+		self.assertEqual([s['title'] for s in third.data['services']], ['Polimento'])
+
+	def test_conditional_requests_return_not_modified(self):
+		first = self.get_payload()
+		etag = first['ETag']
+		self.assertIn('stale-while-revalidate', first['Cache-Control'])
+		self.assertIn('X-API-Key', first['Vary'])
+
+		with self.assertNumQueries(0):
+			response = self.get_response(HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+
+		response = self.get_response(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+		self.assertEqual(response.status_code, 304)
+
+		self.service.title = 'Polimento'
+		self.service.save()
+		response = self.get_response(HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_blog_change_keeps_other_sections_cached(self):
+		first = self.get_payload()
+		BlogPost.objects.create(site=self.site, category=self.category, title='Novo', content='<p>Texto</p>', is_published=True)
+
+		response = self.get_response({'sections': 'services,bio'})
+		self.assertEqual(response['X-Cache'], 'HIT')
+		self.assertNotIn('blog_posts', response.data)
+		self.assertEqual(response.data['cache']['version']['services'], first.data['cache']['version']['services'])
+
+		response = self.get_payload()
+		self.assertEqual(response['X-Cache'], 'MISS')
+		self.assertEqual([p['title'] for p in response.data['blog_posts']], ['Novo'])
+
+	def test_sections_and_fields_selection(self):
+		response = self.get_response({'sections': 'services', 'fields': 'domain,services.title'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data['services'], [{'title': 'Lavagem'}])
+		self.assertEqual(response.data['domain'], 'https://example.com')
+		self.assertNotIn('status', response.data)
+
+		response = self.get_response({'sections': 'services,unknown'})
+		self.assertEqual(response.status_code, 400)
+
+	def test_blog_list_is_cursor_paginated(self):
+		for i in range(3):
+			BlogPost.objects.create(site=self.site, title=f'Post {i}', content='x' * 1000, is_published=True)
+		BlogPost.objects.create(site=self.site, title='Rascunho', is_published=False)
+
+		request = self.factory.get('/api/site/blog/', {'page_size': 2}, HTTP_X_API_KEY=self.api_key)
+		response = SiteBlogPostListAPIView.as_view()(request)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.data['results']), 2)
+		self.assertNotIn('content', response.data['results'][0])
+		self.assertLessEqual(len(response.data['results'][0]['excerpt']), SitePayloadService.BLOG_EXCERPT_LENGTH)
+		self.assertIsNotNone(response.data['next'])
+
+		request = self.factory.get(response.data['next'], HTTP_X_API_KEY=self.api_key)
+		response = SiteBlogPostListAPIView.as_view()(request)
+		self.assertEqual([p['title'] for p in response.data['results']], ['Post 0'])
+		self.assertIsNone(response.data['next'])
+
+	@override_settings(ALLOWED_HOSTS=['.example.com'])
+	def test_blog_list_links_follow_request_host(self):
+		published_at = timezone.now()
+		for i in range(3):
+			BlogPost.objects.create(site=self.site, title=f'Post {i}', is_published=True, published_at=published_at)
+		BlogPost.objects.filter(site=self.site).update(published_at=published_at, created_at=published_at)
+
+		request = self.factory.get('/api/site/blog/', {'page_size': 2}, HTTP_X_API_KEY=self.api_key, HTTP_HOST='one.example.com')
+		first = SiteBlogPostListAPIView.as_view()(request)
+		self.assertEqual(first['X-Cache'], 'MISS')
+		self.assertTrue(first.data['next'].startswith('http://one.example.com/'))
+
+		request = self.factory.get('/api/site/blog/', {'page_size': 2}, HTTP_X_API_KEY=self.api_key, HTTP_HOST='two.example.com')
+		response = SiteBlogPostListAPIView.as_view()(request)
+		self.assertEqual(response['X-Cache'], 'HIT')
+		self.assertTrue(response.data['next'].startswith('http://two.example.com/'))
+
+		# Datas iguais: id desempata e nenhum post repete ou some entre as páginas
+		request = self.factory.get(response.data['next'], HTTP_X_API_KEY=self.api_key, HTTP_HOST='two.example.com')
+		second = SiteBlogPostListAPIView.as_view()(request)
+		titles = [p['title'] for p in first.data['results'] + second.data['results']]
+		self.assertEqual(titles, list(BlogPost.objects.filter(site=self.site).order_by('-id').values_list('title', flat=True)))
+
+	def test_api_key_revocation_and_site_status(self):
+		self.assertEqual(self.get_response().status_code, 200)
+		self.key.is_active = False
+		self.key.save()
+		self.assertEqual(self.get_response().status_code, 401)
+
+		self.key.is_active = True
+		self.key.save()
+		self.assertEqual(self.get_response().status_code, 200)
+		self.site.status = 'inactive'
+		self.site.save()
+		self.assertEqual(self.get_response().status_code, 403)
+
+	def test_last_used_at_written_in_batches(self):
+		self.get_payload()
+		self.key.refresh_from_db()
+		self.assertIsNone(self.key.last_used_at)
+		self.assertEqual(SiteAPIKeyService.flush_usage(), 1)
+		self.key.refresh_from_db()
+		first_used = self.key.last_used_at
+		self.assertIsNotNone(first_used)
+
+		with self.assertNumQueries(0):
+			self.get_payload()
+		with self.assertNumQueries(0):
+			self.assertEqual(SiteAPIKeyService.flush_usage(), 0)
+
+		cache.delete(SiteAPIKeyService.TOUCH_KEY.format(key_id=self.key.pk))
+		self.get_payload()
+		self.assertEqual(SiteAPIKeyService.flush_usage(), 1)
+		self.key.refresh_from_db()
+		self.assertGreater(self.key.last_used_at, first_used)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SitePayloadExportTests(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.owner = User.objects.create_user(email='owner@test.com', password='test123', username='owner')
+		self.account = Account.objects.create(name='Conta Teste', owner=self.owner)
+		template_cat = TemplateCategory.objects.create(
+			name='Padrao', description='',
+			desktop_image='templates/desktop/x.png',
+			mobile_image='templates/mobile/x.png'
+		)
+		plan = PlanType.objects.create(title='Plano', description='Desc', discount=0, template_category=template_cat)
+		for i in range(3):
+			site = Site.objects.create(
+				account=self.account,
+				domain=f'https://site{i}.com',
+				template_category=template_cat,
+				plan_type=plan,
+				status='active',
+				expiration_date=timezone.now()
+			)
+			category = SiteCategory.objects.create(site=site, name='Cat')
+			Service.objects.create(site=site, category=category, title=f'Servico {i}')
+			BlogPost.objects.create(site=site, title=f'Post {i}', is_published=True)
+
+	def test_payloads_use_constant_number_of_queries(self):
+		sites = Site.objects.filter(account=self.account)
+		# sites + bio (join) + categorias, serviços, redes sociais, CTAs, posts e banners
+		with self.assertNumQueries(7):
+			payloads = list(SitePayloadService.iter_payloads(sites))
+		self.assertEqual([p['domain'] for p in payloads], ['https://site0.com', 'https://site1.com', 'https://site2.com'])
+		self.assertEqual(payloads[1]['services'][0]['title'], 'Servico 1')
+		self.assertEqual(payloads[2]['blog_posts'][0]['title'], 'Post 2')
+
+	def test_export_endpoint_streams_ndjson(self):
+		request = APIRequestFactory().get('/api/accounts/x/sites/export/', {'sections': 'services'})
+		force_authenticate(request, user=self.owner)
+		response = AccountSitePayloadExportAPIView.as_view()(request, account_id=self.account.pk)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		lines = b''.join(response.streaming_content).decode().splitlines()
+		self.assertEqual(len(lines), 3)
+		payload = json.loads(lines[0])
+		self.assertEqual(payload['services'][0]['title'], 'Servico 0')
+		self.assertNotIn('blog_posts', payload)
+
+	def test_export_endpoint_requires_account_manager(self):
+		member = get_user_model().objects.create_user(email='member@test.com', password='test123', username='member')
+		AccountMembership.objects.create(account=self.account, user=member, role='member', status='active')
+		request = APIRequestFactory().get('/api/accounts/x/sites/export/')
+		force_authenticate(request, user=member)
+		response = AccountSitePayloadExportAPIView.as_view()(request, account_id=self.account.pk)
+		self.assertEqual(response.status_code, 403)
+
+		AccountMembership.objects.filter(user=member).update(role='admin')
+		request = APIRequestFactory().get('/api/accounts/x/sites/export/')
+		force_authenticate(request, user=member)
+		response = AccountSitePayloadExportAPIView.as_view()(request, account_id=self.account.pk)
+		self.assertEqual(response.status_code, 200)
+
+	def test_export_command(self):
+		out = StringIO()
+		call_command('export_site_payloads', account=str(self.account.pk), status='active', stdout=out, stderr=StringIO())
+		lines = out.getvalue().splitlines()
+		self.assertEqual([json.loads(line)['domain'] for line in lines], ['https://site0.com', 'https://site1.com', 'https://site2.com'])
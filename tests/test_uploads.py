@@ -2,14 +2,25 @@ import pytest
 import tempfile
 import os
 from django.test import TestCase
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from uploads.models import UploadedFile, ImageThumbnail, UploadQuota
 from tests.conftest import UserFactory, AccountFactory
 from PIL import Image
 import io
 
 
+@pytest.fixture(autouse=True)
+def storage_dirs(settings, tmp_path):
+    """Keep uploaded files and chunk parts out of the repository."""
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    settings.UPLOADS_CHUNK_DIR = str(tmp_path / 'chunks')
+    # Uploads URLs only: the full project URLconf needs optional apps
+    settings.ROOT_URLCONF = 'tests.urls'
+
+
 @pytest.mark.django_db
 class TestUploadedFileModel:
     """Test cases for UploadedFile model."""
@@ -350,4 +361,621 @@ class TestUploadIntegration:
             assert thumbnail.size == 'medium'
             assert thumbnail.width > 0
             assert thumbnail.height > 0
-            assert thumbnail.file is not None
\ No newline at end of file
+            assert thumbnail.file is not None
+
+@pytest.mark.django_db
+class TestThumbnailService:
+    """Test cases for the background thumbnail pipeline."""
+    
+    def create_uploaded_image(self, user, account, size=(1600, 1200)):
+        image = Image.new('RGB', size, color='green')
+        image_io = io.BytesIO()
+        image.save(image_io, format='JPEG')
+        
+        return UploadedFile.objects.create(
+            file=SimpleUploadedFile("photo.jpg", image_io.getvalue(), content_type="image/jpeg"),
+            original_name="photo.jpg",
+            uploaded_by=user,
+            account=account,
+            file_type="image"
+        )
+    
+    def test_generate_all_sizes(self, user, account):
+        """All sizes are derived from a single decode, largest first."""
+        from uploads.services import ThumbnailService
+        uploaded_file = self.create_uploaded_image(user, account)
+        
+        progress = []
+        thumbnails = ThumbnailService.generate(
+            uploaded_file, progress=lambda done, total: progress.append((done, total))
+        )
+        
+        assert list(thumbnails) == ['large', 'medium', 'small']
+        assert (thumbnails['large'].width, thumbnails['large'].height) == (600, 450)
+        assert (thumbnails['medium'].width, thumbnails['medium'].height) == (300, 225)
+        assert (thumbnails['small'].width, thumbnails['small'].height) == (150, 113)
+        assert progress == [(1, 3), (2, 3), (3, 3)]
+        
+        uploaded_file.refresh_from_db()
+        assert uploaded_file.thumbnail_status == 'ready'
+        assert uploaded_file.get_thumbnail_url('small') == reverse('uploads:thumbnail_serve', args=[uploaded_file.id, 'small'])
+    
+    def test_thumbnail_urls_use_prefetched_thumbnails(self, user, account, django_assert_num_queries):
+        """Listing thumbnail URLs costs one query for all files."""
+        from uploads.services import ThumbnailService
+        for _ in range(3):
+            ThumbnailService.generate(self.create_uploaded_image(user, account, size=(200, 150)), sizes=['small'])
+        
+        with django_assert_num_queries(2):
+            files = list(UploadedFile.objects.prefetch_related('thumbnails'))
+            urls = [uploaded_file.get_thumbnail_url('small') for uploaded_file in files]
+        assert urls == [reverse('uploads:thumbnail_serve', args=[f.id, 'small']) for f in files]
+    
+    def test_pending_thumbnail_falls_back_to_original(self, user, account):
+        """While thumbnails are pending the original file URL is used."""
+        uploaded_file = self.create_uploaded_image(user, account, size=(100, 100))
+        uploaded_file.thumbnail_status = 'pending'
+        
+        assert uploaded_file.get_thumbnail_url('medium') == uploaded_file.file.url
+    
+    def test_invalid_image_marks_failed(self, user, account):
+        """A file that cannot be decoded is marked as failed."""
+        from uploads.services import ThumbnailService
+        uploaded_file = UploadedFile.objects.create(
+            file=SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg"),
+            original_name="broken.jpg",
+            uploaded_by=user,
+            account=account,
+            file_type="image"
+        )
+        
+        assert ThumbnailService.generate(uploaded_file) == {}
+        uploaded_file.refresh_from_db()
+        assert uploaded_file.thumbnail_status == 'failed'
+
+
+@pytest.mark.django_db
+class TestFileServe:
+    """Test cases for streaming, range-aware file serving."""
+    
+    CONTENT = bytes(range(256)) * 4
+    
+    @pytest.fixture
+    def uploaded_file(self, account):
+        return UploadedFile.objects.create(
+            file=SimpleUploadedFile("video.mp4", self.CONTENT, content_type="video/mp4"),
+            original_name="video.mp4",
+            uploaded_by=account.owner,
+            account=account,
+            file_type="video",
+            mime_type="video/mp4"
+        )
+    
+    def get(self, uploaded_file, **headers):
+        from django.test import RequestFactory
+        from uploads.views import file_serve
+        request = RequestFactory().get('/', headers=headers)
+        request.user = uploaded_file.account.owner
+        return file_serve(request, file_id=uploaded_file.id)
+    
+    def test_full_response_is_streamed(self, uploaded_file):
+        response = self.get(uploaded_file)
+        assert response.status_code == 200
+        assert response.streaming
+        assert b''.join(response.streaming_content) == self.CONTENT
+        assert response['Accept-Ranges'] == 'bytes'
+        assert response['Content-Length'] == str(len(self.CONTENT))
+        assert response['ETag']
+    
+    def test_range_request(self, uploaded_file):
+        response = self.get(uploaded_file, Range='bytes=100-199')
+        assert response.status_code == 206
+        assert response['Content-Range'] == f'bytes 100-199/{len(self.CONTENT)}'
+        assert b''.join(response.streaming_content) == self.CONTENT[100:200]
+        
+        response = self.get(uploaded_file, Range='bytes=-10')
+        assert b''.join(response.streaming_content) == self.CONTENT[-10:]
+    
+    def test_unsatisfiable_range(self, uploaded_file):
+        response = self.get(uploaded_file, Range='bytes=5000-')
+        assert response.status_code == 416
+        assert response['Content-Range'] == f'bytes */{len(self.CONTENT)}'
+    
+    def test_not_modified(self, uploaded_file):
+        etag = self.get(uploaded_file)['ETag']
+        response = self.get(uploaded_file, If_None_Match=etag)
+        assert response.status_code == 304
+    
+    def test_accel_redirect_mode(self, uploaded_file, settings):
+        settings.UPLOADS_SERVE_MODE = 'nginx'
+        response = self.get(uploaded_file)
+        assert response.status_code == 200
+        assert response['X-Accel-Redirect'] == f'/protected-media/{uploaded_file.file.name}'
+        assert response.content == b''
+
+
+@pytest.mark.django_db
+class TestImageVariants:
+    """Test cases for on-demand image variants."""
+    
+    @pytest.fixture
+    def uploaded_image(self, account):
+        image = Image.new('RGB', (2000, 1000), color='purple')
+        image_io = io.BytesIO()
+        image.save(image_io, format='JPEG')
+        return UploadedFile.objects.create(
+            file=SimpleUploadedFile("hero.jpg", image_io.getvalue(), content_type="image/jpeg"),
+            original_name="hero.jpg",
+            uploaded_by=account.owner,
+            account=account,
+            file_type="image",
+            mime_type="image/jpeg",
+            width=2000,
+            height=1000,
+            is_public=True
+        )
+    
+    def get(self, url, user=None):
+        from django.test import RequestFactory
+        from django.contrib.auth.models import AnonymousUser
+        from uploads.views import image_variant
+        request = RequestFactory().get(url)
+        request.user = user or AnonymousUser()
+        file_id = url.split('/')[3]
+        return image_variant(request, file_id=file_id)
+    
+    def test_signed_url_generates_variant_once(self, uploaded_image):
+        from uploads.models import ImageVariant
+        from uploads.services import ImageVariantService
+        url = ImageVariantService.get_url(uploaded_image, width=400, format='webp')
+        
+        response = self.get(url)
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/webp'
+        variant_image = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        assert variant_image.size == (400, 200)
+        
+        self.get(url)
+        assert ImageVariant.objects.filter(original_file=uploaded_image).count() == 1
+    
+    def test_private_variant_requires_membership(self, uploaded_image):
+        from django.http import Http404
+        from uploads.services import ImageVariantService
+        uploaded_image.is_public = False
+        uploaded_image.save(update_fields=['is_public'])
+        url = ImageVariantService.get_url(uploaded_image, width=400)
+        
+        with pytest.raises(Http404):
+            self.get(url)
+        with pytest.raises(Http404):
+            self.get(url, user=UserFactory())
+        
+        response = self.get(url, user=uploaded_image.uploaded_by)
+        assert response.status_code == 200
+        assert response['Cache-Control'].startswith('private')
+    
+    def test_cover_fit(self, uploaded_image):
+        from uploads.services import ImageVariantService
+        variant = ImageVariantService.get_or_create(uploaded_image, 300, 300, 'cover', 'jpeg')
+        with variant.file.open('rb') as f:
+            assert Image.open(f).size == (300, 300)
+    
+    def test_tampered_signature_is_rejected(self, uploaded_image):
+        from django.http import Http404
+        from uploads.services import ImageVariantService
+        url = ImageVariantService.get_url(uploaded_image, width=400)
+        with pytest.raises(Http404):
+            self.get(url.replace('w=400', 'w=401'))
+    
+    def test_srcset_is_capped_at_original_width(self, uploaded_image):
+        from uploads.services import ImageVariantService
+        srcset = ImageVariantService.srcset(uploaded_image)
+        assert srcset.endswith('2000w')
+        assert '1920w' in srcset
+    
+    def test_lru_eviction(self, uploaded_image, settings, django_capture_on_commit_callbacks):
+        from uploads.models import ImageVariant
+        from uploads.services import ImageVariantService
+        settings.UPLOADS_IMAGE_VARIANTS_MAX = 2
+        with django_capture_on_commit_callbacks(execute=True):
+            first = ImageVariantService.get_or_create(uploaded_image, width=100)
+            ImageVariantService.get_or_create(uploaded_image, width=200)
+            ImageVariantService.get_or_create(uploaded_image, width=300)
+        
+        assert ImageVariant.objects.count() == 2
+        assert not ImageVariant.objects.filter(pk=first.pk).exists()
+        assert not first.file.storage.exists(first.file.name)
+
+    
+    def test_deleting_file_removes_variant_and_thumbnail_files(self, uploaded_image, django_capture_on_commit_callbacks):
+        from uploads.services import ImageVariantService, ThumbnailService
+        variant = ImageVariantService.get_or_create(uploaded_image, width=100)
+        thumbnails = ThumbnailService.generate(uploaded_image, sizes=['small'])
+        paths = [variant.file.name, thumbnails['small'].file.name]
+        assert all(default_storage.exists(path) for path in paths)
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            uploaded_image.delete()
+        
+        assert not any(default_storage.exists(path) for path in paths)
+    
+    def test_pending_thumbnail_redirects_to_original(self, uploaded_image):
+        from django.test import RequestFactory
+        from django.urls import reverse
+        from uploads.views import thumbnail_serve
+        request = RequestFactory().get('/')
+        request.user = uploaded_image.uploaded_by
+        
+        response = thumbnail_serve(request, file_id=uploaded_image.id, size='medium')
+        assert response.status_code == 302
+        assert response.url == reverse('uploads:file_serve', kwargs={'file_id': uploaded_image.id})
+
+
+@pytest.mark.django_db
+class TestChunkedUpload:
+    """Test cases for the resumable chunked upload protocol."""
+    
+    CONTENT = os.urandom(300 * 1024)
+    
+    @pytest.fixture(autouse=True)
+    def chunk_size(self, settings):
+        settings.UPLOADS_CHUNK_SIZE = 128 * 1024
+    
+    def call(self, view, account, method='post', data=None, headers=None, **kwargs):
+        import json as json_module
+        from django.test import RequestFactory
+        factory = RequestFactory()
+        if method == 'put':
+            request = factory.put('/', data=data, content_type='application/octet-stream', headers=headers)
+        elif method == 'get':
+            request = factory.get('/')
+        else:
+            request = factory.post('/', data=json_module.dumps(data or {}), content_type='application/json')
+        request.user = account.owner
+        response = view(request, **kwargs)
+        return response, json_module.loads(response.content)
+    
+    def start(self, account, **extra):
+        import hashlib
+        from uploads.views import upload_session_start
+        data = {
+            'account': str(account.id),
+            'filename': 'walkthrough.mp4',
+            'size': len(self.CONTENT),
+            'checksum': hashlib.sha256(self.CONTENT).hexdigest(),
+        }
+        data.update(extra)
+        return self.call(upload_session_start, account, data=data)
+    
+    def put_chunk(self, account, session_id, offset, chunk):
+        from uploads.views import upload_session_chunk
+        return self.call(
+            upload_session_chunk, account, method='put', data=chunk,
+            headers={'Upload-Offset': str(offset)}, session_id=session_id
+        )
+    
+    def test_session_endpoints_require_csrf_token(self, account):
+        from django.test import Client
+        from django.urls import reverse
+        from uploads.models import UploadSession
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(account.owner)
+        response = client.post(
+            reverse('uploads:upload_session_start'),
+            data={'account': str(account.id), 'filename': 'a.bin', 'size': 10},
+            content_type='application/json'
+        )
+        assert response.status_code == 403
+        assert not UploadSession.objects.exists()
+    
+    def test_full_protocol_charges_quota_on_finalize(self, account):
+        from uploads.views import upload_session_finalize
+        response, data = self.start(account)
+        assert response.status_code == 201
+        session_id = data['id']
+        
+        chunk_size = data['chunk_size']
+        for offset in range(0, len(self.CONTENT), chunk_size):
+            response, data = self.put_chunk(account, session_id, offset, self.CONTENT[offset:offset + chunk_size])
+            assert response.status_code == 200
+        assert data['offset'] == len(self.CONTENT)
+        assert not UploadQuota.objects.filter(account=account, used_storage_bytes__gt=0).exists()
+        
+        response, data = self.call(upload_session_finalize, account, session_id=session_id)
+        assert response.status_code == 200
+        uploaded_file = UploadedFile.objects.get(pk=data['file']['id'])
+        assert uploaded_file.file_type == 'video'
+        with uploaded_file.file.open('rb') as f:
+            assert f.read() == self.CONTENT
+        assert UploadQuota.objects.get(account=account).used_storage_bytes == len(self.CONTENT)
+    
+    def test_resume_after_offset_mismatch(self, account):
+        from uploads.views import upload_session_chunk
+        _, data = self.start(account)
+        session_id = data['id']
+        self.put_chunk(account, session_id, 0, self.CONTENT[:1000])
+        
+        response, data = self.put_chunk(account, session_id, 5000, self.CONTENT[5000:6000])
+        assert response.status_code == 409
+        assert data['offset'] == 1000
+        
+        _, data = self.call(upload_session_chunk, account, method='get', session_id=session_id)
+        assert data['offset'] == 1000
+    
+    def test_chunk_is_streamed_without_holding_the_session(self, account):
+        from uploads.models import UploadSession
+        from uploads.services import ChunkedUploadService
+        _, data = self.start(account)
+        session_id = data['id']
+        seen = []
+        
+        class SlowClient(io.BytesIO):
+            def read(self, size=-1):
+                if not seen:
+                    # The session is reserved, not locked, while the body streams in
+                    seen.append(UploadSession.objects.get(pk=session_id).status)
+                    with pytest.raises(ValueError, match='Outra parte'):
+                        ChunkedUploadService.write_chunk(session_id, 0, io.BytesIO(b'x'), 1)
+                return super().read(size)
+        
+        session = ChunkedUploadService.write_chunk(session_id, 0, SlowClient(self.CONTENT[:1000]), 1000)
+        assert seen == ['writing']
+        assert (session.status, session.received_bytes) == ('active', 1000)
+    
+    def test_abandoned_chunk_can_be_sent_again(self, account):
+        from datetime import timedelta
+        from django.utils import timezone
+        from uploads.models import UploadSession
+        from uploads.services import ChunkedUploadService
+        _, data = self.start(account)
+        session_id = data['id']
+        UploadSession.objects.filter(pk=session_id).update(
+            status='writing', updated_at=timezone.now() - timedelta(hours=1)
+        )
+        
+        session = ChunkedUploadService.write_chunk(session_id, 0, io.BytesIO(self.CONTENT[:1000]), 1000)
+        assert (session.status, session.received_bytes) == ('active', 1000)
+    
+    def test_incomplete_or_corrupted_upload_is_rejected(self, account):
+        from uploads.views import upload_session_finalize
+        _, data = self.start(account, checksum='0' * 64)
+        session_id = data['id']
+        
+        response, _ = self.call(upload_session_finalize, account, session_id=session_id)
+        assert response.status_code == 400
+        
+        for offset in range(0, len(self.CONTENT), data['chunk_size']):
+            self.put_chunk(account, session_id, offset, self.CONTENT[offset:offset + data['chunk_size']])
+        response, data = self.call(upload_session_finalize, account, session_id=session_id)
+        assert response.status_code == 400
+        assert not UploadedFile.objects.filter(account=account).exists()
+    
+    def test_checksum_mismatch_fails_session(self, account):
+        from uploads.models import UploadSession
+        from uploads.services import ChunkedUploadService
+        from uploads.views import upload_session_finalize
+        _, data = self.start(account, checksum='0' * 64)
+        session_id = data['id']
+        for offset in range(0, len(self.CONTENT), data['chunk_size']):
+            self.put_chunk(account, session_id, offset, self.CONTENT[offset:offset + data['chunk_size']])
+        
+        response, _ = self.call(upload_session_finalize, account, session_id=session_id)
+        assert response.status_code == 400
+        session = UploadSession.objects.get(pk=session_id)
+        assert session.status == 'failed'
+        assert not os.path.exists(ChunkedUploadService.get_chunk_path(session))
+        
+        response, data = self.call(upload_session_finalize, account, session_id=session_id)
+        assert response.status_code == 400
+        assert 'encerrada' in data['error']
+    
+    def test_cleanup_expired_sessions(self, account):
+        from datetime import timedelta
+        from django.utils import timezone
+        from uploads.models import UploadSession
+        from uploads.services import ChunkedUploadService
+        _, data = self.start(account)
+        session = UploadSession.objects.get(pk=data['id'])
+        part = ChunkedUploadService.get_chunk_path(session)
+        assert os.path.exists(part)
+        
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        assert ChunkedUploadService.cleanup_expired() == 1
+        assert not UploadSession.objects.filter(pk=session.pk).exists()
+        assert not os.path.exists(part)
+
+
+@pytest.mark.django_db
+class TestBlobDeduplication:
+    """Test cases for content-addressed storage of uploads."""
+    
+    def upload(self, account, content=b'%PDF-1.4 same content', name='brochure.pdf'):
+        from uploads.services import BlobStoreService
+        return BlobStoreService.create_file(
+            account, account.owner, SimpleUploadedFile(name, content), name,
+            mime_type='application/pdf'
+        )
+    
+    def test_identical_content_is_stored_once(self, account):
+        first, first_charge = self.upload(account)
+        second, second_charge = self.upload(account, name='copy.pdf')
+        
+        assert first.blob_id == second.blob_id
+        assert first.file.name == second.file.name
+        assert first.blob.ref_count == 1
+        second.blob.refresh_from_db()
+        assert second.blob.ref_count == 2
+        assert (first_charge, second_charge) == (first.file_size, 0)
+        
+        other, _ = self.upload(account, content=b'other content')
+        assert other.blob_id != first.blob_id
+    
+    def test_blob_is_released_with_last_reference(self, account, django_capture_on_commit_callbacks):
+        from uploads.models import FileBlob
+        from uploads.services import BlobStoreService
+        first, _ = self.upload(account)
+        second, _ = self.upload(account)
+        storage = first.file.storage
+        path = first.file.name
+        
+        assert BlobStoreService.delete_file(first) == 0
+        assert FileBlob.objects.get(pk=second.blob_id).ref_count == 1
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            assert BlobStoreService.delete_file(second) == second.file_size
+        assert not FileBlob.objects.exists()
+        assert not storage.exists(path)
+    
+    def test_queryset_and_cascade_deletes_release_blobs(self, account, django_capture_on_commit_callbacks):
+        from uploads.models import FileBlob
+        first, _ = self.upload(account)
+        second, _ = self.upload(account)
+        path = first.file.name
+        
+        UploadedFile.objects.filter(pk=first.pk).delete()
+        assert FileBlob.objects.get(pk=second.blob_id).ref_count == 1
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            account.delete()
+        assert not FileBlob.objects.exists()
+        assert not default_storage.exists(path)
+    
+    def test_recreated_blob_keeps_its_file(self, account, django_capture_on_commit_callbacks):
+        from uploads.services import BlobStoreService
+        first, _ = self.upload(account)
+        path = first.file.name
+        
+        with django_capture_on_commit_callbacks(execute=True):
+            BlobStoreService.delete_file(first)
+            again, _ = self.upload(account)
+        assert again.file.name == path
+        assert default_storage.exists(path)
+    
+    def test_scope_is_per_account_by_default(self, account):
+        other_account = AccountFactory()
+        first, _ = self.upload(account)
+        second, charged = self.upload(other_account)
+        assert first.blob_id != second.blob_id
+        assert charged == second.file_size
+    
+    def test_global_scope_charges_each_account(self, account, settings):
+        settings.UPLOADS_DEDUP_SCOPE = 'global'
+        other_account = AccountFactory()
+        first, _ = self.upload(account)
+        second, charged = self.upload(other_account)
+        assert first.blob_id == second.blob_id
+        assert charged == second.file_size
+
+
+@pytest.mark.django_db
+class TestAtomicQuota:
+    """Test cases for atomic quota accounting."""
+    
+    def test_stale_instances_do_not_lose_updates(self, account):
+        quota = UploadQuota.objects.create(account=account, max_storage_mb=1)
+        stale = UploadQuota.objects.get(pk=quota.pk)
+        
+        quota.add_file_usage(1000)
+        stale.add_file_usage(500)
+        stale.remove_file_usage(200)
+        
+        quota.refresh_from_db()
+        assert quota.used_storage_bytes == 1300
+        assert quota.files_uploaded_this_month == 2
+    
+    def test_reservation_respects_limits_across_instances(self, account):
+        quota = UploadQuota.objects.create(account=account, max_storage_mb=1, max_files_per_month=10)
+        stale = UploadQuota.objects.get(pk=quota.pk)
+        
+        assert quota.reserve_upload(700 * 1024) == (True, "OK")
+        # The stale copy still believes the quota is empty
+        can_upload, message = stale.reserve_upload(700 * 1024)
+        assert can_upload is False
+        assert message == "Espaço de armazenamento insuficiente"
+        
+        quota.release_upload(700 * 1024)
+        quota.refresh_from_db()
+        assert (quota.used_storage_bytes, quota.files_uploaded_this_month) == (0, 0)
+    
+    def test_reservation_respects_monthly_limit(self, account):
+        quota = UploadQuota.objects.create(account=account, max_files_per_month=1)
+        assert quota.reserve_upload(10)[0] is True
+        assert quota.reserve_upload(10) == (False, "Limite mensal de arquivos atingido")
+    
+    def test_reconcile_command(self, account):
+        from django.core.management import call_command
+        from uploads.services import BlobStoreService
+        quota = UploadQuota.objects.create(account=account, used_storage_bytes=999999)
+        for name in ('a.txt', 'b.txt'):
+            BlobStoreService.create_file(account, account.owner, SimpleUploadedFile(name, b'x' * 100), name)
+        BlobStoreService.create_file(account, account.owner, SimpleUploadedFile('c.txt', b'y' * 50), 'c.txt')
+        
+        out = io.StringIO()
+        call_command('reconcile_upload_quotas', stdout=out)
+        quota.refresh_from_db()
+        assert quota.used_storage_bytes == 150
+        assert '999999 -> 150' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestImageMetadata:
+    """Test cases for off-request image metadata extraction."""
+    
+    @pytest.fixture(autouse=True)
+    def sync_metadata(self, settings):
+        settings.UPLOADS_METADATA_ASYNC = False
+    
+    def make_image(self, size=(640, 480), color=(200, 30, 30), orientation=None):
+        image = Image.new('RGB', size, color=color)
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        image_io = io.BytesIO()
+        image.save(image_io, format='JPEG', exif=exif)
+        return SimpleUploadedFile("photo.jpg", image_io.getvalue(), content_type="image/jpeg")
+    
+    def upload(self, account, **kwargs):
+        from uploads.services import BlobStoreService
+        uploaded_file, _ = BlobStoreService.create_file(
+            account, account.owner, self.make_image(**kwargs), 'photo.jpg', mime_type='image/jpeg'
+        )
+        return uploaded_file
+    
+    def test_metadata_extracted_after_commit(self, account, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            uploaded_file = self.upload(account, orientation=6)
+        
+        uploaded_file.refresh_from_db()
+        assert (uploaded_file.width, uploaded_file.height) == (640, 480)
+        assert uploaded_file.orientation == 6
+        assert uploaded_file.dominant_color.startswith('#')
+        assert uploaded_file.blurhash.startswith('L')
+        assert uploaded_file.metadata_hash == uploaded_file.content_hash
+    
+    def test_save_does_not_decode_or_reschedule(self, account, django_capture_on_commit_callbacks):
+        from unittest import mock
+        from uploads.services import ImageMetadataService
+        with django_capture_on_commit_callbacks(execute=True):
+            uploaded_file = self.upload(account)
+        uploaded_file = UploadedFile.objects.get(pk=uploaded_file.pk)
+        
+        with mock.patch.object(ImageMetadataService, 'schedule') as schedule:
+            uploaded_file.description = 'Nova descrição'
+            uploaded_file.save()
+        schedule.assert_not_called()
+        assert ImageMetadataService.extract(uploaded_file) is False
+    
+    def test_duplicate_content_reuses_metadata(self, account, django_capture_on_commit_callbacks):
+        from unittest import mock
+        from uploads.services import ImageMetadataService
+        with django_capture_on_commit_callbacks(execute=True):
+            first = self.upload(account)
+        
+        with mock.patch.object(ImageMetadataService, 'read') as read:
+            with django_capture_on_commit_callbacks(execute=True):
+                second = self.upload(account)
+        read.assert_not_called()
+        second.refresh_from_db()
+        first.refresh_from_db()
+        assert second.blurhash == first.blurhash
+        assert second.dominant_color == first.dominant_color
@@ -0,0 +1,6 @@
+from django.urls import include, path
+
+# URLconf mínima para testes que usam reverse() nas URLs de uploads
+urlpatterns = [
+    path('uploads/', include('uploads.urls')),
+]
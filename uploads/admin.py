@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import UploadedFile, ImageThumbnail, UploadQuota
+from .models import FileBlob, UploadedFile, ImageThumbnail, ImageVariant, UploadQuota
 
 
 @admin.register(UploadedFile)
@@ -42,12 +42,16 @@ class UploadedFileAdmin(admin.ModelAdmin):
         })
     ]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('thumbnails')
+    
     def file_preview(self, obj):
         """Preview do arquivo"""
         if obj.is_image:
             # Tentar usar thumbnail pequeno
             try:
-                thumbnail = obj.thumbnails.filter(size='small').first()
+                # Usa o prefetch da listagem (get_queryset)
+                thumbnail = next((t for t in obj.thumbnails.all() if t.size == 'small'), None)
                 if thumbnail:
                     return format_html(
                         '<img src="{}" style="max-width: 100px; max-height: 100px;" />',
@@ -117,6 +121,34 @@ class ImageThumbnailAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(FileBlob)
+class FileBlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'account', 'size', 'ref_count', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['sha256', 'account__name']
+    readonly_fields = ['account', 'sha256', 'size', 'file', 'ref_count', 'created_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(admin.ModelAdmin):
+    list_display = [
+        'original_file', 'width', 'height', 'fit', 'format',
+        'file_size', 'last_accessed_at'
+    ]
+    list_filter = ['fit', 'format', 'created_at']
+    search_fields = ['original_file__original_name', 'key']
+    readonly_fields = [
+        'original_file', 'key', 'width', 'height', 'fit', 'format',
+        'file', 'file_size', 'created_at', 'last_accessed_at'
+    ]
+    
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(UploadQuota)
 class UploadQuotaAdmin(admin.ModelAdmin):
     list_display = [
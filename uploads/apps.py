@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class UploadsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'uploads'
+    
+    def ready(self):
+        import uploads.signals
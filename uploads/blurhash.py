@@ -0,0 +1,113 @@
+"""
+Codificação BlurHash (https://blurha.sh) de imagens pequenas.
+
+O hash é um placeholder compacto (~20-30 caracteres) que os front-ends
+decodificam num gradiente borrado enquanto a imagem real carrega. A imagem
+deve chegar já reduzida (ex.: 32x32): o custo é proporcional ao número de
+pixels vezes o número de componentes.
+"""
+import math
+
+
+BASE83_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _encode83(value, length):
+    return ''.join(
+        BASE83_CHARS[(value // 83 ** (length - i)) % 83]
+        for i in range(1, length + 1)
+    )
+
+
+def _srgb_to_linear(value):
+    value = value / 255
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode(image, x_components=4, y_components=3):
+    """
+    Calcula o BlurHash de uma imagem Pillow em RGB.
+
+    Args:
+        image: Imagem RGB (de preferência já reduzida)
+        x_components: Componentes horizontais (1 a 9)
+        y_components: Componentes verticais (1 a 9)
+
+    Returns:
+        str: BlurHash
+    """
+    if not (1 <= x_components <= 9 and 1 <= y_components <= 9):
+        raise ValueError('Componentes devem estar entre 1 e 9')
+
+    width, height = image.size
+    lookup = [_srgb_to_linear(value) for value in range(256)]
+    data = image.convert('RGB').tobytes()
+    pixels = [
+        (lookup[data[k]], lookup[data[k + 1]], lookup[data[k + 2]])
+        for k in range(0, len(data), 3)
+    ]
+
+    cos_x = [
+        [math.cos(math.pi * i * x / width) for x in range(width)]
+        for i in range(x_components)
+    ]
+    cos_y = [
+        [math.cos(math.pi * j * y / height) for y in range(height)]
+        for j in range(y_components)
+    ]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = normalisation / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(component) for factor in ac for component in factor)
+        quantised_max = int(max(0, min(82, math.floor(actual_max * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+        blurhash += _encode83(quantised_max, 1)
+    else:
+        maximum = 1
+        blurhash += _encode83(0, 1)
+
+    dc_value = (
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2])
+    )
+    blurhash += _encode83(dc_value, 4)
+
+    for factor in ac:
+        r, g, b = (
+            int(max(0, min(18, math.floor(_sign_pow(component / maximum, 0.5) * 9 + 9.5))))
+            for component in factor
+        )
+        blurhash += _encode83(r * 19 * 19 + g * 19 + b, 2)
+
+    return blurhash
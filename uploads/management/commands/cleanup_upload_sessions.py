@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from uploads.services import ChunkedUploadService
+
+
+class Command(BaseCommand):
+    help = 'Remove sessões de upload em partes abandonadas e seus arquivos temporários.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int,
+            help='Idade mínima (s) da última atividade (padrão: UPLOADS_SESSION_TTL)'
+        )
+
+    def handle(self, *args, **options):
+        removed = ChunkedUploadService.cleanup_expired(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(f'{removed} sessão(ões) de upload removida(s)'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Account
+from uploads.models import UploadQuota
+from uploads.services import UploadQuotaService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o armazenamento usado das quotas de upload a partir dos arquivos existentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', help='ID da conta (padrão: todas as contas)')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas lista as divergências')
+
+    def handle(self, *args, **options):
+        quotas = UploadQuota.objects.select_related('account')
+        if options['account']:
+            try:
+                account = Account.objects.get(pk=options['account'])
+            except (Account.DoesNotExist, ValueError):
+                raise CommandError('Conta não encontrada')
+            quotas = quotas.filter(account=account)
+
+        changed = UploadQuotaService.reconcile(quotas, dry_run=options['dry_run'])
+        for quota, previous, used in changed:
+            self.stdout.write(f'{quota.account.name}: {previous} -> {used} bytes')
+
+        action = 'divergente(s)' if options['dry_run'] else 'corrigida(s)'
+        self.stdout.write(self.style.SUCCESS(f'{len(changed)} quota(s) {action}'))
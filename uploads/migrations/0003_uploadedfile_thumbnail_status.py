@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='thumbnail_status',
+            field=models.CharField(choices=[('none', 'Sem thumbnails'), ('pending', 'Pendente'), ('processing', 'Processando'), ('ready', 'Pronto'), ('failed', 'Falhou')], default='none', max_length=20),
+        ),
+    ]
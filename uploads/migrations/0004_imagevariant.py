@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:34
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0003_uploadedfile_thumbnail_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=64)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('fit', models.CharField(choices=[('contain', 'Conter'), ('cover', 'Cobrir')], default='contain', max_length=10)),
+                ('format', models.CharField(choices=[('jpeg', 'JPEG'), ('png', 'PNG'), ('webp', 'WebP'), ('avif', 'AVIF')], max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('file_size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('original_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='uploads.uploadedfile')),
+            ],
+            options={
+                'db_table': 'uploads_image_variant',
+                'indexes': [models.Index(fields=['last_accessed_at'], name='uploads_ima_last_ac_eb9f2e_idx')],
+                'unique_together': {('original_file', 'key')},
+            },
+        ),
+    ]
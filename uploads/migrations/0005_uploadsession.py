@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:36
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('uploads', '0004_imagevariant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_name', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(max_length=100)),
+                ('total_size', models.BigIntegerField()),
+                ('checksum', models.CharField(blank=True, max_length=64)),
+                ('received_bytes', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('active', 'Em andamento'), ('completed', 'Concluída'), ('failed', 'Falhou')], default='active', max_length=20)),
+                ('description', models.TextField(blank=True)),
+                ('alt_text', models.CharField(blank=True, max_length=255)),
+                ('is_public', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='accounts.account')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+                ('uploaded_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='uploads.uploadedfile')),
+            ],
+            options={
+                'db_table': 'uploads_session',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='uploads_ses_status_9ccbc1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:39
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+        ('uploads', '0005_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='FileBlob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.BigIntegerField()),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='file_blobs', to='accounts.account')),
+            ],
+            options={
+                'db_table': 'uploads_blob',
+            },
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='uploads.fileblob'),
+        ),
+        migrations.AddConstraint(
+            model_name='fileblob',
+            constraint=models.UniqueConstraint(fields=('account', 'sha256'), name='uploads_blob_account_sha256'),
+        ),
+        migrations.AddConstraint(
+            model_name='fileblob',
+            constraint=models.UniqueConstraint(condition=models.Q(('account__isnull', True)), fields=('sha256',), name='uploads_blob_global_sha256'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0006_fileblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='metadata_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='orientation',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
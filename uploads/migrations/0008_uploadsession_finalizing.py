@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0007_uploadedfile_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('active', 'Em andamento'), ('finalizing', 'Finalizando'), ('completed', 'Concluída'), ('failed', 'Falhou')], default='active', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0009_uploadedfile_blob_restrict'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('active', 'Em andamento'), ('writing', 'Recebendo parte'), ('finalizing', 'Finalizando'), ('completed', 'Concluída'), ('failed', 'Falhou')], default='active', max_length=20),
+        ),
+    ]
@@ -1,12 +1,12 @@
 import os
 import uuid
 from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
 from django.core.validators import FileExtensionValidator
+from django.urls import reverse
 from django.utils import timezone
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
 
 from accounts.models import Account
 
@@ -20,6 +20,40 @@ def upload_to(instance, filename):
     return os.path.join('uploads', str(instance.account.id), filename)
 
 
+class FileBlob(models.Model):
+    """Conteúdo armazenado uma única vez, identificado pelo SHA-256
+    
+    Vários UploadedFile com o mesmo conteúdo apontam para o mesmo blob
+    (por conta ou global, conforme UPLOADS_DEDUP_SCOPE); ref_count conta as
+    referências e o arquivo é removido quando chega a zero.
+    """
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Nulo quando a deduplicação é global
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, null=True, blank=True, related_name='file_blobs'
+    )
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    file = models.FileField(max_length=255)
+    ref_count = models.PositiveIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'uploads_blob'
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'sha256'], name='uploads_blob_account_sha256'),
+            models.UniqueConstraint(
+                fields=['sha256'], condition=models.Q(account__isnull=True),
+                name='uploads_blob_global_sha256'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} referência(s))"
+
+
 class UploadedFile(models.Model):
     """Modelo para arquivos enviados pelos usuários"""
     
@@ -31,6 +65,14 @@ class UploadedFile(models.Model):
         ('other', 'Outro'),
     ]
     
+    THUMBNAIL_STATUS_CHOICES = [
+        ('none', 'Sem thumbnails'),
+        ('pending', 'Pendente'),
+        ('processing', 'Processando'),
+        ('ready', 'Pronto'),
+        ('failed', 'Falhou'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='uploaded_files')
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files')
@@ -39,12 +81,26 @@ class UploadedFile(models.Model):
     file = models.FileField(upload_to=upload_to)
     original_name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES)
-    file_size = models.PositiveIntegerField()  # em bytes
+    file_size = models.PositiveBigIntegerField()  # em bytes
     mime_type = models.CharField(max_length=100)
     
-    # Metadados para imagens
+    # Conteúdo deduplicado (arquivos antigos não têm blob). RESTRICT: um blob
+    # referenciado só é apagado junto com a conta (cascade dos dois lados)
+    blob = models.ForeignKey(
+        FileBlob, on_delete=models.RESTRICT, null=True, blank=True, related_name='files'
+    )
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    
+    # Metadados para imagens (extraídos em background, ver ImageMetadataService)
     width = models.PositiveIntegerField(null=True, blank=True)
     height = models.PositiveIntegerField(null=True, blank=True)
+    orientation = models.PositiveSmallIntegerField(null=True, blank=True)  # EXIF
+    dominant_color = models.CharField(max_length=7, blank=True)  # #rrggbb
+    blurhash = models.CharField(max_length=64, blank=True)
+    metadata_hash = models.CharField(max_length=64, blank=True)  # conteúdo já processado
+    
+    # Thumbnails gerados em background (ver uploads/services.py)
+    thumbnail_status = models.CharField(max_length=20, choices=THUMBNAIL_STATUS_CHOICES, default='none')
     
     # Informações adicionais
     description = models.TextField(blank=True)
@@ -67,6 +123,18 @@ class UploadedFile(models.Model):
     def __str__(self):
         return f"{self.original_name} ({self.account.name})"
     
+    # Nome do arquivo carregado do banco (None para instâncias novas)
+    _loaded_file_name = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'file' in field_names:
+            instance._loaded_file_name = values[field_names.index('file')] or None
+        else:
+            instance._loaded_file_name = models.DEFERRED
+        return instance
+    
     def save(self, *args, **kwargs):
         if self.file:
             # Definir nome original se não estiver definido
@@ -80,16 +148,16 @@ class UploadedFile(models.Model):
             # Detectar tipo de arquivo
             if not self.file_type:
                 self.file_type = self._detect_file_type()
-            
-            # Para imagens, extrair dimensões
-            if self.file_type == 'image' and not self.width:
-                try:
-                    image = Image.open(self.file)
-                    self.width, self.height = image.size
-                except Exception:
-                    pass
         
         super().save(*args, **kwargs)
+        
+        # Metadados de imagem só quando o arquivo muda, fora da requisição
+        file_name = self.file.name if self.file else None
+        if self._loaded_file_name is not models.DEFERRED and file_name != self._loaded_file_name:
+            self._loaded_file_name = file_name
+            if self.is_image:
+                from .services import ImageMetadataService
+                ImageMetadataService.schedule(self)
     
     def _detect_file_type(self):
         """Detecta o tipo de arquivo baseado na extensão"""
@@ -133,12 +201,18 @@ class UploadedFile(models.Model):
         return self.file_type == 'image'
     
     def get_thumbnail_url(self, size='medium'):
-        """Retorna URL do thumbnail (se for imagem)"""
+        """Retorna URL do thumbnail (se for imagem)
+        
+        Enquanto o thumbnail ainda não foi gerado, retorna a URL original.
+        """
         if not self.is_image:
             return None
         
-        # Aqui você implementaria a lógica de thumbnail
-        # Por enquanto, retorna a URL original
+        if self.thumbnail_status == 'ready':
+            # Usa o prefetch de thumbnails quando disponível
+            if any(thumbnail.size == size for thumbnail in self.thumbnails.all()):
+                return reverse('uploads:thumbnail_serve', args=[self.id, size])
+        
         return self.file.url if self.file else None
 
 
@@ -174,60 +248,110 @@ class ImageThumbnail(models.Model):
     
     @classmethod
     def create_thumbnail(cls, uploaded_file, size='medium'):
-        """Cria um thumbnail para uma imagem"""
-        if not uploaded_file.is_image:
-            return None
-        
-        # Definir dimensões baseado no tamanho
-        size_map = {
-            'small': (150, 150),
-            'medium': (300, 300),
-            'large': (600, 600),
-        }
-        
-        target_size = size_map.get(size, (300, 300))
-        
-        try:
-            # Abrir imagem original
-            image = Image.open(uploaded_file.file)
-            
-            # Converter para RGB se necessário
-            if image.mode in ('RGBA', 'LA', 'P'):
-                image = image.convert('RGB')
-            
-            # Redimensionar mantendo proporção
-            image.thumbnail(target_size, Image.Resampling.LANCZOS)
-            
-            # Salvar thumbnail
-            thumb_io = BytesIO()
-            image.save(thumb_io, format='JPEG', quality=85)
-            thumb_io.seek(0)
-            
-            # Criar nome do arquivo
-            original_name = uploaded_file.original_name
-            name_without_ext = os.path.splitext(original_name)[0]
-            thumb_name = f"{name_without_ext}_{size}.jpg"
-            
-            # Criar objeto thumbnail
-            thumbnail = cls(
-                original_file=uploaded_file,
-                size=size,
-                width=image.width,
-                height=image.height
-            )
-            
-            thumbnail.file.save(
-                thumb_name,
-                ContentFile(thumb_io.getvalue()),
-                save=False
-            )
-            
-            thumbnail.save()
-            return thumbnail
-            
-        except Exception as e:
-            print(f"Erro ao criar thumbnail: {e}")
-            return None
+        """Cria um thumbnail para uma imagem (de forma síncrona)"""
+        from .services import ThumbnailService
+        return ThumbnailService.generate(uploaded_file, [size]).get(size)
+
+
+class ImageVariant(models.Model):
+    """Variante derivada de uma imagem (tamanho/recorte/formato sob demanda)
+    
+    O arquivo fica num caminho endereçado pelo hash dos parâmetros e do
+    original, então cada variante é gerada e armazenada uma única vez.
+    """
+    
+    FIT_CHOICES = [
+        ('contain', 'Conter'),
+        ('cover', 'Cobrir'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('jpeg', 'JPEG'),
+        ('png', 'PNG'),
+        ('webp', 'WebP'),
+        ('avif', 'AVIF'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    original_file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='variants')
+    key = models.CharField(max_length=64)
+    
+    # Parâmetros da transformação
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    fit = models.CharField(max_length=10, choices=FIT_CHOICES, default='contain')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    
+    # Arquivo gerado
+    file = models.FileField(max_length=255)
+    file_size = models.PositiveIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'uploads_image_variant'
+        unique_together = ['original_file', 'key']
+        indexes = [
+            models.Index(fields=['last_accessed_at']),
+        ]
+    
+    def __str__(self):
+        return f"Variante {self.width or '-'}x{self.height or '-'} {self.format} - {self.original_file.original_name}"
+
+
+class UploadSession(models.Model):
+    """Sessão de upload em partes (retomável) para arquivos grandes
+    
+    As partes são gravadas direto em disco (UPLOADS_CHUNK_DIR); a quota só
+    é cobrada quando a sessão é finalizada e vira um UploadedFile.
+    """
+    
+    STATUS_CHOICES = [
+        ('active', 'Em andamento'),
+        ('writing', 'Recebendo parte'),
+        ('finalizing', 'Finalizando'),
+        ('completed', 'Concluída'),
+        ('failed', 'Falhou'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='upload_sessions')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    
+    # Arquivo esperado
+    original_name = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    checksum = models.CharField(max_length=64, blank=True)  # SHA-256 informado pelo cliente
+    
+    # Progresso
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    uploaded_file = models.ForeignKey(
+        UploadedFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
+    # Campos do UploadedFile final
+    description = models.TextField(blank=True)
+    alt_text = models.CharField(max_length=255, blank=True)
+    is_public = models.BooleanField(default=False)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'uploads_session'
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Upload {self.original_name} ({self.received_bytes}/{self.total_size})"
+    
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
 
 
 class UploadQuota(models.Model):
@@ -293,21 +417,81 @@ class UploadQuota(models.Model):
         
         return True, "OK"
     
+    def reserve_upload(self, file_size_bytes):
+        """Reserva espaço e uma vaga do limite mensal de forma atômica
+        
+        A conferência e o incremento acontecem num único UPDATE condicional,
+        então uploads simultâneos não ultrapassam a quota. Se o upload falhar,
+        a reserva deve ser desfeita com release_upload().
+        
+        Returns:
+            tuple: (reservado, mensagem)
+        """
+        file_size_mb = file_size_bytes / (1024 * 1024)
+        if file_size_mb > self.max_file_size_mb:
+            return False, f"Arquivo muito grande. Máximo: {self.max_file_size_mb}MB"
+        
+        reserved = UploadQuota.objects.filter(
+            pk=self.pk,
+            files_uploaded_this_month__lt=models.F('max_files_per_month'),
+            used_storage_bytes__lte=models.F('max_storage_mb') * 1024 * 1024 - file_size_bytes
+        ).update(
+            used_storage_bytes=models.F('used_storage_bytes') + file_size_bytes,
+            files_uploaded_this_month=models.F('files_uploaded_this_month') + 1,
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['used_storage_bytes', 'files_uploaded_this_month'])
+        if reserved:
+            return True, "OK"
+        
+        can_upload, error_msg = self.can_upload_file(file_size_bytes)
+        return False, error_msg if not can_upload else "Espaço de armazenamento insuficiente"
+    
+    def release_upload(self, file_size_bytes):
+        """Desfaz uma reserva de upload que não foi concluído"""
+        UploadQuota.objects.filter(pk=self.pk).update(
+            used_storage_bytes=Greatest(models.F('used_storage_bytes') - file_size_bytes, 0),
+            files_uploaded_this_month=Greatest(models.F('files_uploaded_this_month') - 1, 0),
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['used_storage_bytes', 'files_uploaded_this_month'])
+    
     def add_file_usage(self, file_size_bytes):
         """Adiciona uso de arquivo à quota"""
-        self.used_storage_bytes += file_size_bytes
-        self.files_uploaded_this_month += 1
-        self.save()
+        UploadQuota.objects.filter(pk=self.pk).update(
+            used_storage_bytes=models.F('used_storage_bytes') + file_size_bytes,
+            files_uploaded_this_month=models.F('files_uploaded_this_month') + 1,
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['used_storage_bytes', 'files_uploaded_this_month'])
     
     def remove_file_usage(self, file_size_bytes):
         """Remove uso de arquivo da quota"""
-        self.used_storage_bytes = max(0, self.used_storage_bytes - file_size_bytes)
-        self.save()
+        UploadQuota.objects.filter(pk=self.pk).update(
+            used_storage_bytes=Greatest(models.F('used_storage_bytes') - file_size_bytes, 0),
+            updated_at=timezone.now()
+        )
+        self.refresh_from_db(fields=['used_storage_bytes'])
     
     def reset_monthly_counter(self):
         """Reseta o contador mensal"""
         today = timezone.now().date()
         if today.month != self.last_reset_date.month or today.year != self.last_reset_date.year:
-            self.files_uploaded_this_month = 0
-            self.last_reset_date = today
-            self.save()
+            # Condicional: só uma requisição concorrente faz o reset
+            UploadQuota.objects.filter(
+                pk=self.pk, last_reset_date__lt=today.replace(day=1)
+            ).update(files_uploaded_this_month=0, last_reset_date=today)
+            self.refresh_from_db(fields=['files_uploaded_this_month', 'last_reset_date'])
+    
+    def compute_used_storage(self):
+        """Recalcula o armazenamento usado a partir dos arquivos da conta
+        
+        Blobs deduplicados contam uma vez por conta; arquivos anteriores à
+        deduplicação contam pelo file_size.
+        """
+        files = UploadedFile.objects.filter(account_id=self.account_id)
+        legacy = files.filter(blob__isnull=True).aggregate(total=Sum('file_size'))['total'] or 0
+        blobs = FileBlob.objects.filter(
+            pk__in=files.filter(blob__isnull=False).values('blob')
+        ).aggregate(total=Sum('size'))['total'] or 0
+        return legacy + blobs
@@ -0,0 +1,961 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from datetime import timedelta
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from PIL import Image, ImageOps
+
+from . import blurhash
+from .models import (
+    FileBlob, UploadedFile, ImageThumbnail, ImageVariant, UploadQuota, UploadSession,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStoreService:
+    """Armazenamento dos uploads endereçado pelo conteúdo (SHA-256).
+
+    Conteúdos idênticos são gravados uma única vez em
+    blobs/<escopo>/<hash[:2]>/<hash>.<ext> e compartilhados entre os
+    UploadedFile (FileBlob.ref_count). O escopo é a conta ou global
+    (UPLOADS_DEDUP_SCOPE). Na quota, cada conta paga os bytes de um blob
+    uma vez só, enquanto tiver algum arquivo apontando para ele.
+    """
+
+    @staticmethod
+    def hash_file(django_file):
+        """SHA-256 do arquivo, lido em blocos"""
+        digest = hashlib.sha256()
+        for chunk in django_file.chunks():
+            digest.update(chunk)
+        django_file.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def get_scope(account):
+        if getattr(settings, 'UPLOADS_DEDUP_SCOPE', 'account') == 'global':
+            return None
+        return account
+
+    @staticmethod
+    def get_path(scope, sha256, original_name):
+        ext = os.path.splitext(original_name)[1].lower()
+        folder = str(scope.pk) if scope is not None else 'global'
+        return f'blobs/{folder}/{sha256[:2]}/{sha256}{ext}'
+
+    @staticmethod
+    def acquire(account, django_file, original_name, sha256=None):
+        """Retorna o blob do conteúdo (criando-o se necessário) com uma referência a mais"""
+        sha256 = sha256 or BlobStoreService.hash_file(django_file)
+        scope = BlobStoreService.get_scope(account)
+        blobs = FileBlob.objects.filter(account=scope, sha256=sha256)
+
+        if blobs.update(ref_count=F('ref_count') + 1):
+            return blobs.get()
+
+        path = BlobStoreService.get_path(scope, sha256, original_name)
+        if not default_storage.exists(path):
+            path = default_storage.save(path, django_file)
+        try:
+            with transaction.atomic():
+                return FileBlob.objects.create(
+                    account=scope, sha256=sha256, size=django_file.size, file=path, ref_count=1
+                )
+        except IntegrityError:
+            # Mesmo conteúdo enviado ao mesmo tempo por outra requisição
+            blobs.update(ref_count=F('ref_count') + 1)
+            return blobs.get()
+
+    @staticmethod
+    def release(blob_id):
+        """Remove uma referência; apaga o blob na última
+
+        Chamado pelo post_delete de UploadedFile (uploads/signals.py); o
+        arquivo do blob é apagado pelo post_delete de FileBlob.
+        """
+        FileBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        FileBlob.objects.filter(pk=blob_id, ref_count=0, files__isnull=True).delete()
+
+    @staticmethod
+    def charged_bytes(account, blob, exclude=None):
+        """Bytes que a conta paga por uma referência ao blob (0 se já tem outra)"""
+        references = UploadedFile.objects.filter(account=account, blob=blob)
+        if exclude is not None:
+            references = references.exclude(pk=exclude.pk)
+        return 0 if references.exists() else blob.size
+
+    @staticmethod
+    def create_file(account, user, django_file, original_name, sha256=None, **fields):
+        """Cria o UploadedFile apontando para o blob do conteúdo
+
+        Returns:
+            tuple: (UploadedFile, bytes a cobrar na quota da conta)
+        """
+        with transaction.atomic():
+            blob = BlobStoreService.acquire(account, django_file, original_name, sha256)
+            charged = BlobStoreService.charged_bytes(account, blob)
+            uploaded_file = UploadedFile.objects.create(
+                account=account,
+                uploaded_by=user,
+                file=blob.file.name,
+                original_name=original_name,
+                file_size=blob.size,
+                blob=blob,
+                content_hash=blob.sha256,
+                **fields
+            )
+        return uploaded_file, charged
+
+    @staticmethod
+    def delete_file(uploaded_file):
+        """Remove o UploadedFile e retorna os bytes a devolver à quota da conta
+
+        A referência ao blob é liberada pelo post_delete de UploadedFile.
+        """
+        with transaction.atomic():
+            if uploaded_file.blob_id is None:
+                # Arquivo anterior à deduplicação
+                released = uploaded_file.file_size
+            else:
+                released = BlobStoreService.charged_bytes(
+                    uploaded_file.account, uploaded_file.blob, exclude=uploaded_file
+                )
+            uploaded_file.delete()
+        return released
+
+
+class ImageMetadataService:
+    """Extração dos metadados das imagens enviadas, fora da requisição.
+
+    Dimensões e orientação EXIF vêm apenas do cabeçalho (Image.open não
+    decodifica os pixels). A cor dominante e o BlurHash usam uma cópia de
+    32px obtida com Image.draft(), sem decodificar a imagem inteira.
+
+    O trabalho é pulado quando o conteúdo não mudou (metadata_hash igual ao
+    SHA-256 do blob) e copiado de outro arquivo com o mesmo conteúdo quando
+    já foi feito para ele.
+    """
+
+    FIELDS = ('width', 'height', 'orientation', 'dominant_color', 'blurhash')
+    PREVIEW_SIZE = (32, 32)
+    BLURHASH_COMPONENTS = (4, 3)
+    # Tag EXIF de orientação
+    ORIENTATION_TAG = 0x0112
+
+    @staticmethod
+    def get_key(uploaded_file):
+        return uploaded_file.content_hash or uploaded_file.file.name
+
+    @staticmethod
+    def read(source):
+        """Lê os metadados de um arquivo de imagem aberto
+
+        Returns:
+            dict: width, height, orientation, dominant_color e blurhash
+        """
+        image = Image.open(source)
+        width, height = image.size
+        orientation = image.getexif().get(ImageMetadataService.ORIENTATION_TAG, 1)
+
+        if image.format == 'JPEG':
+            image.draft('RGB', ImageMetadataService.PREVIEW_SIZE)
+        preview = ImageOps.exif_transpose(image).convert('RGB')
+        preview.thumbnail(ImageMetadataService.PREVIEW_SIZE)
+
+        # Cor mais frequente após reduzir a paleta
+        palette = preview.quantize(colors=8)
+        count, index = max(palette.getcolors())
+        r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+
+        return {
+            'width': width,
+            'height': height,
+            'orientation': orientation,
+            'dominant_color': f'#{r:02x}{g:02x}{b:02x}',
+            'blurhash': blurhash.encode(preview, *ImageMetadataService.BLURHASH_COMPONENTS),
+        }
+
+    @staticmethod
+    def extract(uploaded_file, force=False):
+        """Extrai e grava os metadados; retorna False se não havia o que fazer"""
+        if not uploaded_file.is_image or not uploaded_file.file:
+            return False
+
+        key = ImageMetadataService.get_key(uploaded_file)
+        if uploaded_file.metadata_hash == key and not force:
+            return False
+
+        metadata = None
+        if uploaded_file.content_hash and not force:
+            metadata = UploadedFile.objects.filter(
+                content_hash=uploaded_file.content_hash,
+                metadata_hash=uploaded_file.content_hash
+            ).exclude(pk=uploaded_file.pk).values(*ImageMetadataService.FIELDS).first()
+
+        if metadata is None:
+            try:
+                with uploaded_file.file.open('rb') as source:
+                    metadata = ImageMetadataService.read(source)
+            except Exception as e:
+                logger.error(f"Erro ao extrair metadados de {uploaded_file.pk}: {e}")
+                return False
+
+        metadata['metadata_hash'] = key
+        UploadedFile.objects.filter(pk=uploaded_file.pk).update(**metadata)
+        for field, value in metadata.items():
+            setattr(uploaded_file, field, value)
+        return True
+
+    @staticmethod
+    def schedule(uploaded_file):
+        """Agenda a extração após o commit (task Celery ou síncrona)"""
+        file_id = uploaded_file.pk
+
+        def enqueue():
+            if getattr(settings, 'UPLOADS_METADATA_ASYNC', False):
+                from .tasks import extract_image_metadata
+                try:
+                    extract_image_metadata.delay(str(file_id))
+                    return
+                except Exception as exc:
+                    logger.warning(f'Could not schedule metadata extraction for file {file_id}: {exc}')
+            ImageMetadataService.extract(uploaded_file)
+
+        transaction.on_commit(enqueue)
+
+
+class ThumbnailService:
+    """Geração dos thumbnails das imagens enviadas.
+
+    A imagem original é decodificada uma única vez e todos os tamanhos são
+    derivados dela em ordem decrescente (cada tamanho parte do anterior, já
+    reduzido). Para JPEG, Image.draft() faz o decoder reduzir a imagem já na
+    leitura (escala 1/2, 1/4 ou 1/8), o que evita decodificar fotos grandes em
+    resolução total.
+
+    Nas requisições de upload os thumbnails são gerados pela task Celery
+    generate_thumbnails (ver schedule()); até ficarem prontos,
+    UploadedFile.get_thumbnail_url() retorna a URL do arquivo original.
+    """
+
+    SIZES = {
+        'large': (600, 600),
+        'medium': (300, 300),
+        'small': (150, 150),
+    }
+    JPEG_QUALITY = 85
+
+    @staticmethod
+    def _set_status(uploaded_file, status):
+        uploaded_file.thumbnail_status = status
+        UploadedFile.objects.filter(pk=uploaded_file.pk).update(thumbnail_status=status)
+
+    @staticmethod
+    def generate(uploaded_file, sizes=None, progress=None):
+        """Gera os thumbnails informados (padrão: todos) e retorna {tamanho: ImageThumbnail}
+
+        Args:
+            uploaded_file: UploadedFile de imagem
+            sizes: Tamanhos a gerar (chaves de SIZES)
+            progress: Função chamada com (gerados, total) após cada tamanho
+        """
+        if not uploaded_file.is_image:
+            return {}
+
+        sizes = sorted(
+            [size for size in (sizes or ThumbnailService.SIZES) if size in ThumbnailService.SIZES],
+            key=lambda size: ThumbnailService.SIZES[size][0],
+            reverse=True,
+        )
+        ThumbnailService._set_status(uploaded_file, 'processing')
+
+        thumbnails = {}
+        try:
+            with uploaded_file.file.open('rb') as source:
+                image = Image.open(source)
+                if image.format == 'JPEG':
+                    # Decodifica já reduzida, mas nunca abaixo do maior tamanho pedido
+                    image.draft('RGB', ThumbnailService.SIZES[sizes[0]])
+                image.load()
+
+            # Converter para RGB se necessário
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGB')
+
+            name_without_ext = os.path.splitext(uploaded_file.original_name)[0]
+            for done, size in enumerate(sizes, start=1):
+                # Redimensiona a partir do tamanho anterior (ordem decrescente)
+                image.thumbnail(ThumbnailService.SIZES[size], Image.Resampling.LANCZOS)
+                thumb_io = BytesIO()
+                image.save(thumb_io, format='JPEG', quality=ThumbnailService.JPEG_QUALITY)
+
+                ImageThumbnail.objects.filter(original_file=uploaded_file, size=size).delete()
+                thumbnail = ImageThumbnail(
+                    original_file=uploaded_file,
+                    size=size,
+                    width=image.width,
+                    height=image.height
+                )
+                thumbnail.file.save(
+                    f"{name_without_ext}_{size}.jpg",
+                    ContentFile(thumb_io.getvalue()),
+                    save=False
+                )
+                thumbnail.save()
+                thumbnails[size] = thumbnail
+
+                if progress:
+                    progress(done, len(sizes))
+        except Exception as e:
+            logger.error(f"Erro ao criar thumbnails de {uploaded_file.pk}: {e}")
+            ThumbnailService._set_status(uploaded_file, 'failed')
+            return thumbnails
+
+        ThumbnailService._set_status(uploaded_file, 'ready')
+        return thumbnails
+
+    @staticmethod
+    def schedule(uploaded_file):
+        """Agenda a geração dos thumbnails em background após o commit.
+
+        Com UPLOADS_THUMBNAILS_ASYNC desativado (padrão em DEBUG) ou sem
+        broker disponível, os thumbnails são gerados na própria requisição.
+        """
+        if not uploaded_file.is_image:
+            return
+        ThumbnailService._set_status(uploaded_file, 'pending')
+        file_id = uploaded_file.pk
+
+        def enqueue():
+            if getattr(settings, 'UPLOADS_THUMBNAILS_ASYNC', False):
+                from .tasks import generate_thumbnails
+                try:
+                    generate_thumbnails.delay(str(file_id))
+                    return
+                except Exception as exc:
+                    logger.warning(f'Could not schedule thumbnails for file {file_id}: {exc}')
+            ThumbnailService.generate(uploaded_file)
+
+        transaction.on_commit(enqueue)
+
+
+class FileServeService:
+    """Entrega de arquivos enviados após a verificação de acesso.
+
+    Os bytes nunca são carregados inteiros na memória do worker: a resposta é
+    um FileResponse (leitura em blocos) ou, para requisições com Range, uma
+    resposta 206 com apenas o intervalo pedido. ETag e Last-Modified permitem
+    respostas 304.
+
+    Com UPLOADS_SERVE_MODE = 'nginx' (X-Accel-Redirect) ou 'sendfile'
+    (X-Sendfile), o Django apenas autoriza e o servidor web envia o arquivo.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+    @staticmethod
+    def get_etag(instance, size):
+        changed = getattr(instance, 'updated_at', None) or instance.created_at
+        return quote_etag(f'{instance.pk}-{int(changed.timestamp())}-{size}')
+
+    @staticmethod
+    def parse_range(header, size):
+        """Interpreta um cabeçalho Range de intervalo único
+
+        Returns:
+            tuple: (início, fim) inclusivos, None se o cabeçalho deve ser
+            ignorado ou False se o intervalo não é satisfatível
+        """
+        match = FileServeService.RANGE_RE.match(header.strip())
+        if not match:
+            # Múltiplos intervalos ou unidade desconhecida: resposta completa
+            return None
+
+        start, end = match.groups()
+        if not start and not end:
+            return None
+        if not start:
+            # Sufixo: últimos N bytes
+            length = int(end)
+            if length == 0:
+                return False
+            return max(size - length, 0), size - 1
+
+        start = int(start)
+        end = int(end) if end else size - 1
+        if start >= size or end < start:
+            return False
+        return start, min(end, size - 1)
+
+    @staticmethod
+    def _iter_range(field_file, start, length):
+        with field_file.open('rb') as source:
+            source.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = source.read(min(FileServeService.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    @staticmethod
+    def _accel_response(field_file):
+        mode = getattr(settings, 'UPLOADS_SERVE_MODE', 'django')
+        if mode == 'nginx':
+            response = HttpResponse()
+            prefix = settings.UPLOADS_ACCEL_REDIRECT_PREFIX.rstrip('/')
+            response['X-Accel-Redirect'] = f'{prefix}/{field_file.name}'
+            return response
+        if mode == 'sendfile':
+            response = HttpResponse()
+            response['X-Sendfile'] = field_file.path
+            return response
+        return None
+
+    @staticmethod
+    def serve(request, instance, field_file, content_type, filename):
+        """Retorna a resposta HTTP para o arquivo
+
+        Args:
+            request: Requisição (cabeçalhos Range e condicionais)
+            instance: Objeto dono do arquivo (ETag/Last-Modified)
+            field_file: FieldFile a ser entregue
+            content_type: Tipo MIME da resposta
+            filename: Nome exibido em Content-Disposition
+        """
+        size = field_file.size
+        etag = FileServeService.get_etag(instance, size)
+        last_modified = getattr(instance, 'updated_at', None) or instance.created_at
+        last_modified_ts = int(last_modified.timestamp())
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified_ts
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = FileServeService._accel_response(field_file)
+        if response is None:
+            byte_range = None
+            range_header = request.headers.get('Range')
+            if range_header:
+                if_range = request.headers.get('If-Range')
+                if not if_range or if_range == etag or if_range == http_date(last_modified_ts):
+                    byte_range = FileServeService.parse_range(range_header, size)
+
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+            if byte_range:
+                start, end = byte_range
+                length = end - start + 1
+                response = StreamingHttpResponse(
+                    FileServeService._iter_range(field_file, start, length),
+                    status=206,
+                )
+                response['Content-Range'] = f'bytes {start}-{end}/{size}'
+                response['Content-Length'] = str(length)
+            else:
+                response = FileResponse(field_file.open('rb'), content_type=content_type)
+                response['Content-Length'] = str(size)
+
+        response['Content-Type'] = content_type
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified_ts)
+        return response
+
+
+class ImageVariantService:
+    """Variantes de imagem sob demanda (largura/altura/recorte/formato).
+
+    Os parâmetros chegam por URL assinada (get_url()/srcset()), então só
+    variantes emitidas pela aplicação podem ser geradas. A assinatura não
+    dá acesso: variantes de arquivos privados exigem membership ativa na
+    conta e são servidas com cache privado. Cada variante é
+    gerada na primeira requisição e gravada em variants/<hash>.<ext>, onde o
+    hash cobre o arquivo original e os parâmetros. O índice (ImageVariant) é
+    limitado a UPLOADS_IMAGE_VARIANTS_MAX entradas; as menos acessadas
+    recentemente são removidas junto com seus arquivos.
+    """
+
+    FITS = ('contain', 'cover')
+    # Formato -> (formato do Pillow, tipo MIME, extensão)
+    FORMATS = {
+        'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+        'png': ('PNG', 'image/png', 'png'),
+        'webp': ('WEBP', 'image/webp', 'webp'),
+        'avif': ('AVIF', 'image/avif', 'avif'),
+    }
+    QUALITY = 80
+    SRCSET_WIDTHS = (320, 640, 960, 1280, 1920)
+    SIGNING_SALT = 'uploads.image_variant'
+    # max-age (segundos) das variantes de arquivos privados
+    PRIVATE_MAX_AGE = 60 * 60
+    # Intervalo mínimo entre atualizações de last_accessed_at
+    TOUCH_INTERVAL = timedelta(hours=1)
+
+    @staticmethod
+    def supported_formats():
+        """Formatos de saída suportados pelo Pillow instalado"""
+        Image.init()
+        return [
+            fmt for fmt, (pil_format, _, _) in ImageVariantService.FORMATS.items()
+            if pil_format in Image.SAVE
+        ]
+
+    @staticmethod
+    def normalize(width=None, height=None, fit='contain', format='webp'):
+        """Valida os parâmetros e retorna (width, height, fit, format)
+
+        Raises:
+            ValueError: Parâmetros inválidos ou formato não suportado
+        """
+        max_dimension = settings.UPLOADS_IMAGE_MAX_DIMENSION
+        width = int(width) if width not in (None, '') else None
+        height = int(height) if height not in (None, '') else None
+        for value in (width, height):
+            if value is not None and not 0 < value <= max_dimension:
+                raise ValueError(f'Dimensão deve estar entre 1 e {max_dimension}')
+        if width is None and height is None:
+            raise ValueError('Informe largura ou altura')
+        if fit not in ImageVariantService.FITS:
+            raise ValueError(f'Ajuste inválido: {fit}')
+        if fit == 'cover' and (width is None or height is None):
+            raise ValueError('O ajuste cover exige largura e altura')
+        if format not in ImageVariantService.supported_formats():
+            raise ValueError(f'Formato não suportado: {format}')
+        return width, height, fit, format
+
+    @staticmethod
+    def _signature_value(file_id, width, height, fit, format):
+        return f'{file_id}:{width or ""}:{height or ""}:{fit}:{format}'
+
+    @staticmethod
+    def sign(file_id, width, height, fit, format):
+        signer = signing.Signer(salt=ImageVariantService.SIGNING_SALT)
+        return signer.signature(
+            ImageVariantService._signature_value(file_id, width, height, fit, format)
+        )
+
+    @staticmethod
+    def verify(file_id, width, height, fit, format, signature):
+        expected = ImageVariantService.sign(file_id, width, height, fit, format)
+        return constant_time_compare(expected, signature or '')
+
+    @staticmethod
+    def get_url(uploaded_file, width=None, height=None, fit='contain', format='webp'):
+        """URL assinada de uma variante da imagem"""
+        width, height, fit, format = ImageVariantService.normalize(width, height, fit, format)
+        params = {'fit': fit, 'fmt': format}
+        if width:
+            params['w'] = width
+        if height:
+            params['h'] = height
+        params['s'] = ImageVariantService.sign(uploaded_file.pk, width, height, fit, format)
+        return f"{reverse('uploads:image_variant', args=[uploaded_file.pk])}?{urlencode(params)}"
+
+    @staticmethod
+    def srcset(uploaded_file, widths=None, format='webp'):
+        """Valor de srcset com variantes de largura (nunca maiores que o original)"""
+        widths = widths or ImageVariantService.SRCSET_WIDTHS
+        if uploaded_file.width:
+            widths = [width for width in widths if width < uploaded_file.width] + [uploaded_file.width]
+        return ', '.join(
+            f'{ImageVariantService.get_url(uploaded_file, width=width, format=format)} {width}w'
+            for width in sorted(set(widths))
+        )
+
+    @staticmethod
+    def get_key(uploaded_file, width, height, fit, format):
+        value = f'{uploaded_file.file.name}:{width or ""}:{height or ""}:{fit}:{format}:{ImageVariantService.QUALITY}'
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    @staticmethod
+    def render(source, width, height, fit, format):
+        """Aplica a transformação e retorna os bytes da variante"""
+        image = Image.open(source)
+        if image.format == 'JPEG':
+            # Decodifica já reduzida quando a variante é bem menor que o original
+            image.draft('RGB', (width or image.width, height or image.height))
+        image = ImageOps.exif_transpose(image)
+
+        pil_format = ImageVariantService.FORMATS[format][0]
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+
+        if fit == 'cover':
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail(
+                (width or image.width, height or image.height), Image.Resampling.LANCZOS
+            )
+
+        output = BytesIO()
+        options = {'optimize': True} if pil_format in ('JPEG', 'PNG') else {}
+        if pil_format != 'PNG':
+            options['quality'] = ImageVariantService.QUALITY
+        image.save(output, format=pil_format, **options)
+        return output.getvalue()
+
+    @staticmethod
+    def get_or_create(uploaded_file, width=None, height=None, fit='contain', format='webp'):
+        """Retorna a variante, gerando-a na primeira requisição"""
+        width, height, fit, format = ImageVariantService.normalize(width, height, fit, format)
+        key = ImageVariantService.get_key(uploaded_file, width, height, fit, format)
+
+        variant = ImageVariant.objects.filter(original_file=uploaded_file, key=key).first()
+        if variant is not None:
+            now = timezone.now()
+            if variant.last_accessed_at < now - ImageVariantService.TOUCH_INTERVAL:
+                ImageVariant.objects.filter(pk=variant.pk).update(last_accessed_at=now)
+                variant.last_accessed_at = now
+            return variant
+
+        extension = ImageVariantService.FORMATS[format][2]
+        path = f'variants/{key[:2]}/{key}.{extension}'
+        if not default_storage.exists(path):
+            with uploaded_file.file.open('rb') as source:
+                content = ImageVariantService.render(source, width, height, fit, format)
+            path = default_storage.save(path, ContentFile(content))
+
+        try:
+            with transaction.atomic():
+                variant = ImageVariant.objects.create(
+                    original_file=uploaded_file,
+                    key=key,
+                    width=width,
+                    height=height,
+                    fit=fit,
+                    format=format,
+                    file=path,
+                    file_size=default_storage.size(path),
+                )
+        except IntegrityError:
+            # Gerada ao mesmo tempo por outra requisição
+            return ImageVariant.objects.get(original_file=uploaded_file, key=key)
+
+        ImageVariantService.evict()
+        return variant
+
+    @staticmethod
+    def evict(max_variants=None):
+        """Remove as variantes menos acessadas acima do limite do índice"""
+        if max_variants is None:
+            max_variants = settings.UPLOADS_IMAGE_VARIANTS_MAX
+        excess = ImageVariant.objects.count() - max_variants
+        if excess <= 0:
+            return 0
+
+        stale = list(
+            ImageVariant.objects.order_by('last_accessed_at').values_list('pk', flat=True)[:excess]
+        )
+        # Os arquivos são apagados após o commit pelo post_delete (uploads.signals)
+        ImageVariant.objects.filter(pk__in=stale).delete()
+        return len(stale)
+
+
+class UploadOffsetMismatch(ValueError):
+    """Parte enviada fora de ordem; o cliente deve retomar de expected"""
+
+    def __init__(self, expected):
+        self.expected = expected
+        super().__init__(f'Offset esperado: {expected}')
+
+
+class ChunkedUploadService:
+    """Upload retomável em partes: init -> PUT das partes -> finalize.
+
+    Cada parte é escrita direto no arquivo temporário da sessão
+    (UPLOADS_CHUNK_DIR/<id>.part), lida da requisição em blocos. As partes
+    precisam chegar em sequência (offset == received_bytes); para retomar,
+    o cliente consulta o offset atual da sessão. Nenhuma transação fica
+    aberta enquanto a parte é lida do cliente (ver write_chunk). O SHA-256
+    do arquivo é calculado numa única leitura em blocos na finalização (o
+    estado do hashlib não pode ser persistido entre requisições/workers) e
+    comparado com o informado no init, se houver.
+
+    A quota é conferida no init e cobrada só no finalize. Sessões paradas há
+    mais de UPLOADS_SESSION_TTL segundos são removidas por cleanup_expired().
+    """
+
+    READ_SIZE = 64 * 1024
+
+    @staticmethod
+    def get_chunk_path(session):
+        return os.path.join(settings.UPLOADS_CHUNK_DIR, f'{session.pk}.part')
+
+    @staticmethod
+    def _get_quota(account):
+        quota, created = UploadQuota.objects.get_or_create(account=account)
+        quota.reset_monthly_counter()
+        return quota
+
+    @staticmethod
+    def start(account, user, filename, total_size, mime_type=None, checksum='', **fields):
+        """Cria a sessão após conferir a quota (sem cobrá-la)
+
+        Raises:
+            ValueError: Tamanho inválido ou quota insuficiente
+        """
+        total_size = int(total_size)
+        if total_size <= 0:
+            raise ValueError('Tamanho do arquivo inválido')
+
+        can_upload, error_msg = ChunkedUploadService._get_quota(account).can_upload_file(total_size)
+        if not can_upload:
+            raise ValueError(error_msg)
+
+        if not mime_type:
+            mime_type, _ = mimetypes.guess_type(filename)
+        session = UploadSession.objects.create(
+            account=account,
+            uploaded_by=user,
+            original_name=os.path.basename(filename),
+            mime_type=mime_type or 'application/octet-stream',
+            total_size=total_size,
+            checksum=(checksum or '').lower(),
+            **fields
+        )
+
+        os.makedirs(settings.UPLOADS_CHUNK_DIR, exist_ok=True)
+        open(ChunkedUploadService.get_chunk_path(session), 'wb').close()
+        return session
+
+    # Após este tempo uma sessão em 'writing' é considerada abandonada
+    # (requisição interrompida) e aceita a mesma parte de novo
+    WRITE_TIMEOUT = 10 * 60
+
+    @staticmethod
+    def write_chunk(session_id, offset, stream, length):
+        """Grava uma parte a partir de offset, lendo stream em blocos
+
+        Nenhum lock fica preso durante a leitura da requisição: a parte é
+        reservada com um UPDATE condicional (active -> writing no offset
+        esperado), os bytes são gravados sem transação e received_bytes é
+        confirmado com outro UPDATE condicional.
+
+        Returns:
+            UploadSession: Sessão com received_bytes atualizado
+
+        Raises:
+            UploadOffsetMismatch: offset diferente do já recebido
+            ValueError: Sessão encerrada, outra parte em andamento ou parte
+                além do tamanho declarado
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=ChunkedUploadService.WRITE_TIMEOUT)
+        reserved = UploadSession.objects.filter(
+            Q(status='active') | Q(status='writing', updated_at__lt=stale),
+            pk=session_id,
+            received_bytes=offset,
+            total_size__gte=offset + length,
+        ).update(status='writing', updated_at=now)
+        if not reserved:
+            session = UploadSession.objects.get(pk=session_id)
+            if session.status not in ('active', 'writing'):
+                raise ValueError('Sessão de upload encerrada')
+            if offset != session.received_bytes:
+                raise UploadOffsetMismatch(session.received_bytes)
+            if session.status == 'writing':
+                raise ValueError('Outra parte está sendo enviada')
+            raise ValueError('Parte excede o tamanho declarado do arquivo')
+
+        # O updated_at da reserva identifica esta requisição: se ela expirar
+        # e outra assumir a parte, a confirmação abaixo não acontece
+        lease = UploadSession.objects.filter(pk=session_id, status='writing', updated_at=now)
+        session = UploadSession.objects.get(pk=session_id)
+        written = 0
+        try:
+            with open(ChunkedUploadService.get_chunk_path(session), 'r+b') as target:
+                target.seek(offset)
+                target.truncate()
+                while written < length:
+                    block = stream.read(min(ChunkedUploadService.READ_SIZE, length - written))
+                    if not block:
+                        break
+                    target.write(block)
+                    written += len(block)
+        finally:
+            committed = lease.update(
+                status='active', received_bytes=offset + written, updated_at=timezone.now()
+            )
+        session.refresh_from_db()
+        if not committed:
+            raise UploadOffsetMismatch(session.received_bytes)
+        return session
+
+    @staticmethod
+    def compute_checksum(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # Após este tempo uma sessão em 'finalizing' é considerada abandonada
+    # (worker interrompido) e pode ser finalizada de novo
+    FINALIZE_TIMEOUT = 15 * 60
+
+    @staticmethod
+    def _set_status(session_id, status, expected='finalizing'):
+        return UploadSession.objects.filter(pk=session_id, status=expected).update(
+            status=status, updated_at=timezone.now()
+        )
+
+    @staticmethod
+    def finalize(session_id):
+        """Cria o UploadedFile a partir das partes e cobra a quota
+
+        O lock da sessão dura só a troca para 'finalizing'; o checksum e a
+        cópia do arquivo (que podem levar minutos em arquivos grandes) são
+        feitos fora dele, e novas partes são recusadas enquanto isso.
+
+        Raises:
+            ValueError: Upload incompleto, checksum divergente ou quota insuficiente
+        """
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session_id)
+            if session.status == 'completed':
+                return session.uploaded_file
+            stale = timezone.now() - timedelta(seconds=ChunkedUploadService.FINALIZE_TIMEOUT)
+            if session.status == 'finalizing' and session.updated_at >= stale:
+                raise ValueError('Upload já está sendo finalizado')
+            if session.status == 'writing':
+                raise ValueError('Uma parte ainda está sendo enviada')
+            if session.status not in ('active', 'finalizing'):
+                raise ValueError('Sessão de upload encerrada')
+            if not session.is_complete:
+                raise ValueError(
+                    f'Upload incompleto: {session.received_bytes} de {session.total_size} bytes'
+                )
+            session.status = 'finalizing'
+            session.save(update_fields=['status', 'updated_at'])
+
+        path = ChunkedUploadService.get_chunk_path(session)
+        try:
+            checksum = ChunkedUploadService.compute_checksum(path)
+        except FileNotFoundError:
+            ChunkedUploadService._set_status(session.pk, 'failed')
+            raise ValueError('Arquivo do upload não encontrado')
+        if session.checksum and session.checksum != checksum:
+            ChunkedUploadService._set_status(session.pk, 'failed')
+            ChunkedUploadService._remove_part(path)
+            raise ValueError('Checksum do arquivo não confere')
+
+        # A reserva é um UPDATE condicional confirmado na hora: o lock da
+        # quota não fica preso durante a cópia do arquivo
+        quota = ChunkedUploadService._get_quota(session.account)
+        can_upload, error_msg = quota.reserve_upload(session.total_size)
+        if not can_upload:
+            ChunkedUploadService._set_status(session.pk, 'active')
+            raise ValueError(error_msg)
+
+        try:
+            with open(path, 'rb') as source:
+                uploaded_file, charged = BlobStoreService.create_file(
+                    session.account,
+                    session.uploaded_by,
+                    File(source, name=session.original_name),
+                    session.original_name,
+                    sha256=checksum,
+                    mime_type=session.mime_type,
+                    description=session.description,
+                    alt_text=session.alt_text,
+                    is_public=session.is_public
+                )
+        except Exception:
+            # Erro de storage: desfaz a reserva e o cliente pode tentar de novo
+            quota.release_upload(session.total_size)
+            ChunkedUploadService._set_status(session.pk, 'active')
+            raise
+
+        if charged < session.total_size:
+            quota.remove_file_usage(session.total_size - charged)
+
+        UploadSession.objects.filter(pk=session.pk).update(
+            status='completed', uploaded_file=uploaded_file, updated_at=timezone.now()
+        )
+        transaction.on_commit(lambda: ChunkedUploadService._remove_part(path))
+
+        ThumbnailService.schedule(uploaded_file)
+        return uploaded_file
+
+    @staticmethod
+    def _remove_part(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def cleanup_expired(ttl=None):
+        """Remove sessões abandonadas e seus arquivos temporários
+
+        Returns:
+            int: Quantidade de sessões removidas
+        """
+        if ttl is None:
+            ttl = settings.UPLOADS_SESSION_TTL
+        cutoff = timezone.now() - timedelta(seconds=ttl)
+        expired = UploadSession.objects.filter(updated_at__lt=cutoff).exclude(status='completed')
+
+        removed = 0
+        for session in expired.iterator():
+            ChunkedUploadService._remove_part(ChunkedUploadService.get_chunk_path(session))
+            removed += 1
+        expired.delete()
+
+        # Sessões concluídas só servem para respostas idempotentes do finalize
+        UploadSession.objects.filter(status='completed', updated_at__lt=cutoff).delete()
+        return removed
+
+
+class UploadQuotaService:
+    """Conferência das quotas de upload com os arquivos existentes."""
+
+    @staticmethod
+    def reconcile(quotas=None, dry_run=False):
+        """Recalcula used_storage_bytes a partir dos arquivos de cada conta
+
+        Returns:
+            list: (quota, valor anterior, valor recalculado) das quotas divergentes
+        """
+        if quotas is None:
+            quotas = UploadQuota.objects.select_related('account')
+
+        changed = []
+        for quota in quotas.iterator():
+            used = quota.compute_used_storage()
+            if used != quota.used_storage_bytes:
+                changed.append((quota, quota.used_storage_bytes, used))
+                if not dry_run:
+                    UploadQuota.objects.filter(pk=quota.pk).update(
+                        used_storage_bytes=used, updated_at=timezone.now()
+                    )
+        return changed
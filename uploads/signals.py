@@ -0,0 +1,49 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import FileBlob, ImageThumbnail, ImageVariant, UploadedFile
+from .services import BlobStoreService
+
+
+def delete_unreferenced_file(model, path):
+    """Apaga o arquivo após o commit, se nenhuma linha de model apontar para ele
+
+    A conferência é feita na hora de apagar: um blob recriado com o mesmo
+    conteúdo (mesmo caminho) entre o delete e o commit mantém o arquivo.
+    """
+    if not path:
+        return
+
+    def delete():
+        if not model.objects.filter(file=path).exists():
+            default_storage.delete(path)
+
+    transaction.on_commit(delete)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_uploaded_file(sender, instance, **kwargs):
+    """Libera o blob (ou o arquivo antigo) em qualquer exclusão: admin, cascade, queryset"""
+    if instance.blob_id is not None:
+        BlobStoreService.release(instance.blob_id)
+    elif instance.file:
+        # Arquivo anterior à deduplicação
+        delete_unreferenced_file(UploadedFile, instance.file.name)
+
+
+@receiver(post_delete, sender=FileBlob)
+def delete_blob_file(sender, instance, **kwargs):
+    delete_unreferenced_file(FileBlob, instance.file.name)
+
+
+@receiver(post_delete, sender=ImageThumbnail)
+def delete_thumbnail_file(sender, instance, **kwargs):
+    delete_unreferenced_file(ImageThumbnail, instance.file.name)
+
+
+@receiver(post_delete, sender=ImageVariant)
+def delete_variant_file(sender, instance, **kwargs):
+    """Variantes deduplicadas compartilham o caminho; só apaga sem referências"""
+    delete_unreferenced_file(ImageVariant, instance.file.name)
@@ -0,0 +1,41 @@
+from celery import shared_task
+
+from .models import UploadedFile
+from .services import (
+    ChunkedUploadService, ImageMetadataService, ThumbnailService, UploadQuotaService,
+)
+
+
+@shared_task(bind=True)
+def generate_thumbnails(self, file_id, sizes=None):
+    """Gera os thumbnails de uma imagem enviada, informando o progresso"""
+    uploaded_file = UploadedFile.objects.filter(pk=file_id).first()
+    if uploaded_file is None:
+        return {'done': 0, 'total': 0}
+
+    def progress(done, total):
+        self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+
+    thumbnails = ThumbnailService.generate(uploaded_file, sizes, progress=progress)
+    return {'done': len(thumbnails), 'total': len(sizes or ThumbnailService.SIZES)}
+
+
+@shared_task
+def extract_image_metadata(file_id, force=False):
+    """Extrai dimensões, orientação, cor dominante e BlurHash de uma imagem"""
+    uploaded_file = UploadedFile.objects.filter(pk=file_id).first()
+    if uploaded_file is None:
+        return False
+    return ImageMetadataService.extract(uploaded_file, force=force)
+
+
+@shared_task
+def cleanup_upload_sessions():
+    """Remove sessões de upload em partes abandonadas"""
+    return ChunkedUploadService.cleanup_expired()
+
+
+@shared_task
+def reconcile_upload_quotas():
+    """Corrige quotas cujo uso divergiu dos arquivos existentes"""
+    return len(UploadQuotaService.reconcile())
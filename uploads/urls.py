@@ -16,8 +16,15 @@ urlpatterns = [
     # Servir arquivos
     path('file/<uuid:file_id>/serve/', views.file_serve, name='file_serve'),
     path('thumbnail/<uuid:file_id>/<str:size>/', views.thumbnail_serve, name='thumbnail_serve'),
+    path('file/<uuid:file_id>/thumbnails/', views.thumbnail_status, name='thumbnail_status'),
+    path('image/<uuid:file_id>/', views.image_variant, name='image_variant'),
     
     # API endpoints
     path('quota-status/', views.quota_status, name='quota_status'),
     path('ajax-upload/', views.ajax_upload, name='ajax_upload'),
+    
+    # Upload em partes (retomável)
+    path('sessions/', views.upload_session_start, name='upload_session_start'),
+    path('sessions/<uuid:session_id>/', views.upload_session_chunk, name='upload_session_chunk'),
+    path('sessions/<uuid:session_id>/finalize/', views.upload_session_finalize, name='upload_session_finalize'),
 ]
\ No newline at end of file
@@ -7,14 +7,20 @@ from django.http import JsonResponse, HttpResponse, Http404
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator
+from django.urls import reverse
 from django.db.models import Q, Sum
 from django.utils import timezone
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.core.exceptions import ValidationError
 
 from accounts.models import Account, AccountMembership
-from .models import UploadedFile, ImageThumbnail, UploadQuota
+from .models import UploadedFile, ImageThumbnail, UploadQuota, UploadSession
+from .services import (
+    BlobStoreService, ChunkedUploadService, FileServeService, ImageVariantService, ThumbnailService,
+    UploadOffsetMismatch,
+)
 
 
 @login_required
@@ -34,7 +40,7 @@ def file_list(request):
     # Query base - arquivos das contas do usuário
     files = UploadedFile.objects.filter(
         account__in=user_accounts
-    ).select_related('account', 'uploaded_by')
+    ).select_related('account', 'uploaded_by').prefetch_related('thumbnails')
     
     # Filtros
     if search:
@@ -108,8 +114,8 @@ def file_upload(request):
         # Processar cada arquivo
         files = request.FILES.getlist('files')
         for file in files:
-            # Verificar se pode fazer upload
-            can_upload, error_msg = quota.can_upload_file(file.size)
+            # Reservar quota (atômico: uploads simultâneos não a ultrapassam)
+            can_upload, error_msg = quota.reserve_upload(file.size)
             if not can_upload:
                 errors.append(f"{file.name}: {error_msg}")
                 continue
@@ -120,31 +126,29 @@ def file_upload(request):
                 if not mime_type:
                     mime_type = 'application/octet-stream'
                 
-                # Criar arquivo
-                uploaded_file = UploadedFile.objects.create(
-                    account=account,
-                    uploaded_by=user,
-                    file=file,
-                    original_name=file.name,
-                    file_size=file.size,
+                # Criar arquivo (conteúdo repetido reaproveita o blob existente)
+                uploaded_file, charged = BlobStoreService.create_file(
+                    account,
+                    user,
+                    file,
+                    file.name,
                     mime_type=mime_type,
                     description=request.POST.get('description', ''),
                     alt_text=request.POST.get('alt_text', ''),
                     is_public=request.POST.get('is_public') == 'on'
                 )
                 
-                # Atualizar quota
-                quota.add_file_usage(file.size)
+                # Devolver os bytes já pagos por outro arquivo com o mesmo conteúdo
+                if charged < file.size:
+                    quota.remove_file_usage(file.size - charged)
                 
-                # Criar thumbnail se for imagem
-                if uploaded_file.is_image:
-                    ImageThumbnail.create_thumbnail(uploaded_file, 'small')
-                    ImageThumbnail.create_thumbnail(uploaded_file, 'medium')
-                    ImageThumbnail.create_thumbnail(uploaded_file, 'large')
+                # Thumbnails gerados em background (se for imagem)
+                ThumbnailService.schedule(uploaded_file)
                 
                 uploaded_files.append(uploaded_file)
                 
             except Exception as e:
+                quota.release_upload(file.size)
                 errors.append(f"{file.name}: Erro ao processar arquivo - {str(e)}")
         
         # Mensagens de resultado
@@ -275,28 +279,15 @@ def file_delete(request, file_id):
         messages.error(request, 'Você não tem permissão para deletar este arquivo.')
         return redirect('uploads:file_detail', file_id=file.id)
     
-    # Atualizar quota
-    quota = UploadQuota.objects.get(account=file.account)
-    quota.remove_file_usage(file.file_size)
-    
     file_name = file.original_name
     
-    # Deletar arquivo físico
-    if file.file:
-        try:
-            default_storage.delete(file.file.name)
-        except Exception:
-            pass
-    
-    # Deletar thumbnails
-    for thumbnail in file.thumbnails.all():
-        if thumbnail.file:
-            try:
-                default_storage.delete(thumbnail.file.name)
-            except Exception:
-                pass
+    # Deletar arquivo; thumbnails, variantes e o conteúdo sem outras
+    # referências são apagados após o commit (uploads.signals)
+    released = BlobStoreService.delete_file(file)
     
-    file.delete()
+    # Atualizar quota
+    quota = UploadQuota.objects.get(account=file.account)
+    quota.remove_file_usage(released)
     
     messages.success(request, f'Arquivo "{file_name}" deletado com sucesso!')
     return redirect('uploads:file_list')
@@ -325,15 +316,10 @@ def file_serve(request, file_id):
         if not has_access:
             raise Http404("Arquivo não encontrado")
     
-    # Servir arquivo
+    # Servir arquivo em blocos (com suporte a Range)
     try:
-        response = HttpResponse(
-            file.file.read(),
-            content_type=file.mime_type
-        )
-        response['Content-Disposition'] = f'inline; filename="{file.original_name}"'
-        return response
-    except Exception:
+        return FileServeService.serve(request, file, file.file, file.mime_type, file.original_name)
+    except (FileNotFoundError, ValueError):
         raise Http404("Arquivo não encontrado")
 
 
@@ -359,25 +345,95 @@ def thumbnail_serve(request, file_id, size):
         if not has_access:
             raise Http404("Thumbnail não encontrado")
     
-    # Buscar thumbnail
-    thumbnail = get_object_or_404(
-        ImageThumbnail,
-        original_file=file,
-        size=size
-    )
+    # Buscar thumbnail; enquanto não foi gerado, usar o arquivo original
+    thumbnail = ImageThumbnail.objects.filter(original_file=file, size=size).first()
+    if thumbnail is None:
+        if file.is_image:
+            return redirect('uploads:file_serve', file_id=file.id)
+        raise Http404("Thumbnail não encontrado")
     
     # Servir thumbnail
     try:
-        response = HttpResponse(
-            thumbnail.file.read(),
-            content_type='image/jpeg'
+        return FileServeService.serve(
+            request, thumbnail, thumbnail.file, 'image/jpeg', f'thumb_{size}_{file.original_name}'
         )
-        response['Content-Disposition'] = f'inline; filename="thumb_{size}_{file.original_name}"'
-        return response
-    except Exception:
+    except (FileNotFoundError, ValueError):
         raise Http404("Thumbnail não encontrado")
 
 
+def image_variant(request, file_id):
+    """Variante de imagem sob demanda (parâmetros assinados por ImageVariantService.get_url)"""
+    params = {
+        'width': request.GET.get('w'),
+        'height': request.GET.get('h'),
+        'fit': request.GET.get('fit', 'contain'),
+        'format': request.GET.get('fmt', 'webp'),
+    }
+    try:
+        width, height, fit, format = ImageVariantService.normalize(**params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # A assinatura garante que só variantes emitidas pela aplicação são geradas
+    if not ImageVariantService.verify(file_id, width, height, fit, format, request.GET.get('s')):
+        raise Http404("Imagem não encontrada")
+    
+    file = get_object_or_404(UploadedFile, id=file_id, file_type='image')
+    
+    # Arquivos privados continuam exigindo acesso à conta, mesmo com a URL
+    if not file.is_public:
+        has_access = request.user.is_authenticated and AccountMembership.objects.filter(
+            account=file.account,
+            user=request.user,
+            status='active'
+        ).exists()
+        if not has_access:
+            raise Http404("Imagem não encontrada")
+    
+    try:
+        variant = ImageVariantService.get_or_create(file, width, height, fit, format)
+        content_type = ImageVariantService.FORMATS[variant.format][1]
+        name_without_ext = file.original_name.rsplit('.', 1)[0]
+        response = FileServeService.serve(
+            request, variant, variant.file, content_type,
+            f"{name_without_ext}.{ImageVariantService.FORMATS[variant.format][2]}"
+        )
+    except (FileNotFoundError, OSError, ValueError):
+        raise Http404("Imagem não encontrada")
+    
+    # O caminho é endereçado pelo conteúdo: a URL nunca muda de significado.
+    # Variantes privadas só ficam no cache do navegador, e por pouco tempo.
+    if file.is_public:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'private, max-age={ImageVariantService.PRIVATE_MAX_AGE}'
+    return response
+
+
+@login_required
+def thumbnail_status(request, file_id):
+    """Status da geração dos thumbnails (com progresso da task, se informada)"""
+    file = get_object_or_404(
+        UploadedFile,
+        id=file_id,
+        account__memberships__user=request.user,
+        account__memberships__status='active'
+    )
+    
+    data = {
+        'status': file.thumbnail_status,
+        'thumbnails': {
+            thumbnail.size: {
+                'url': reverse('uploads:thumbnail_serve', args=[file.id, thumbnail.size]),
+                'width': thumbnail.width,
+                'height': thumbnail.height
+            }
+            for thumbnail in file.thumbnails.all()
+        },
+    }
+    return JsonResponse(data)
+
+
 @login_required
 def quota_status(request):
     """Status da quota de upload"""
@@ -452,8 +508,8 @@ def ajax_upload(request):
     
     file = request.FILES['file']
     
-    # Verificar se pode fazer upload
-    can_upload, error_msg = quota.can_upload_file(file.size)
+    # Reservar quota (atômico: uploads simultâneos não a ultrapassam)
+    can_upload, error_msg = quota.reserve_upload(file.size)
     if not can_upload:
         return JsonResponse({'error': error_msg}, status=400)
     
@@ -463,33 +519,31 @@ def ajax_upload(request):
         if not mime_type:
             mime_type = 'application/octet-stream'
         
-        # Criar arquivo
-        uploaded_file = UploadedFile.objects.create(
-            account=account,
-            uploaded_by=user,
-            file=file,
-            original_name=file.name,
-            file_size=file.size,
+        # Criar arquivo (conteúdo repetido reaproveita o blob existente)
+        uploaded_file, charged = BlobStoreService.create_file(
+            account,
+            user,
+            file,
+            file.name,
             mime_type=mime_type,
             description=request.POST.get('description', ''),
             alt_text=request.POST.get('alt_text', ''),
             is_public=request.POST.get('is_public') == 'true'
         )
         
-        # Atualizar quota
-        quota.add_file_usage(file.size)
+        # Devolver os bytes já pagos por outro arquivo com o mesmo conteúdo
+        if charged < file.size:
+            quota.remove_file_usage(file.size - charged)
         
-        # Criar thumbnails se for imagem
+        # Thumbnails gerados em background; até ficarem prontos as URLs de
+        # thumbnail redirecionam para o arquivo original
         thumbnails = {}
         if uploaded_file.is_image:
-            for size in ['small', 'medium', 'large']:
-                thumbnail = ImageThumbnail.create_thumbnail(uploaded_file, size)
-                if thumbnail:
-                    thumbnails[size] = {
-                        'url': f'/uploads/thumbnail/{uploaded_file.id}/{size}/',
-                        'width': thumbnail.width,
-                        'height': thumbnail.height
-                    }
+            ThumbnailService.schedule(uploaded_file)
+            for size in ThumbnailService.SIZES:
+                thumbnails[size] = {
+                    'url': reverse('uploads:thumbnail_serve', args=[uploaded_file.id, size]),
+                }
         
         return JsonResponse({
             'success': True,
@@ -499,12 +553,127 @@ def ajax_upload(request):
                 'size': uploaded_file.file_size,
                 'size_human': uploaded_file.file_size_human,
                 'type': uploaded_file.file_type,
-                'url': f'/uploads/file/{uploaded_file.id}/',
+                'url': reverse('uploads:file_detail', args=[uploaded_file.id]),
                 'is_image': uploaded_file.is_image,
                 'thumbnails': thumbnails,
+                'thumbnail_status': uploaded_file.thumbnail_status,
                 'created_at': uploaded_file.created_at.isoformat()
             }
         })
         
     except Exception as e:
+        quota.release_upload(file.size)
         return JsonResponse({'error': f'Upload failed: {str(e)}'}, status=500)
+
+
+def _upload_session_data(session):
+    return {
+        'id': str(session.id),
+        'name': session.original_name,
+        'size': session.total_size,
+        'offset': session.received_bytes,
+        'status': session.status,
+        'chunk_size': settings.UPLOADS_CHUNK_SIZE,
+    }
+
+
+@login_required
+@require_http_methods(['POST'])
+def upload_session_start(request):
+    """Inicia um upload em partes (retomável)
+
+    Como as demais requisições da sessão, exige o token CSRF no cabeçalho
+    X-CSRFToken (a autenticação é pelo cookie de sessão).
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    if not data.get('account') or not data.get('filename') or not data.get('size'):
+        return JsonResponse({'error': 'account, filename and size are required'}, status=400)
+    
+    try:
+        account = Account.objects.get(
+            id=data['account'],
+            memberships__user=request.user,
+            memberships__role__in=['owner', 'admin', 'editor'],
+            memberships__status='active'
+        )
+    except (Account.DoesNotExist, ValueError, ValidationError):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    try:
+        session = ChunkedUploadService.start(
+            account,
+            request.user,
+            data['filename'],
+            data['size'],
+            mime_type=data.get('mime_type'),
+            checksum=data.get('checksum', ''),
+            description=data.get('description', ''),
+            alt_text=data.get('alt_text', ''),
+            is_public=bool(data.get('is_public', False))
+        )
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(_upload_session_data(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_session_chunk(request, session_id):
+    """Consulta o offset (GET) ou envia uma parte a partir de Upload-Offset (PUT)"""
+    session = get_object_or_404(UploadSession, id=session_id, uploaded_by=request.user)
+    
+    if request.method == 'GET':
+        return JsonResponse(_upload_session_data(session))
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset header required'}, status=400)
+    
+    if length <= 0 or length > settings.UPLOADS_CHUNK_SIZE:
+        return JsonResponse(
+            {'error': f'Chunk must have between 1 and {settings.UPLOADS_CHUNK_SIZE} bytes'},
+            status=400
+        )
+    
+    try:
+        session = ChunkedUploadService.write_chunk(session.id, offset, request, length)
+    except UploadOffsetMismatch as e:
+        return JsonResponse({'error': str(e), 'offset': e.expected}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(_upload_session_data(session))
+
+
+@login_required
+@require_http_methods(['POST'])
+def upload_session_finalize(request, session_id):
+    """Finaliza o upload em partes, criando o arquivo e cobrando a quota"""
+    session = get_object_or_404(UploadSession, id=session_id, uploaded_by=request.user)
+    
+    try:
+        uploaded_file = ChunkedUploadService.finalize(session.id)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'file': {
+            'id': str(uploaded_file.id),
+            'name': uploaded_file.original_name,
+            'size': uploaded_file.file_size,
+            'size_human': uploaded_file.file_size_human,
+            'type': uploaded_file.file_type,
+            'url': reverse('uploads:file_detail', args=[uploaded_file.id]),
+            'is_image': uploaded_file.is_image,
+            'thumbnail_status': uploaded_file.thumbnail_status,
+            'created_at': uploaded_file.created_at.isoformat()
+        }
+    })
@@ -22,6 +22,7 @@ from datetime import datetime
 from collections import defaultdict
 from permissions.models import Permission, Role, UserRole
 from permissions.decorators import user_panel_required
+from accounts.tenant import get_current_tenant
 from content.models import Content, Category, Tag
 from site_management.models import Item, PlanType, TemplateCategory, SiteCategory, Service, SocialNetwork, CTA, BlogPost
 from .forms import (
@@ -1536,13 +1537,9 @@ def settings(request):
     
     # Buscar membership ativo do usuário
     try:
-        account_membership = AccountMembership.objects.filter(
-            user=user,
-            status='active'
-        ).select_related('account').first()
-        
-        if account_membership:
-            can_manage_account = account_membership.role in ['owner', 'admin']
+        tenant = get_current_tenant(request)
+        account_membership = tenant.membership
+        can_manage_account = tenant.can_manage_account
     except Exception:
         pass
     
@@ -1620,36 +1617,16 @@ def members_list(request):
 @user_panel_required
 def invite_member(request):
     """Convidar novo membro para a conta"""
-    user = request.user
-    
     # Buscar conta ativa do usuário
-    current_account = None
-    try:
-        user_membership = AccountMembership.objects.filter(
-            user=user,
-            status='active'
-        ).select_related('account').first()
-        
-        if user_membership:
-            current_account = user_membership.account
-    except Exception:
-        pass
+    tenant = get_current_tenant(request)
+    current_account = tenant.account
     
     if not current_account:
         messages.error(request, 'Você precisa estar em uma conta para convidar membros.')
         return redirect('user_panel:members_list')
     
     # Verificar se o usuário pode convidar membros
-    try:
-        user_membership = AccountMembership.objects.get(
-            account=current_account,
-            user=user,
-            status='active'
-        )
-        if user_membership.role not in ['owner', 'admin']:
-            messages.error(request, 'Você não tem permissão para convidar membros.')
-            return redirect('user_panel:members_list')
-    except AccountMembership.DoesNotExist:
+    if not tenant.can_manage_account:
         messages.error(request, 'Você não tem permissão para convidar membros.')
         return redirect('user_panel:members_list')
     
@@ -1848,12 +1825,7 @@ def bio_create(request):
         if form.is_valid():
             # Verificar se o usuário tem permissão no site selecionado
             site = form.cleaned_data['site']
-            user_has_permission = AccountMembership.objects.filter(
-                user=request.user,
-                account=site.account,
-                status='active',
-                role__in=['owner', 'admin']
-            ).exists()
+            user_has_permission = get_current_tenant(request).has_role(site.account_id)
             
             if not user_has_permission:
                 messages.error(request, 'Você não tem permissão para criar bio neste site.')
@@ -1887,12 +1859,7 @@ def bio_edit(request, bio_id):
     bio = get_object_or_404(SiteBio, id=bio_id)
     
     # Verificar permissão do usuário
-    user_has_permission = AccountMembership.objects.filter(
-        user=request.user,
-        account=bio.site.account,
-        status='active',
-        role__in=['owner', 'admin']
-    ).exists()
+    user_has_permission = get_current_tenant(request).has_role(bio.site.account_id)
     
     if not user_has_permission:
         messages.error(request, 'Você não tem permissão para editar esta bio.')
@@ -1925,12 +1892,7 @@ def bio_delete(request, bio_id):
     bio = get_object_or_404(SiteBio, id=bio_id)
     
     # Verificar permissão do usuário
-    user_has_permission = AccountMembership.objects.filter(
-        user=request.user,
-        account=bio.site.account,
-        status='active',
-        role__in=['owner', 'admin']
-    ).exists()
+    user_has_permission = get_current_tenant(request).has_role(bio.site.account_id)
     
     if not user_has_permission:
         messages.error(request, 'Você não tem permissão para deletar esta bio.')
@@ -138,16 +138,38 @@ class User(AbstractUser):
         """Retorna o primeiro nome do usuário"""
         return self.first_name or self.username
     
+    # Nome do avatar carregado do banco (None para instâncias novas)
+    _loaded_avatar_name = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'avatar' in field_names:
+            instance._loaded_avatar_name = values[field_names.index('avatar')] or None
+        else:
+            instance._loaded_avatar_name = models.DEFERRED
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Override do save para redimensionar avatar"""
+        """Override do save para redimensionar avatar (somente quando ele muda)"""
         super().save(*args, **kwargs)
         
+        avatar_name = self.avatar.name if self.avatar else None
+        if self._loaded_avatar_name is models.DEFERRED or avatar_name == self._loaded_avatar_name:
+            return
+        self._loaded_avatar_name = avatar_name
+        
         if self.avatar:
-            img = Image.open(self.avatar.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.avatar.path)
+            self._resize_avatar()
+    
+    def _resize_avatar(self, max_size=(300, 300)):
+        """Reduz o avatar recém-enviado; o cabeçalho basta para saber se é preciso"""
+        img = Image.open(self.avatar.path)
+        if img.height > max_size[1] or img.width > max_size[0]:
+            if img.format == 'JPEG':
+                img.draft(img.mode, max_size)
+            img.thumbnail(max_size)
+            img.save(self.avatar.path)
     
     def soft_delete(self):
         """Realiza soft delete do usuário"""
@@ -1,3 +1,48 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AvatarResizeTests(TestCase):
+	@classmethod
+	def tearDownClass(cls):
+		super().tearDownClass()
+		shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+	def make_avatar(self, size=(800, 600)):
+		image_io = io.BytesIO()
+		Image.new('RGB', size, color='red').save(image_io, format='JPEG')
+		return SimpleUploadedFile('avatar.jpg', image_io.getvalue(), content_type='image/jpeg')
+
+	def test_new_avatar_is_resized(self):
+		user = get_user_model().objects.create_user(
+			email='avatar@test.com', password='test123', username='avatar', avatar=self.make_avatar()
+		)
+		with Image.open(user.avatar.path) as image:
+			self.assertEqual(image.size, (300, 225))
+
+	def test_unchanged_avatar_is_not_reprocessed(self):
+		User = get_user_model()
+		user = User.objects.create_user(
+			email='avatar@test.com', password='test123', username='avatar', avatar=self.make_avatar()
+		)
+		user = User.objects.get(pk=user.pk)
+
+		with mock.patch.object(User, '_resize_avatar') as resize:
+			user.first_name = 'Novo'
+			user.save()
+			resize.assert_not_called()
+
+			user.avatar = self.make_avatar()
+			user.save()
+			resize.assert_called_once()